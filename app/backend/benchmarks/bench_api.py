@@ -0,0 +1,338 @@
+"""
+APIの負荷ベンチマーク
+
+/api/chat、/api/generate、/api/application/generate に固定の同時実行数でリクエストを送り、
+エンドポイントごとのスループットとレイテンシ（p50/p95/p99）を計測する。
+結果はJSONファイルに保存し、--compare で以前の結果と比較できる。
+
+--url を省略した場合は AGENTS_BACKEND=fake（benchmarks.fake_agents）でアプリケーションを
+このプロセス内のuvicornで起動し、Azureのクォータを使わずに計測する。
+
+実行方法（app/backend から）:
+    python -m benchmarks.bench_api --concurrency 16 --requests 200 --time-scale 0.1 --label baseline
+    python -m benchmarks.bench_api --url http://localhost:8000 --endpoints chat --compare benchmarks/results/xxx.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import aiohttp
+
+# 計測結果の保存先の既定値
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# 比較時に表示する指標（指標名, 値が小さいほど良いか）
+COMPARED_METRICS: List[Tuple[str, bool]] = [
+    ("throughput_rps", False),
+    ("p50_ms", True),
+    ("p95_ms", True),
+    ("p99_ms", True),
+    ("error_rate", True),
+]
+
+SUBSIDY_INFO: Dict[str, Any] = {
+    "title": "ものづくり・商業・サービス生産性向上促進補助金",
+    "acceptance_start_datetime": "2025-04-01T00:00:00.000Z",
+    "acceptance_end_datetime": "2025-06-30T17:00:00.000Z",
+    "target_area_search": "全国",
+    "subsidy_max_limit": 12500000,
+    "target_number_of_employees": "従業員の制約なし",
+}
+
+def chat_request(index: int, cacheable: bool) -> Tuple[str, Dict[str, Any]]:
+    """/api/chat のリクエストを作成する"""
+    message = "東京都の中小企業が使えるIT導入の補助金を教えてください"
+    if not cacheable:
+        message = f"{message}（{index}）"
+    return "/api/chat", {"message": message, "bypass_cache": not cacheable}
+
+def generate_request(index: int, cacheable: bool) -> Tuple[str, Dict[str, Any]]:
+    """/api/generate のリクエストを作成する"""
+    prompt = "補助金申請書の事業計画の書き方を3行で説明してください"
+    if not cacheable:
+        prompt = f"{prompt}（{index}）"
+    return "/api/generate", {"prompt": prompt}
+
+def application_request(index: int, cacheable: bool) -> Tuple[str, Dict[str, Any]]:
+    """/api/application/generate のリクエストを作成する"""
+    description = "製造業向けの生産管理クラウドサービスの開発"
+    if not cacheable:
+        description = f"{description}（{index}）"
+    return "/api/application/generate", {
+        "subsidy_info": SUBSIDY_INFO,
+        "business_description": description,
+        "bypass_cache": not cacheable,
+    }
+
+# エンドポイント名とリクエストの作成関数
+ENDPOINTS: Dict[str, Callable[[int, bool], Tuple[str, Dict[str, Any]]]] = {
+    "chat": chat_request,
+    "generate": generate_request,
+    "application": application_request,
+}
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    昇順に並べた値のパーセンタイルを線形補間で求める
+
+    Args:
+        sorted_values: 昇順に並べた値
+        q: パーセンタイル（0〜100）
+
+    Returns:
+        パーセンタイルの値（値がない場合は0）
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """
+    1つのエンドポイントの計測結果を集計する
+
+    Args:
+        latencies: 成功・失敗を含む各リクエストのレイテンシ（秒）
+        errors: 失敗したリクエスト数
+        elapsed: 計測にかかった時間（秒）
+
+    Returns:
+        リクエスト数・エラー率・スループット・レイテンシの統計（ミリ秒）
+    """
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": errors / count if count else 0.0,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": count / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(values) / count * 1000 if count else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """
+    以前の結果と今回の結果を比較した行を作成する
+
+    Args:
+        baseline: 以前の結果（save_results で保存した内容）
+        current: 今回の結果
+
+    Returns:
+        エンドポイント・指標ごとの比較の行
+    """
+    lines = []
+    for endpoint, stats in current["results"].items():
+        before = baseline["results"].get(endpoint)
+        if before is None:
+            continue
+        for metric, lower_is_better in COMPARED_METRICS:
+            old, new = before[metric], stats[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            improved = (change < 0) == lower_is_better if change else None
+            verdict = "" if improved is None else (" better" if improved else " worse")
+            lines.append(f"{endpoint:12s} {metric:15s} {old:10.2f} -> {new:10.2f} ({change:+.1f}%){verdict}")
+    return lines
+
+async def run_endpoint(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    endpoint: str,
+    requests: int,
+    concurrency: int,
+    cacheable: bool,
+    warmup: int
+) -> Dict[str, float]:
+    """
+    1つのエンドポイントに固定の同時実行数でリクエストを送り、結果を集計する
+
+    HTTPのエラーに加え、200で返るエラー（"error" を含む応答や success が false の応答）も失敗として数える。
+
+    Args:
+        session: HTTPセッション
+        base_url: アプリケーションのURL
+        endpoint: エンドポイント名（ENDPOINTS のキー）
+        requests: 計測するリクエスト数
+        concurrency: 同時に送るリクエスト数
+        cacheable: Falseの場合はリクエストごとに内容を変え、キャッシュを使用しない
+        warmup: 計測前に送るリクエスト数
+
+    Returns:
+        集計した計測結果
+    """
+    build = ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def send(index: int) -> bool:
+        path, payload = build(index, cacheable)
+        async with session.post(f"{base_url}{path}", json=payload) as response:
+            body = await response.read()
+        if response.status >= 400:
+            return False
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return False
+        return not (isinstance(data, dict) and ("error" in data or data.get("success") is False))
+
+    async def worker(total: int, record: bool, offset: int = 0) -> None:
+        nonlocal next_index, errors
+        while next_index < total:
+            index = offset + next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                ok = await send(index)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            if record:
+                latencies.append(time.perf_counter() - started)
+                errors += 0 if ok else 1
+
+    if warmup:
+        # ウォームアップのリクエストは計測するリクエストと内容を変え、キャッシュに載せない
+        await asyncio.gather(*[worker(warmup, False, requests) for _ in range(min(concurrency, warmup))])
+    next_index = 0
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(requests, True) for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+async def wait_ready(base_url: str, timeout: float) -> None:
+    """
+    アプリケーションの起動時のウォームアップが完了する（/api/ready が503以外を返す）まで待つ
+
+    Args:
+        base_url: アプリケーションのURL
+        timeout: 待つ最大秒数
+
+    Raises:
+        TimeoutError: timeout 秒以内に準備が完了しなかった場合
+    """
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{base_url}/api/ready") as response:
+                    if response.status != 503:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.perf_counter() >= deadline:
+                raise TimeoutError(f"Application was not ready within {timeout} seconds")
+            await asyncio.sleep(0.1)
+
+async def run_benchmark(args: argparse.Namespace, base_url: str) -> Dict[str, Dict[str, float]]:
+    """指定したエンドポイントを順に計測する"""
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    results = {}
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        for endpoint in args.endpoints:
+            results[endpoint] = await run_endpoint(
+                session, base_url, endpoint, args.requests, args.concurrency, args.cacheable, args.warmup
+            )
+            stats = results[endpoint]
+            print(
+                f"{endpoint:12s} requests={stats['requests']} errors={stats['errors']} "
+                f"throughput={stats['throughput_rps']:.1f} req/s p50={stats['p50_ms']:.1f} ms "
+                f"p95={stats['p95_ms']:.1f} ms p99={stats['p99_ms']:.1f} ms"
+            )
+    return results
+
+async def run_in_process(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """フェイクのエージェントでアプリケーションをこのプロセス内で起動して計測する"""
+    os.environ["AGENTS_BACKEND"] = "fake"
+    os.environ["FAKE_AGENTS_SEED"] = str(args.seed)
+    os.environ["FAKE_AGENTS_TIME_SCALE"] = str(args.time_scale)
+    os.environ["FAKE_AGENTS_FAILURE_RATE"] = str(args.failure_rate)
+
+    import uvicorn
+
+    from startup import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    try:
+        await wait_ready(f"http://127.0.0.1:{port}", args.timeout)
+        return await run_benchmark(args, f"http://127.0.0.1:{port}")
+    finally:
+        server.should_exit = True
+        await serving
+
+def save_results(output_dir: str, label: str, config: Dict[str, Any], results: Dict[str, Any]) -> str:
+    """
+    計測結果をJSONファイルに保存する
+
+    Args:
+        output_dir: 保存先のディレクトリ
+        label: 結果のラベル（ファイル名に含める）
+        config: 計測の設定
+        results: エンドポイントごとの計測結果
+
+    Returns:
+        保存したファイルのパス
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(output_dir, f"{timestamp}-{label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"label": label, "timestamp": timestamp, "config": config, "results": results}, f, indent=2)
+    return path
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="計測するアプリケーションのURL（省略時はフェイクのエージェントでプロセス内に起動する）")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS), help="計測するエンドポイント")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に送るリクエスト数")
+    parser.add_argument("--requests", type=int, default=100, help="エンドポイントごとに計測するリクエスト数")
+    parser.add_argument("--warmup", type=int, default=5, help="計測前に送るリクエスト数")
+    parser.add_argument("--cacheable", action="store_true", help="同じ内容のリクエストを送り、キャッシュを使用させる")
+    parser.add_argument("--timeout", type=float, default=300, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="フェイクのエージェントの乱数のシード")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="フェイクのエージェントの所要時間に掛ける倍率")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="フェイクのエージェントの各操作の失敗率")
+    parser.add_argument("--label", default="run", help="保存する結果のラベル")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="結果の保存先")
+    parser.add_argument("--compare", help="比較する以前の結果ファイル")
+    args = parser.parse_args()
+
+    if args.url:
+        base_url = args.url.rstrip("/")
+        asyncio.run(wait_ready(base_url, args.timeout))
+        results = asyncio.run(run_benchmark(args, base_url))
+    else:
+        results = asyncio.run(run_in_process(args))
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output_dir", "compare", "label")}
+    path = save_results(args.output_dir, args.label, config, results)
+    print(f"saved: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for line in compare(baseline, {"results": results}):
+            print(line)
+
+if __name__ == "__main__":
+    main()
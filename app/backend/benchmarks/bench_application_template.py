@@ -0,0 +1,101 @@
+"""
+申請書テンプレート描画のマイクロベンチマーク
+
+従来の方式（f-stringの連結で基本テンプレートを作成し、セクションごとに str.replace で置き換える）と、
+事前コンパイル済みテンプレートを1回で描画する方式を、一括生成の規模で比較する。
+
+実行方法（app/backend から）:
+    python -m benchmarks.bench_application_template --batch 500 --repeat 5
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+from tools.common_utils import (
+    APPLICATION_SECTIONS,
+    format_currency_ja,
+    format_date_ja,
+    render_application_text,
+)
+
+def legacy_application_text(subsidy_info: Dict[str, Any]) -> str:
+    """従来の方式で基本テンプレートを生成する"""
+    title = subsidy_info.get("title", "不明な補助金")
+    start_date = format_date_ja(subsidy_info.get("acceptance_start_datetime"))
+    end_date = format_date_ja(subsidy_info.get("acceptance_end_datetime"))
+    if start_date != "情報なし" and end_date != "情報なし" and start_date != "無効な日付" and end_date != "無効な日付":
+        application_period = f"{start_date}～{end_date}"
+    else:
+        application_period = "情報なし"
+    max_limit = subsidy_info.get("subsidy_max_limit")
+    max_limit_str = format_currency_ja(max_limit) if max_limit is not None else "情報なし"
+    text = f"【申請書類：{title}】\n\n"
+    text += "■基本情報\n"
+    text += f"申請期間：{application_period}\n"
+    text += f"対象地域：{subsidy_info.get('target_area_search', '情報なし')}\n"
+    text += f"補助上限額：{max_limit_str}\n"
+    employee_limit = subsidy_info.get("target_number_of_employees", "情報なし")
+    if employee_limit != "情報なし":
+        text += f"従業員数制限：{employee_limit}\n"
+    for _, heading, placeholder in APPLICATION_SECTIONS:
+        text += f"\n{heading}\n{placeholder}\n"
+    return text
+
+def legacy_enhanced(subsidy_info: Dict[str, Any], sections: Dict[str, str]) -> str:
+    """従来の方式でAI拡張テンプレートを生成する"""
+    text = legacy_application_text(subsidy_info)
+    for key, heading, placeholder in APPLICATION_SECTIONS:
+        text = text.replace(f"{heading}\n{placeholder}", f"{heading}\n{sections[key]}")
+    return text
+
+def compiled_enhanced(subsidy_info: Dict[str, Any], sections: Dict[str, str]) -> str:
+    """事前コンパイル済みテンプレートでAI拡張テンプレートを生成する"""
+    return render_application_text(subsidy_info, sections)
+
+def build_batch(size: int) -> List[Dict[str, Any]]:
+    """ベンチマーク用の補助金情報とセクション内容の組を作成する"""
+    batch = []
+    for i in range(size):
+        subsidy_info = {
+            "title": f"テスト補助金{i}",
+            "acceptance_start_datetime": f"2024-{i % 12 + 1:02d}-01T00:00:00Z",
+            "acceptance_end_datetime": f"2025-{i % 12 + 1:02d}-28T23:59:59Z",
+            "target_area_search": "全国",
+            "subsidy_max_limit": 1000000 * (i % 50 + 1),
+            "target_number_of_employees": "300人以下",
+        }
+        sections = {key: f"{heading}に関する生成内容 {i}。" * 20 for key, heading, _ in APPLICATION_SECTIONS}
+        batch.append({"subsidy_info": subsidy_info, "sections": sections})
+    return batch
+
+def measure(render: Callable[[Dict[str, Any], Dict[str, str]], str], batch: List[Dict[str, Any]], repeat: int) -> float:
+    """バッチ全体の描画にかかった最短時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in batch:
+            render(item["subsidy_info"], item["sections"])
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=500, help="1回に描画するテンプレート数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数（最短時間を採用）")
+    args = parser.parse_args()
+
+    batch = build_batch(args.batch)
+    for item in batch:
+        if legacy_enhanced(item["subsidy_info"], item["sections"]) != compiled_enhanced(item["subsidy_info"], item["sections"]):
+            raise SystemExit("Rendered output differs from the legacy implementation")
+
+    legacy = measure(legacy_enhanced, batch, args.repeat)
+    compiled = measure(compiled_enhanced, batch, args.repeat)
+    print(f"batch={args.batch} repeat={args.repeat}")
+    print(f"legacy (str.replace): {legacy * 1000:.2f} ms ({legacy / args.batch * 1e6:.1f} us/doc)")
+    print(f"compiled (one pass):  {compiled * 1000:.2f} ms ({compiled / args.batch * 1e6:.1f} us/doc)")
+    print(f"speedup: {legacy / compiled:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+補助金情報のフォーマットのマイクロベンチマーク
+
+1件ずつ format_date_ja / format_currency_ja を呼び出す方式と、format_subsidies_ja でまとめて
+フォーマットする方式を、jgrants の検索結果程度の件数で比較する。
+
+実行方法（app/backend から）:
+    python -m benchmarks.bench_subsidy_formatting --records 5000 --repeat 5
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+from tools.common_utils import format_currency_ja, format_date_ja, format_subsidies_ja
+
+def format_one_by_one(records: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """1件ずつフォーマットする"""
+    formatted: Dict[str, List[str]] = {"acceptance_start": [], "acceptance_end": [], "max_limit": []}
+    for record in records:
+        formatted["acceptance_start"].append(format_date_ja(record.get("acceptance_start_datetime")))
+        formatted["acceptance_end"].append(format_date_ja(record.get("acceptance_end_datetime")))
+        max_limit = record.get("subsidy_max_limit")
+        formatted["max_limit"].append(format_currency_ja(max_limit) if max_limit is not None else "情報なし")
+    return formatted
+
+def build_records(size: int) -> List[Dict[str, Any]]:
+    """受付期間と上限額が重複する検索結果を模した補助金情報を作成する"""
+    return [
+        {
+            "title": f"テスト補助金{i}",
+            "acceptance_start_datetime": f"2024-{i % 12 + 1:02d}-01T00:00:00.000Z",
+            "acceptance_end_datetime": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}T17:00:00.000Z" if i % 10 else None,
+            "subsidy_max_limit": [1000000, 5000000, 10000000, 30000000, None][i % 5],
+        }
+        for i in range(size)
+    ]
+
+def measure(func: Callable[[List[Dict[str, Any]]], Any], records: List[Dict[str, Any]], repeat: int) -> float:
+    """全件のフォーマットにかかった最短時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(records)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000, help="フォーマットする補助金情報の件数")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数（最短時間を採用）")
+    args = parser.parse_args()
+
+    records = build_records(args.records)
+    expected = format_one_by_one(records)
+    bulk = format_subsidies_ja(records)
+    if any(bulk[column] != values for column, values in expected.items()):
+        raise SystemExit("Bulk formatting differs from the scalar functions")
+
+    scalar = measure(format_one_by_one, records, args.repeat)
+    vectorized = measure(format_subsidies_ja, records, args.repeat)
+    print(f"records={args.records} repeat={args.repeat}")
+    print(f"one by one: {scalar * 1000:.2f} ms")
+    print(f"bulk:       {vectorized * 1000:.2f} ms")
+    print(f"speedup: {scalar / vectorized:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Azure AI Agent Service の代替となるローカルのフェイク
+
+AssistantManagerService などが使用する project_client.agents の操作（create_agent、create_thread、
+create_message、create_and_process_run、list_messages と、実行のポーリング・スレッド削除に使う操作）を
+プロセス内で実装する。各操作の所要時間は対数正規分布から、失敗は指定した確率で発生させる。
+乱数はシードを固定するため、同じ設定であれば同じ順序の呼び出しに同じ所要時間と失敗を返す。
+
+Azureのクォータを使わずに負荷試験や性能の回帰確認を行うためのもので、本番では使用しない。
+startup.py は環境変数 AGENTS_BACKEND=fake の場合にこのクライアントを使用する。
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from azure.ai.projects.models import (
+    Agent,
+    AgentThread,
+    MessageRole,
+    MessageTextContent,
+    MessageTextDetails,
+    OpenAIPageableListOfThreadMessage,
+    RunCompletionUsage,
+    RunStatus,
+    ThreadMessage,
+    ThreadRun,
+)
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+from tools.common_utils import APPLICATION_SECTIONS
+
+class Latency:
+    """
+    操作の所要時間の分布（中央値と対数の標準偏差で指定する対数正規分布）
+
+    sigma が 0 の場合は常に中央値を返す。
+    """
+
+    def __init__(self, median_seconds: float, sigma: float = 0.0):
+        """
+        初期化
+
+        Args:
+            median_seconds: 所要時間の中央値（秒）
+            sigma: 所要時間の対数の標準偏差（大きいほど裾が長い）
+        """
+        self.median_seconds = median_seconds
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, text: str) -> "Latency":
+        """
+        "中央値[:sigma]" 形式の文字列から分布を作成する（例: "0.05:0.3"）
+
+        Args:
+            text: 分布を表す文字列
+
+        Returns:
+            所要時間の分布
+        """
+        median, _, sigma = text.partition(":")
+        return cls(float(median), float(sigma) if sigma else 0.0)
+
+    def sample(self, rng: random.Random) -> float:
+        """
+        所要時間を1つ取り出す
+
+        Args:
+            rng: 乱数生成器
+
+        Returns:
+            所要時間（秒）
+        """
+        if self.sigma <= 0:
+            return self.median_seconds
+        return self.median_seconds * math.exp(rng.gauss(0, self.sigma))
+
+# 操作ごとの所要時間の既定値（"run" はエージェントの実行が完了するまでの時間）
+DEFAULT_LATENCIES: Dict[str, Latency] = {
+    "create_agent": Latency(0.3, 0.3),
+    "get_agent": Latency(0.05, 0.3),
+    "create_thread": Latency(0.08, 0.3),
+    "delete_thread": Latency(0.08, 0.3),
+    "create_message": Latency(0.08, 0.3),
+    "create_run": Latency(0.1, 0.3),
+    "get_run": Latency(0.05, 0.3),
+    "cancel_run": Latency(0.05, 0.3),
+    "submit_tool_outputs_to_run": Latency(0.1, 0.3),
+    "run": Latency(2.0, 0.5),
+    "list_messages": Latency(0.06, 0.3),
+}
+
+def default_responder(prompt: str) -> str:
+    """
+    プロンプトに対するエージェントの応答を作成する
+
+    申請書の内容の生成（JSONでの返答を求めるプロンプト）にはセクションごとの内容をJSONで返す。
+
+    Args:
+        prompt: ユーザーメッセージ
+
+    Returns:
+        応答テキスト
+    """
+    if "JSONフォーマット" in prompt:
+        sections = {key: f"{heading.strip('■：')}の内容です。" for key, heading, _ in APPLICATION_SECTIONS}
+        return json.dumps(sections, ensure_ascii=False)
+    return f"補助金に関するお問い合わせへの回答です（{len(prompt)}文字のメッセージを受け付けました）。"
+
+class FakeAgentsOperations:
+    """project_client.agents の代替（非同期）"""
+
+    def __init__(
+        self,
+        latencies: Optional[Dict[str, Latency]] = None,
+        failure_rates: Optional[Dict[str, float]] = None,
+        seed: int = 0,
+        time_scale: float = 1.0,
+        responder: Callable[[str], str] = default_responder
+    ):
+        """
+        初期化
+
+        Args:
+            latencies: 操作ごとの所要時間の分布（指定した操作のみ既定値を置き換える）
+            failure_rates: 操作ごとの失敗率（0〜1）。"run" はエージェントの実行が失敗する確率
+            seed: 乱数のシード
+            time_scale: すべての所要時間に掛ける倍率（0 の場合は待たない）
+            responder: ユーザーメッセージから応答テキストを作成する関数
+        """
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.failure_rates = failure_rates or {}
+        self.time_scale = time_scale
+        self.responder = responder
+        self.calls: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._agents: Dict[str, Agent] = {}
+        self._threads: Dict[str, List[ThreadMessage]] = {}
+        self._runs: Dict[str, ThreadRun] = {}
+        self._run_completions: Dict[str, float] = {}
+
+    async def create_agent(self, model: str, name: Optional[str] = None, instructions: Optional[str] = None,
+                           tools: Optional[List[Any]] = None, **kwargs: Any) -> Agent:
+        """エージェントを作成する"""
+        await self._operate("create_agent")
+        agent = Agent(
+            id=self._new_id("asst"), created_at=int(time.time()), name=name, description=kwargs.get("description"),
+            model=model, instructions=instructions, tools=list(tools or []), tool_resources=None,
+            temperature=None, top_p=None, response_format=None, metadata={}
+        )
+        self._agents[agent.id] = agent
+        return agent
+
+    async def get_agent(self, agent_id: str, **kwargs: Any) -> Agent:
+        """エージェントを取得する"""
+        await self._operate("get_agent")
+        agent = self._agents.get(agent_id)
+        if agent is None:
+            raise ResourceNotFoundError(f"No agent found with id '{agent_id}'.")
+        return agent
+
+    async def create_thread(self, **kwargs: Any) -> AgentThread:
+        """スレッドを作成する"""
+        await self._operate("create_thread")
+        thread = AgentThread(id=self._new_id("thread"), created_at=int(time.time()), tool_resources=None, metadata={})
+        self._threads[thread.id] = []
+        return thread
+
+    async def delete_thread(self, thread_id: str, **kwargs: Any) -> None:
+        """スレッドを削除する"""
+        await self._operate("delete_thread")
+        self._get_thread(thread_id)
+        del self._threads[thread_id]
+
+    async def create_message(self, thread_id: str, role: str, content: str, **kwargs: Any) -> ThreadMessage:
+        """スレッドにメッセージを投稿する"""
+        await self._operate("create_message")
+        message = self._new_message(thread_id, MessageRole.USER, content)
+        self._get_thread(thread_id).append(message)
+        return message
+
+    async def create_run(self, thread_id: str, *, agent_id: str, **kwargs: Any) -> ThreadRun:
+        """実行を作成する（完了は get_run で確認する）"""
+        await self._operate("create_run")
+        return self._start_run(thread_id, agent_id)
+
+    async def get_run(self, thread_id: str, run_id: str, **kwargs: Any) -> ThreadRun:
+        """実行を取得する（完了する時刻を過ぎていれば完了させる）"""
+        await self._operate("get_run")
+        run = self._get_run(run_id)
+        if run.status in (RunStatus.QUEUED, RunStatus.IN_PROGRESS):
+            if time.monotonic() >= self._run_completions[run_id]:
+                self._finish_run(run)
+            else:
+                run.status = RunStatus.IN_PROGRESS
+        return run
+
+    async def cancel_run(self, thread_id: str, run_id: str, **kwargs: Any) -> ThreadRun:
+        """実行をキャンセルする"""
+        await self._operate("cancel_run")
+        run = self._get_run(run_id)
+        run.status = RunStatus.CANCELLED
+        return run
+
+    async def submit_tool_outputs_to_run(self, thread_id: str, run_id: str, **kwargs: Any) -> ThreadRun:
+        """ツールの出力を送信する（出力は応答に反映しない）"""
+        await self._operate("submit_tool_outputs_to_run")
+        return self._get_run(run_id)
+
+    async def create_and_process_run(self, thread_id: str, *, agent_id: str, **kwargs: Any) -> ThreadRun:
+        """実行を作成し、完了するまで待つ"""
+        await self._operate("create_run")
+        run = self._start_run(thread_id, agent_id)
+        await self._sleep(self._run_completions[run.id] - time.monotonic())
+        self._finish_run(run)
+        return run
+
+    async def list_messages(self, thread_id: str, *, run_id: Optional[str] = None, limit: Optional[int] = None,
+                            order: Optional[str] = None, **kwargs: Any) -> OpenAIPageableListOfThreadMessage:
+        """スレッドのメッセージ一覧を取得する"""
+        await self._operate("list_messages")
+        messages = [m for m in self._get_thread(thread_id) if run_id is None or m.run_id == run_id]
+        if str(order or "desc").lower().endswith("desc"):
+            messages.reverse()
+        page = messages[:limit] if limit else messages
+        return OpenAIPageableListOfThreadMessage(
+            data=page,
+            first_id=page[0].id if page else None,
+            last_id=page[-1].id if page else None,
+            has_more=len(page) < len(messages)
+        )
+
+    def _start_run(self, thread_id: str, agent_id: str) -> ThreadRun:
+        """実行を作成し、完了する時刻を決める"""
+        self._get_thread(thread_id)
+        run = ThreadRun(
+            id=self._new_id("run"), thread_id=thread_id, agent_id=agent_id, status=RunStatus.QUEUED,
+            model=self._agents[agent_id].model if agent_id in self._agents else "", instructions="", tools=[],
+            created_at=int(time.time()), expires_at=None, started_at=None, completed_at=None, cancelled_at=None,
+            failed_at=None, required_action=None, last_error=None, incomplete_details=None, usage=None,
+            temperature=None, top_p=None, max_prompt_tokens=None, max_completion_tokens=None,
+            truncation_strategy=None, tool_choice=None, response_format=None, parallel_tool_calls=False, metadata={}
+        )
+        self._runs[run.id] = run
+        self._run_completions[run.id] = time.monotonic() + self.latencies["run"].sample(self._rng) * self.time_scale
+        return run
+
+    def _finish_run(self, run: ThreadRun) -> None:
+        """実行を完了（または失敗）させ、完了した場合は応答メッセージを追加する"""
+        if self._rng.random() < self.failure_rates.get("run", 0.0):
+            run.status = RunStatus.FAILED
+            run.last_error = {"code": "server_error", "message": "Injected run failure"}
+            return
+        messages = self._get_thread(run.thread_id)
+        prompt = next((m.content[0].text.value for m in reversed(messages) if m.role == MessageRole.USER), "")
+        response = self.responder(prompt)
+        message = self._new_message(run.thread_id, MessageRole.AGENT, response, run)
+        messages.append(message)
+        run.status = RunStatus.COMPLETED
+        run.usage = RunCompletionUsage(
+            prompt_tokens=len(prompt), completion_tokens=len(response), total_tokens=len(prompt) + len(response)
+        )
+
+    def _new_message(self, thread_id: str, role: str, text: str, run: Optional[ThreadRun] = None) -> ThreadMessage:
+        """スレッドのメッセージを作成する"""
+        return ThreadMessage(
+            id=self._new_id("msg"), created_at=int(time.time()), thread_id=thread_id, status="completed",
+            incomplete_details=None, completed_at=None, incomplete_at=None, role=role,
+            content=[MessageTextContent(text=MessageTextDetails(value=text, annotations=[]))],
+            agent_id=run.agent_id if run is not None else None, run_id=run.id if run is not None else None,
+            attachments=None, metadata=None
+        )
+
+    async def _operate(self, operation: str) -> None:
+        """操作の所要時間だけ待ち、失敗率に従って例外を送出する"""
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        await self._sleep(self.latencies[operation].sample(self._rng) * self.time_scale)
+        if self._rng.random() < self.failure_rates.get(operation, 0.0):
+            raise HttpResponseError(message=f"Injected failure: {operation}")
+
+    async def _sleep(self, seconds: float) -> None:
+        """指定した秒数だけイベントループを解放して待つ"""
+        await asyncio.sleep(max(seconds, 0))
+
+    def _new_id(self, prefix: str) -> str:
+        """IDを採番する"""
+        return f"{prefix}_{next(self._ids):08d}"
+
+    def _get_thread(self, thread_id: str) -> List[ThreadMessage]:
+        """スレッドのメッセージ一覧を取得する"""
+        messages = self._threads.get(thread_id)
+        if messages is None:
+            raise ResourceNotFoundError(f"No thread found with id '{thread_id}'.")
+        return messages
+
+    def _get_run(self, run_id: str) -> ThreadRun:
+        """実行を取得する"""
+        run = self._runs.get(run_id)
+        if run is None:
+            raise ResourceNotFoundError(f"No run found with id '{run_id}'.")
+        return run
+
+class FakeProjectClient:
+    """AIProjectClient（azure.ai.projects.aio）の代替"""
+
+    def __init__(self, **kwargs: Any):
+        """
+        初期化
+
+        Args:
+            **kwargs: FakeAgentsOperations に渡す引数
+        """
+        self.agents = FakeAgentsOperations(**kwargs)
+
+    async def close(self) -> None:
+        """クライアントを閉じる（何もしない）"""
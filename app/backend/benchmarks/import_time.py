@@ -0,0 +1,194 @@
+"""
+バックエンドの読み込み時間の計測と予算の確認
+
+python -X importtime で起動用のモジュール（startup）を別プロセスで読み込み、読み込み時間の中央値と、
+時間のかかったモジュールの内訳を表示する。読み込み時間が予算を超えた場合や、起動時に読み込まないはずの
+モジュール（未使用のSDKや、使用しないバックエンドのSDK）が読み込まれた場合は終了コード1で終了するため、
+コールドスタートやスケールアウトにかかる時間の悪化をCIで検出できる。
+
+実行方法（app/backend から）:
+    python -m benchmarks.import_time --runs 5
+    python -m benchmarks.import_time --backend azure --budget-ms 1500
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# バックエンドごとの読み込み時間の予算（ミリ秒）
+DEFAULT_BUDGETS_MS = {"fake": 1500, "azure": 2000}
+
+# 起動時に読み込んではいけないモジュール（使用しない、または初めて使用するときに読み込む）
+FORBIDDEN_MODULES = ["autogen_agentchat", "autogen_ext", "openai", "azure.ai.ml", "jsonref"]
+
+# フェイクのバックエンドでは読み込まない、Azureのバックエンドだけが使用するモジュール
+AZURE_ONLY_MODULES = ["azure.identity", "services.project_client"]
+
+# 接続はしないため、形式が正しいダミーの接続文字列を使用する
+DUMMY_CONNECTION_STRING = "eastus.api.azureml.ms;00000000-0000-0000-0000-000000000000;rg;project"
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)\s*$")
+
+@dataclass
+class ImportRecord:
+    """-X importtime が出力したモジュール1件分の読み込み時間"""
+
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def parse_importtime(text: str) -> List[ImportRecord]:
+    """
+    -X importtime の出力を解析する
+
+    Args:
+        text: 標準エラー出力の内容
+
+    Returns:
+        読み込まれた順のモジュールの読み込み時間（ヘッダーや他の出力は無視する）
+    """
+    records: List[ImportRecord] = []
+    for line in text.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append(ImportRecord(module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return records
+
+def forbidden_for(backend: str) -> List[str]:
+    """
+    バックエンドで読み込んではいけないモジュールを取得する
+
+    Args:
+        backend: "fake" または "azure"
+
+    Returns:
+        モジュール名（パッケージを指定した場合はサブモジュールも含む）
+    """
+    return FORBIDDEN_MODULES + (AZURE_ONLY_MODULES if backend == "fake" else [])
+
+def find_forbidden(records: List[ImportRecord], forbidden: List[str]) -> List[str]:
+    """
+    読み込まれたモジュールのうち、読み込んではいけないものを探す
+
+    Args:
+        records: 読み込み時間
+        forbidden: 読み込んではいけないモジュール名
+
+    Returns:
+        読み込まれていた、読み込んではいけないモジュール名
+    """
+    loaded = {record.module for record in records}
+    return [name for name in forbidden if any(module == name or module.startswith(f"{name}.") for module in loaded)]
+
+def measure(module: str, backend: str) -> List[ImportRecord]:
+    """
+    別プロセスでモジュールを読み込み、読み込み時間を計測する
+
+    Args:
+        module: 読み込むモジュール名
+        backend: AGENTS_BACKEND に指定する値
+
+    Returns:
+        読み込み時間
+
+    Raises:
+        RuntimeError: モジュールの読み込みに失敗した場合
+    """
+    env = dict(os.environ, AGENTS_BACKEND=backend, PYTHONDONTWRITEBYTECODE="1")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    if backend == "azure":
+        env.setdefault("PROJECT_CONNECTION_STRING", DUMMY_CONNECTION_STRING)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    records = parse_importtime(completed.stderr)
+    if completed.returncode != 0:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"Failed to import {module}:\n" + "\n".join(errors[-20:]))
+    return records
+
+def total_us(records: List[ImportRecord], module: str) -> int:
+    """
+    モジュールの読み込みにかかった時間（依存するモジュールを含む）を取得する
+
+    Args:
+        records: 読み込み時間
+        module: 読み込んだモジュール名
+
+    Returns:
+        累積の読み込み時間（マイクロ秒）
+    """
+    return next((record.cumulative_us for record in reversed(records) if record.module == module and record.depth == 0), 0)
+
+def top_modules(runs: List[List[ImportRecord]], module: str, limit: int) -> List[ImportRecord]:
+    """
+    時間のかかったモジュールを取得する（複数回の計測の中央値）
+
+    Args:
+        runs: 計測ごとの読み込み時間
+        module: 読み込んだモジュール名（自身は除く）
+        limit: 取得する件数
+
+    Returns:
+        累積の読み込み時間が長い順のモジュール
+    """
+    samples: Dict[str, List[ImportRecord]] = {}
+    for records in runs:
+        for record in records:
+            if record.module != module:
+                samples.setdefault(record.module, []).append(record)
+    merged = [
+        ImportRecord(
+            name,
+            int(statistics.median(record.self_us for record in records)),
+            int(statistics.median(record.cumulative_us for record in records)),
+            min(record.depth for record in records),
+        )
+        for name, records in samples.items()
+    ]
+    merged.sort(key=lambda record: record.cumulative_us, reverse=True)
+    return merged[:limit]
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="startup", help="読み込むモジュール（uvicorn に指定するアプリケーションのモジュール）")
+    parser.add_argument("--backend", choices=sorted(DEFAULT_BUDGETS_MS), default="fake", help="AGENTS_BACKEND に指定する値")
+    parser.add_argument("--runs", type=int, default=5, help="計測の回数（中央値を採用）")
+    parser.add_argument("--budget-ms", type=float, help="読み込み時間の予算（ミリ秒、省略時はバックエンドごとの既定値）")
+    parser.add_argument("--top", type=int, default=15, help="表示する時間のかかったモジュールの件数")
+    args = parser.parse_args(argv)
+
+    budget_ms = args.budget_ms if args.budget_ms is not None else DEFAULT_BUDGETS_MS[args.backend]
+    runs = [measure(args.module, args.backend) for _ in range(args.runs)]
+    median_ms = statistics.median(total_us(records, args.module) for records in runs) / 1000
+
+    print(f"module={args.module} backend={args.backend} runs={args.runs}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for record in top_modules(runs, args.module, args.top):
+        print(f"{record.cumulative_us / 1000:>14.1f} {record.self_us / 1000:>9.1f}  {'  ' * record.depth}{record.module}")
+    print(f"import time: {median_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+
+    failures = []
+    if median_ms > budget_ms:
+        failures.append(f"import time {median_ms:.1f} ms exceeds the budget of {budget_ms:.0f} ms")
+    forbidden = sorted({name for records in runs for name in find_forbidden(records, forbidden_for(args.backend))})
+    if forbidden:
+        failures.append(f"modules that must not be imported at startup were imported: {', '.join(forbidden)}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
-from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from typing import Literal, Dict, Any, Optional
-from models.models import MessageRequest, ApplicationFormRequest, PromptRequest
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from datetime import datetime
+from typing import Literal, Dict, Any, Optional, AsyncIterator
+from models.models import MessageRequest, ApplicationFormRequest, ApplicationBatchRequest, PromptRequest
+from services.admission_controller import LANE_BULK, LANE_INTERACTIVE, AdmissionController, AdmissionRejected, AdmissionTicket
 from services.assistant_manager_service import AssistantManagerService
+from services.job_queue import JOB_FAILED, JobQueue, JobQueueFull
+from services.metrics import Metrics, metrics
+from services.subsidy_catalog import SubsidyCatalog
+from services.warmup import Warmup
 from tools.actions.application_doc_generator_tool import ApplicationFormGenerator
-from startup import assistant_manager_service
+from startup import (
+    admission_controller, application_form_generator, application_job_queue, assistant_manager_service, subsidy_catalog,
+    warmup
+)
+import contextlib
+import json
 import logging
 
 # ロガーの設定
@@ -15,6 +23,102 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def wants_event_stream(http_request: Request) -> bool:
+    """
+    クライアントがServer-Sent Eventsでの応答を要求しているかを判定する。
+    Args:
+        http_request (Request): HTTPリクエスト。
+    
+    Returns:
+        bool: Acceptヘッダーに text/event-stream が含まれる場合はTrue。
+    """
+    return "text/event-stream" in http_request.headers.get("accept", "")
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    アドミッション制御の下で応答するストリーミングレスポンス。
+    取得済みの実行枠は応答を終えたときに加え、本文の送信を始める前にクライアントが切断した場合やキャンセルされた場合にも解放する。
+    レーンを指定した場合は、本文の生成中にエージェントを実行するときだけそのレーンの実行枠を取得する。
+    """
+
+    def __init__(
+        self,
+        content: AsyncIterator[Any],
+        admission: AdmissionController,
+        ticket: Optional[AdmissionTicket] = None,
+        lane: Optional[str] = None,
+        **kwargs: Any
+    ):
+        """
+        初期化
+        Args:
+            content (AsyncIterator[Any]): 応答する本文の非同期イテレーター。
+            admission (AdmissionController): アドミッション制御。
+            ticket (Optional[AdmissionTicket]): 応答を返し終えるまで保持する取得済みの実行枠。
+            lane (Optional[str]): 本文の生成中にエージェントを実行するときに実行枠を取得するレーン。
+            **kwargs: StreamingResponse に渡す引数。
+        """
+        super().__init__(content, **kwargs)
+        self.admission = admission
+        self.ticket = ticket
+        self.lane = lane
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            with self.admission.lane(self.lane):
+                await super().__call__(scope, receive, send)
+        finally:
+            # クライアントが切断した場合も本文の生成を終了させ、未完了の生成を取り消す
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            if self.ticket is not None:
+                self.admission.release(self.ticket)
+
+def event_stream_response(
+    events: AsyncIterator[Dict[str, Any]], admission: AdmissionController, ticket: AdmissionTicket
+) -> StreamingResponse:
+    """
+    サービスのイベントをServer-Sent Events形式のストリーミングレスポンスに変換する。
+    Args:
+        events (AsyncIterator[Dict[str, Any]]): "event" と "data" を持つイベント辞書の非同期イテレーター。
+        admission (AdmissionController): アドミッション制御。
+        ticket (AdmissionTicket): 応答を返し終えるまで保持する実行枠。
+    
+    Returns:
+        StreamingResponse: text/event-stream のレスポンス。
+    """
+    async def body():
+        async with contextlib.aclosing(events) as stream:
+            async for event in stream:
+                data = json.dumps(event["data"], ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {data}\n\n"
+
+    return AdmittedStreamingResponse(
+        body(),
+        admission,
+        ticket,
+        media_type="text/event-stream",
+        # プロキシによるバッファリングを無効化し、トークンを即座にクライアントへ届ける
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def too_many_requests(error: AdmissionRejected) -> HTTPException:
+    """
+    アドミッション制御で拒否されたリクエストを429の応答に変換する。
+    Args:
+        error (AdmissionRejected): アドミッション制御の拒否。
+    
+    Returns:
+        HTTPException: Retry-After ヘッダーを含む429の例外。
+    """
+    logger.warning(f"リクエストの受付を拒否しました: {str(error)}")
+    return HTTPException(
+        status_code=429,
+        detail="リクエストが混み合っています。しばらくしてから再度お試しください",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
 @router.get("/api/health")
 def get_health():
     """
@@ -24,26 +128,105 @@ def get_health():
     """
     return {"status": "ok"}
 
+@router.get("/api/ready")
+def get_ready(startup_warmup: Warmup = Depends(lambda: warmup)):
+    """
+    レディネスチェックエンドポイント。
+    起動時のウォームアップ（OpenAPIスペックの読み込み、エージェントの解決、接続の確立）が完了するまでは503を返す。
+    /api/health はプロセスの稼働（ライブネス）のみを示す。
+    Returns:
+        dict: "status"（ready または warming_up）とウォームアップの手順ごとの状態を含む辞書。
+    """
+    if not startup_warmup.ready:
+        return JSONResponse(status_code=503, content=startup_warmup.status())
+    return startup_warmup.status()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(registry: Metrics = Depends(lambda: metrics)):
+    """
+    メトリクスエンドポイント。
+    処理段階ごとのレイテンシのヒストグラム、実行中の件数、トークン使用量、キャッシュなどの統計を
+    Prometheusのテキスト形式で返します。
+    
+    Returns:
+        PlainTextResponse: Prometheusのテキスト形式（version 0.0.4）のレスポンス。
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @router.post("/api/chat")
 async def post_assistant_manager_service(
     request: MessageRequest, 
-    assistant_manager_service: AssistantManagerService = Depends(lambda: assistant_manager_service)
+    http_request: Request,
+    assistant_manager_service: AssistantManagerService = Depends(lambda: assistant_manager_service),
+    admission: AdmissionController = Depends(lambda: admission_controller)
 ):
     """
     エージェントに対してプロンプトを送信するエンドポイント。
+    Acceptヘッダーに text/event-stream を指定した場合は、応答をServer-Sent Eventsで逐次返す。
+    混雑時は429とRetry-Afterヘッダーを返す。
     Args:
         request (MessageRequest): メッセージリクエスト。
     
     Returns:
         dict: エージェントの応答を含む辞書。
     """
-    return await assistant_manager_service.process_openapi_spec(request)
+    try:
+        if wants_event_stream(http_request):
+            # ストリーミングはキャッシュや合流を使用せず必ずエージェントを実行するため、応答の前に実行枠を取得する
+            ticket = await admission.acquire(LANE_INTERACTIVE)
+            return event_stream_response(assistant_manager_service.stream_openapi_spec(request), admission, ticket)
+        # 実行枠はエージェントを実行する場合にだけ取得する（キャッシュから応答する場合や合流した場合は取得しない）
+        with admission.lane(LANE_INTERACTIVE):
+            return await assistant_manager_service.process_openapi_spec(request)
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+
+@router.get("/api/subsidies/search")
+def search_subsidies(
+    keyword: Optional[str] = Query(None, max_length=255, description="補助金名などに含まれるキーワード（空白区切りですべてを含むもの）"),
+    area: Optional[str] = Query(None, description="事業所の地域（都道府県または地方）"),
+    employees: Optional[int] = Query(None, ge=0, description="従業員数"),
+    deadline_from: Optional[datetime] = Query(None, description="受付終了日時の下限"),
+    deadline_to: Optional[datetime] = Query(None, description="受付終了日時の上限"),
+    min_limit: Optional[float] = Query(None, ge=0, description="補助上限額の下限（円）"),
+    max_limit: Optional[float] = Query(None, ge=0, description="補助上限額の上限（円）"),
+    sort: Literal["acceptance_end_datetime", "acceptance_start_datetime", "subsidy_max_limit"] = "acceptance_end_datetime",
+    order: Literal["ASC", "DESC"] = "ASC",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    catalog: SubsidyCatalog = Depends(lambda: subsidy_catalog)
+):
+    """
+    ローカルの補助金カタログを検索するエンドポイント。
+    エージェントを介さず、スナップショットから読み込んだ補助金情報をインデックスで絞り込んで返します。
+    
+    Returns:
+        dict: 補助金一覧APIと同じ形式の検索結果（"metadata" の件数は条件に一致した総数）
+    """
+    return catalog.search(
+        keyword=keyword,
+        area=area,
+        employees=employees,
+        deadline_from=deadline_from,
+        deadline_to=deadline_to,
+        min_limit=min_limit,
+        max_limit=max_limit,
+        sort=sort,
+        order=order,
+        offset=offset,
+        limit=limit
+    )
 
 @router.post("/api/application/generate")
-async def generate_application_form(request: ApplicationFormRequest):
+async def generate_application_form(
+    request: ApplicationFormRequest,
+    form_generator: ApplicationFormGenerator = Depends(lambda: application_form_generator),
+    admission: AdmissionController = Depends(lambda: admission_controller)
+):
     """
     補助金申請書テンプレートを生成するエンドポイント。
     AIを使用してリクエストの補助金情報に基づいたテンプレートを生成します。
+    チャットより優先度の低いレーンで実行し、混雑時は429とRetry-Afterヘッダーを返します。
     
     Args:
         request (ApplicationFormRequest): 補助金情報とビジネス概要を含むリクエスト
@@ -56,35 +239,137 @@ async def generate_application_form(request: ApplicationFormRequest):
         if not request.subsidy_info:
             raise HTTPException(status_code=400, detail="補助金情報が必要です")
         
-        # ApplicationFormGeneratorのインスタンスを作成
-        form_generator = ApplicationFormGenerator()
-        
-        # ビジネス概要が提供されている場合はAI拡張テンプレートを生成
-        if request.business_description:
-            application_text = form_generator.generate_ai_enhanced(
-                request.subsidy_info, 
-                request.business_description
-            )
-        # ビジネス概要がない場合は基本テンプレートのみを生成
-        else:
-            application_text = form_generator.generate(request.subsidy_info)
-        
-        return {
-            "template": application_text,
-            "ai_enhanced": bool(request.business_description)
-        }
+        # ビジネス概要が提供されている場合はAI拡張テンプレート、ない場合は基本テンプレートのみを生成
+        # 実行枠はエージェントを実行する場合にだけ取得する（生成内容のキャッシュから応答する場合や合流した場合は取得しない）
+        with admission.lane(LANE_BULK):
+            return await form_generator.generate_form(request)
         
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
     except Exception as e:
         logger.error(f"申請書テンプレート生成エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"申請書テンプレート生成中にエラーが発生しました: {str(e)}")
 
+@router.post("/api/application/generate/batch")
+async def generate_application_forms_batch(
+    request: ApplicationBatchRequest,
+    form_generator: ApplicationFormGenerator = Depends(lambda: application_form_generator),
+    admission: AdmissionController = Depends(lambda: admission_controller)
+):
+    """
+    複数の補助金申請書テンプレートを一括生成するエンドポイント。
+    結果は完了した順にNDJSON（1行に1件のJSON）で逐次返します。各行の index はリクエストの items の位置です。
+    生成に失敗した項目は error を含む行として返し、他の項目の生成は継続します。
+    エージェントを実行する項目はチャットより優先度の低いレーンで実行し、混雑で拒否された項目は error を含む行として返します。
+    
+    Args:
+        request (ApplicationBatchRequest): 生成する申請書ごとのリクエストの一覧
+    
+    Returns:
+        StreamingResponse: application/x-ndjson のレスポンス
+    """
+    async def body():
+        async with contextlib.aclosing(form_generator.generate_batch(request.items)) as results:
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return AdmittedStreamingResponse(
+        body(),
+        admission,
+        lane=LANE_BULK,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/application/jobs", status_code=202)
+async def submit_application_job(
+    request: ApplicationFormRequest,
+    job_queue: JobQueue = Depends(lambda: application_job_queue)
+):
+    """
+    補助金申請書テンプレートの生成をジョブとして受け付けるエンドポイント。
+    生成はバックグラウンドのワーカーで行い、ジョブIDを即座に返します。
+    
+    Args:
+        request (ApplicationFormRequest): 補助金情報とビジネス概要を含むリクエスト
+    
+    Returns:
+        dict: ジョブIDと状態を含む辞書
+    """
+    # 補助金情報が空の場合はエラー
+    if not request.subsidy_info:
+        raise HTTPException(status_code=400, detail="補助金情報が必要です")
+    
+    try:
+        job = await job_queue.submit(request.model_dump())
+    except JobQueueFull as e:
+        logger.warning(f"申請書生成ジョブの受付を拒否しました: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="申請書生成ジョブが混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "5"}
+        )
+    return job.to_dict()
+
+@router.get("/api/application/jobs/{job_id}")
+async def get_application_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30, description="ジョブの完了を待つ最大秒数（ロングポーリング）"),
+    job_queue: JobQueue = Depends(lambda: application_job_queue)
+):
+    """
+    申請書生成ジョブの状態を取得するエンドポイント。
+    wait を指定した場合は、ジョブが完了するか指定秒数が経過するまで応答を待ちます。
+    
+    Args:
+        job_id (str): ジョブID
+        wait (float): ジョブの完了を待つ最大秒数
+    
+    Returns:
+        dict: ジョブの状態と、完了している場合は結果またはエラーを含む辞書
+    """
+    job = await job_queue.wait(job_id, wait) if wait else await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job.to_dict()
+
+@router.get("/api/application/jobs/{job_id}/result")
+async def get_application_job_result(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30, description="ジョブの完了を待つ最大秒数（ロングポーリング）"),
+    job_queue: JobQueue = Depends(lambda: application_job_queue)
+):
+    """
+    申請書生成ジョブの結果を取得するエンドポイント。
+    結果は /api/application/generate と同じ形式で返します。ジョブが未完了の場合は202でジョブの状態を返します。
+    
+    Args:
+        job_id (str): ジョブID
+        wait (float): ジョブの完了を待つ最大秒数
+    
+    Returns:
+        dict: 生成された申請書テンプレートを含む辞書
+    """
+    job = await job_queue.wait(job_id, wait) if wait else await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=f"申請書テンプレート生成中にエラーが発生しました: {job.error}")
+    if not job.finished:
+        return JSONResponse(status_code=202, content=job.to_dict())
+    return job.result
+
 @router.post("/api/generate")
 async def generate_message(
     request: PromptRequest,
-    assistant_manager_service: AssistantManagerService = Depends(lambda: assistant_manager_service)
+    http_request: Request,
+    assistant_manager_service: AssistantManagerService = Depends(lambda: assistant_manager_service),
+    admission: AdmissionController = Depends(lambda: admission_controller)
 ):
     """
     AIにプロンプトを送信してメッセージを生成するエンドポイント。
+    Acceptヘッダーに text/event-stream を指定した場合は、応答をServer-Sent Eventsで逐次返す。
+    混雑時は429とRetry-Afterヘッダーを返す。
     
     Args:
         request (PromptRequest): プロンプトを含むリクエスト
@@ -97,14 +382,22 @@ async def generate_message(
         if not request.prompt:
             raise HTTPException(status_code=400, detail="プロンプトが必要です")
         
-        # AssistantManagerServiceのprocess_messageメソッドを呼び出す
-        generated_text = assistant_manager_service.process_message(request.prompt)
+        if wants_event_stream(http_request):
+            # ストリーミングは合流を使用せず必ずエージェントを実行するため、応答の前に実行枠を取得する
+            ticket = await admission.acquire(LANE_INTERACTIVE)
+            return event_stream_response(assistant_manager_service.stream_message(request.prompt), admission, ticket)
+        
+        # AssistantManagerServiceのprocess_message_asyncメソッドを呼び出す（実行枠は合流せずに実行する場合にだけ取得する）
+        with admission.lane(LANE_INTERACTIVE):
+            generated_text = await assistant_manager_service.process_message_async(request.prompt)
         
         return {
             "generated_text": generated_text,
             "success": True
         }
         
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
     except Exception as e:
         logger.error(f"メッセージ生成エラー: {str(e)}")
         return {
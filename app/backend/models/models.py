@@ -1,8 +1,20 @@
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 class MessageRequest(BaseModel):
     message: str
+    session_id: Optional[str] = Field(
+        None,
+        description="会話セッションID。前回の応答で返されたIDを指定すると同じ会話スレッドで続けて質問できる"
+    )
+    start_session: bool = Field(
+        False,
+        description="Trueの場合は新しい会話セッションを開始し、応答の session_id で続けて質問できるようにする"
+    )
+    bypass_cache: bool = Field(
+        False,
+        description="Trueの場合は応答キャッシュを使用せず、必ずエージェントを実行する"
+    )
 
 class ApplicationFormRequest(BaseModel):
     """
@@ -16,6 +28,25 @@ class ApplicationFormRequest(BaseModel):
         None,
         description="AI拡張テンプレートを生成する場合のビジネスの説明文。例: 'IT企業向けクラウドサービス開発'"
     )
+    bypass_cache: bool = Field(
+        False,
+        description="Trueの場合はAI生成内容のキャッシュを使用せず、必ずエージェントを実行する"
+    )
+    parallel_sections: Optional[bool] = Field(
+        None,
+        description="Trueの場合は申請書のセクションごとに並行して生成する。省略時はサーバーの設定に従う"
+    )
+
+class ApplicationBatchRequest(BaseModel):
+    """
+    補助金申請書テンプレート一括生成リクエストモデル
+    """
+    items: List[ApplicationFormRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=500,
+        description="生成する申請書ごとのリクエスト。business_description がある項目はAI拡張テンプレートを生成する"
+    )
 
 class PromptRequest(BaseModel):
     """
@@ -0,0 +1,249 @@
+"""
+エージェント呼び出しのアドミッション制御
+
+エージェントを呼び出すリクエストの同時実行数を制限し、超えた分は種類（レーン）ごとの上限付きキューで待たせる。
+空きができた場合は優先度の高いレーン（対話的なチャット）から順に実行させる。
+キューが満杯の場合や、キューで待てる時間を超えた場合は待たずに拒否し、呼び出し元は 429 と Retry-After を返す。
+過負荷の際にすべてのリクエストがタイムアウトするのではなく、一部を早く断って残りを処理する。
+実行枠はエージェントを実際に実行するときにだけ取得する。リクエストは lane でレーンを設定し、エージェントを実行する
+サービスが admit_current で実行枠を取得するため、キャッシュから応答するリクエストや処理中の実行に合流する
+リクエストはキューで待たず、拒否もされない。
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# レーン名
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+
+# 処理中のリクエストでエージェントを実行するときに実行枠を取得するレーン（未設定の場合は取得しない）
+_request_lane: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("admission_lane", default=None)
+
+class AdmissionRejected(Exception):
+    """同時実行数とキューが上限に達しているため、リクエストを受け付けられない"""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        """
+        初期化
+
+        Args:
+            lane: レーン名
+            reason: 拒否した理由（"queue_full" または "queue_timeout"）
+            retry_after: 再試行までの目安の秒数
+        """
+        super().__init__(f"Request rejected by admission control ({lane}: {reason})")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+@dataclass
+class AdmissionLane:
+    """レーンの設定と状態"""
+    priority: int
+    max_concurrency: int
+    max_queue_size: int
+    queue_timeout_seconds: float
+    in_flight: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+
+class AdmissionTicket:
+    """実行を許可されたリクエストの実行枠（release は1回のみ有効）"""
+
+    def __init__(self, lane: str, admitted_at: float):
+        self.lane = lane
+        self.admitted_at = admitted_at
+        self.released = False
+
+class AdmissionController:
+    """
+    優先度付きレーンを持つアドミッション制御
+
+    イベントループ上からのみ使用する。
+    """
+
+    def __init__(self, max_concurrency: int = 16, lanes: Optional[Dict[str, AdmissionLane]] = None):
+        """
+        初期化
+
+        Args:
+            max_concurrency: すべてのレーンを合わせた同時実行数の上限
+            lanes: レーン名とレーンの設定（省略時は interactive と bulk の2レーン）
+        """
+        self.max_concurrency = max_concurrency
+        self.lanes = lanes or {
+            LANE_INTERACTIVE: AdmissionLane(
+                priority=0, max_concurrency=max_concurrency, max_queue_size=64, queue_timeout_seconds=10
+            ),
+            LANE_BULK: AdmissionLane(
+                priority=1, max_concurrency=max(max_concurrency // 4, 1), max_queue_size=16, queue_timeout_seconds=30
+            ),
+        }
+        self._by_priority = sorted(self.lanes.values(), key=lambda lane: lane.priority)
+        self._in_flight = 0
+        self._average_hold_seconds = 1.0
+
+    async def acquire(self, lane_name: str) -> AdmissionTicket:
+        """
+        実行枠を取得する（空きがない場合はレーンのキューで待つ）
+
+        Args:
+            lane_name: レーン名
+
+        Returns:
+            実行枠。処理が終わったら release に渡す
+
+        Raises:
+            AdmissionRejected: キューが満杯の場合、またはキューで待てる時間を超えた場合
+            KeyError: 存在しないレーン名の場合
+        """
+        lane = self.lanes[lane_name]
+        if len(lane.waiters) >= lane.max_queue_size:
+            lane.rejected += 1
+            logger.warning(f"Admission queue full, rejecting request: {lane_name}")
+            raise AdmissionRejected(lane_name, "queue_full", self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        self._dispatch()
+        if not waiter.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=lane.queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                if not waiter.done():
+                    waiter.cancel()
+                    self._remove_waiter(lane, waiter)
+                    lane.rejected += 1
+                    lane.timed_out += 1
+                    logger.warning(f"Admission queue timed out, rejecting request: {lane_name}")
+                    raise AdmissionRejected(lane_name, "queue_timeout", self._retry_after())
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 実行枠を割り当てられた直後に呼び出し元がキャンセルされた場合は返す
+                    self.release(waiter.result())
+                else:
+                    waiter.cancel()
+                    self._remove_waiter(lane, waiter)
+                raise
+        return waiter.result()
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """
+        実行枠を返し、待っているリクエストに割り当てる
+
+        Args:
+            ticket: acquire で取得した実行枠
+        """
+        if ticket.released:
+            return
+        ticket.released = True
+        self.lanes[ticket.lane].in_flight -= 1
+        self._in_flight -= 1
+        held = time.monotonic() - ticket.admitted_at
+        self._average_hold_seconds = 0.8 * self._average_hold_seconds + 0.2 * held
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, lane_name: str) -> AsyncIterator[AdmissionTicket]:
+        """
+        ブロック内の処理の間、実行枠を取得する
+
+        Args:
+            lane_name: レーン名
+
+        Raises:
+            AdmissionRejected: キューが満杯の場合、またはキューで待てる時間を超えた場合
+        """
+        ticket = await self.acquire(lane_name)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @contextlib.contextmanager
+    def lane(self, lane_name: Optional[str]) -> Iterator[None]:
+        """
+        ブロック内で開始するエージェントの実行が実行枠を取得するレーンを設定する
+
+        ブロック内で作成したタスク（合流した実行など）にも引き継がれる。
+
+        Args:
+            lane_name: レーン名（Noneの場合は実行枠を取得しない）
+        """
+        token = _request_lane.set(lane_name)
+        try:
+            yield
+        finally:
+            _request_lane.reset(token)
+
+    @contextlib.asynccontextmanager
+    async def admit_current(self) -> AsyncIterator[Optional[AdmissionTicket]]:
+        """
+        ブロック内の処理の間、lane で設定したレーンの実行枠を取得する（レーンが未設定の場合は取得しない）
+
+        Raises:
+            AdmissionRejected: キューが満杯の場合、またはキューで待てる時間を超えた場合
+        """
+        lane_name = _request_lane.get()
+        if lane_name is None:
+            yield None
+            return
+        async with self.admit(lane_name) as ticket:
+            yield ticket
+
+    def stats(self) -> Dict[str, int]:
+        """
+        アドミッション制御の統計情報を取得する
+
+        Returns:
+            in_flight（実行中）と、レーンごとの in_flight・queued（待機中）・admitted・rejected・timed_out の件数
+        """
+        stats = {"in_flight": self._in_flight}
+        for name, lane in self.lanes.items():
+            stats[f"{name}_in_flight"] = lane.in_flight
+            stats[f"{name}_queued"] = len(lane.waiters)
+            stats[f"{name}_admitted"] = lane.admitted
+            stats[f"{name}_rejected"] = lane.rejected
+            stats[f"{name}_timed_out"] = lane.timed_out
+        return stats
+
+    def _dispatch(self) -> None:
+        """空いている実行枠を優先度の高いレーンの待機中のリクエストから順に割り当てる"""
+        while self._in_flight < self.max_concurrency:
+            for lane in self._by_priority:
+                while lane.waiters and lane.waiters[0].done():
+                    lane.waiters.popleft()
+                if lane.waiters and lane.in_flight < lane.max_concurrency:
+                    waiter = lane.waiters.popleft()
+                    lane.in_flight += 1
+                    lane.admitted += 1
+                    self._in_flight += 1
+                    name = next(name for name, candidate in self.lanes.items() if candidate is lane)
+                    waiter.set_result(AdmissionTicket(name, time.monotonic()))
+                    break
+            else:
+                return
+
+    def _remove_waiter(self, lane: AdmissionLane, waiter: asyncio.Future) -> None:
+        """キューから待機中のリクエストを取り除く"""
+        with contextlib.suppress(ValueError):
+            lane.waiters.remove(waiter)
+
+    def _retry_after(self) -> int:
+        """待機中のリクエストと平均の処理時間から、再試行までの目安の秒数を見積もる"""
+        queued = sum(len(lane.waiters) for lane in self.lanes.values())
+        estimate = self._average_hold_seconds * (queued + 1) / max(self.max_concurrency, 1)
+        return min(max(math.ceil(estimate), 1), 60)
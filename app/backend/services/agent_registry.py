@@ -0,0 +1,238 @@
+"""
+エージェントレジストリ
+
+エージェントの構成（モデル・名前・指示・ツール）のハッシュをキーにエージェントIDを保持し、
+同じ構成のエージェントをプロセス内・ワーカー間・再起動後で再利用する。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from services.client_utils import call_client
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class AgentRegistry:
+    """
+    構成ハッシュ単位でエージェントを一度だけ作成するレジストリ
+
+    プロセス内では構成ごとのロックで作成を1回に絞り（シングルフライト）、
+    persist_path を指定した場合はSQLite上の作成権の取得によりワーカー間でも1回に絞る。
+    """
+
+    def __init__(
+        self,
+        project_client: Any,
+        persist_path: Optional[str] = None,
+        claim_timeout_seconds: float = 60,
+        poll_interval_seconds: float = 0.2
+    ):
+        """
+        初期化
+
+        Args:
+            project_client: Azure AIプロジェクトクライアント（同期・非同期いずれも可）
+            persist_path: エージェントIDを永続化するSQLiteファイルのパス（省略時はメモリのみ）
+            claim_timeout_seconds: 他のワーカーの作成権がこの秒数を超えて完了しない場合に引き継ぐ
+            poll_interval_seconds: 他のワーカーの作成完了を待つ際のポーリング間隔（秒）
+        """
+        self.project_client = project_client
+        self.persist_path = persist_path
+        self.claim_timeout_seconds = claim_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._agents: Dict[str, str] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False, timeout=10)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS agents "
+                    "(config_key TEXT PRIMARY KEY, agent_id TEXT, claimed_at REAL NOT NULL)"
+                )
+
+    @staticmethod
+    def config_key(model: str, name: str, instructions: str, tools: Optional[List[Any]] = None) -> str:
+        """
+        エージェント構成のハッシュキーを計算する
+
+        Args:
+            model: モデルのデプロイ名
+            name: エージェント名
+            instructions: エージェントへの指示
+            tools: ツール定義の一覧
+
+        Returns:
+            構成のSHA-256ハッシュ
+        """
+        payload = json.dumps(
+            {"model": model, "name": name, "instructions": instructions, "tools": tools or []},
+            default=_to_serializable,
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get_or_create(
+        self,
+        model: str,
+        name: str,
+        instructions: str,
+        description: Optional[str] = None,
+        tools: Optional[List[Any]] = None
+    ) -> str:
+        """
+        構成に対応するエージェントIDを取得し、存在しない場合は作成する
+
+        Args:
+            model: モデルのデプロイ名
+            name: エージェント名
+            instructions: エージェントへの指示
+            description: エージェントの説明
+            tools: ツール定義の一覧
+
+        Returns:
+            エージェントID
+        """
+        key = self.config_key(model, name, instructions, tools)
+        agent_id = self._agents.get(key)
+        if agent_id:
+            return agent_id
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            # ロック待ちの間に他のリクエストが作成を終えている場合はそれを使う
+            agent_id = self._agents.get(key)
+            if agent_id:
+                return agent_id
+
+            agent_id = await self._load_verified(key)
+            if not agent_id:
+                agent_id = await self._create_once(key, model, name, instructions, description, tools)
+            self._agents[key] = agent_id
+            return agent_id
+
+    def invalidate(self, agent_id: str) -> None:
+        """
+        エージェントIDを登録から外す（エージェントが削除されていた場合など）
+
+        Args:
+            agent_id: エージェントID
+        """
+        for key in [k for k, v in self._agents.items() if v == agent_id]:
+            del self._agents[key]
+        if self._db is not None:
+            with self._db_lock, self._db:
+                self._db.execute("DELETE FROM agents WHERE agent_id = ?", (agent_id,))
+
+    async def _load_verified(self, key: str) -> Optional[str]:
+        """永続化されたエージェントIDを読み込み、サービス上にまだ存在するかを確認する"""
+        agent_id = self._read(key)
+        if not agent_id:
+            return None
+        try:
+            await call_client(self.project_client.agents.get_agent, agent_id)
+        except ResourceNotFoundError:
+            logger.warning(f"Registered agent no longer exists, recreating: {agent_id}")
+            self.invalidate(agent_id)
+            return None
+        logger.info(f"Reusing registered agent: {agent_id}")
+        return agent_id
+
+    async def _create_once(
+        self,
+        key: str,
+        model: str,
+        name: str,
+        instructions: str,
+        description: Optional[str],
+        tools: Optional[List[Any]]
+    ) -> str:
+        """作成権を取得したワーカーだけがエージェントを作成し、他のワーカーはその完了を待つ"""
+        while not self._claim(key):
+            await asyncio.sleep(self.poll_interval_seconds)
+            agent_id = self._read(key)
+            if agent_id:
+                return agent_id
+
+        try:
+            kwargs: Dict[str, Any] = {
+                "model": model,
+                "name": name,
+                "instructions": instructions,
+                "description": description or name,
+            }
+            if tools:
+                kwargs["tools"] = tools
+            agent = await call_client(self.project_client.agents.create_agent, **kwargs)
+        except Exception:
+            self._release_claim(key)
+            raise
+
+        logger.info(f"Created agent {agent.id} for {name}")
+        self._write(key, agent.id)
+        return agent.id
+
+    def _read(self, key: str) -> Optional[str]:
+        """永続化先からエージェントIDを読み込む"""
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT agent_id FROM agents WHERE config_key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _claim(self, key: str) -> bool:
+        """エージェントの作成権を取得する（永続化しない場合は常に取得できる）"""
+        if self._db is None:
+            return True
+        now = time.time()
+        with self._db_lock, self._db:
+            # 作成途中のまま放置された作成権は期限切れとして取り除く
+            self._db.execute(
+                "DELETE FROM agents WHERE config_key = ? AND agent_id IS NULL AND claimed_at < ?",
+                (key, now - self.claim_timeout_seconds)
+            )
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO agents (config_key, agent_id, claimed_at) VALUES (?, NULL, ?)",
+                (key, now)
+            )
+        return cursor.rowcount == 1
+
+    def _release_claim(self, key: str) -> None:
+        """作成に失敗した場合に作成権を手放す"""
+        if self._db is None:
+            return
+        with self._db_lock, self._db:
+            self._db.execute(
+                "DELETE FROM agents WHERE config_key = ? AND agent_id IS NULL", (key,)
+            )
+
+    def _write(self, key: str, agent_id: str) -> None:
+        """作成したエージェントIDを永続化する"""
+        if self._db is None:
+            return
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO agents (config_key, agent_id, claimed_at) VALUES (?, ?, ?)",
+                (key, agent_id, time.time())
+            )
+
+def _to_serializable(value: Any) -> Any:
+    """ツール定義などのSDKモデルをJSONシリアライズ可能な値に変換する"""
+    if hasattr(value, "as_dict"):
+        return value.as_dict()
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
@@ -2,121 +2,1015 @@
 AI アシスタントマネージャーサービス
 """
 
-import json
+import asyncio
+import contextlib
 import logging
-from typing import Dict, Any, Optional
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
 from azure.ai.projects import AIProjectClient
-from tools.common_utils import generate_application_text
+from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
+from azure.ai.projects.models import (
+    AgentStreamEvent,
+    AsyncFunctionTool,
+    AsyncToolSet,
+    ListSortOrder,
+    MessageDeltaChunk,
+    MessageRole,
+    MessageTextContent,
+    RunStatus,
+    RunStep,
+    RunStepType,
+    SubmitToolOutputsAction,
+    ThreadRun,
+)
+from azure.core.exceptions import ResourceNotFoundError
+
+from models.models import MessageRequest
+from services.admission_controller import AdmissionController, AdmissionRejected
+from services.agent_registry import AgentRegistry
+from services.client_utils import call_client
+from services.metrics import metrics
+from services.rate_limiter import RateLimitReservation, TokenRateLimiter
+from services.request_coalescer import RequestCoalescer
+from services.response_cache import ResponseCache
+from services.run_guard import CircuitOpenError, RunGuard
+from services.run_poller import RunPoller
+from services.session_store import SessionStore
+from services.spec_registry import SpecRegistry
+from services.thread_reaper import ThreadReaper
+from tools.actions import swagger_spec_tool
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
+# 補助金APIのOpenAPIスペックファイルのパス
+OPENAPI_SPEC_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "tools", "actions", "specs", "swagger_subsidies.json"
+)
+
+# エージェントの設定
+DEFAULT_MODEL = "gpt-4o"
+SUBSIDY_AGENT_NAME = "補助金情報案内AIエージェント"
+SUBSIDY_AGENT_INSTRUCTIONS = """あなたは補助金申請のエキスパートアシスタントです。
+ユーザーからの質問に対して、OpenAPIツールを使用して補助金情報を検索し、
+わかりやすく回答してください。"""
+BASIC_AGENT_NAME = "テキスト生成AIエージェント"
+BASIC_AGENT_INSTRUCTIONS = "あなたは補助金申請書の作成を支援するアシスタントです。指示に従って日本語で回答してください。"
+
+# 同期ストリームの終端を示す番兵
+_STREAM_END = object()
+
+# 完了を待つ必要があるエージェント実行の状態
+_ACTIVE_RUN_STATUSES = (RunStatus.QUEUED, RunStatus.IN_PROGRESS, RunStatus.REQUIRES_ACTION)
+
+class AgentRunError(Exception):
+    """エージェントの実行が失敗した、または応答を返さなかった"""
+
+    def __init__(self, last_error: Any = None):
+        """
+        初期化
+
+        Args:
+            last_error: 失敗した実行のエラー情報（実行は完了したが応答がなかった場合はNone）
+        """
+        super().__init__(f"Run failed: {last_error}" if last_error is not None else "No response found")
+        self.last_error = last_error
+
 class AssistantManagerService:
-    """AI アシスタントマネージャーサービス"""
+    """AI アシスタントマネージャーサービス
+
+    非同期クライアント（azure.ai.projects.aio）を渡した場合はSDK呼び出しをそのままawaitし、
+    同期クライアントを渡した場合はスレッドプールで実行するため、どちらの場合もイベントループをブロックしない。
+    エージェントの実行は create_and_process_run（aio版も完了待ちに time.sleep を使用する）を使わず、
+    実行を作成して asyncio.sleep で間隔を空けながら状態を確認する。
+    """
 
-    def __init__(self, project_client: AIProjectClient):
+    def __init__(
+        self,
+        project_client: Union[AIProjectClient, AsyncAIProjectClient],
+        model: Optional[str] = None,
+        session_store: Optional[SessionStore] = None,
+        thread_reaper: Optional[ThreadReaper] = None,
+        agent_registry: Optional[AgentRegistry] = None,
+        response_cache: Optional[ResponseCache] = None,
+        request_coalescer: Optional[RequestCoalescer] = None,
+        subsidies_tool: Optional[AsyncFunctionTool] = None,
+        spec_registry: Optional[SpecRegistry] = None,
+        run_poller: Optional[RunPoller] = None,
+        rate_limiter: Optional[TokenRateLimiter] = None,
+        run_guard: Optional[RunGuard] = None,
+        admission_controller: Optional[AdmissionController] = None
+    ):
         """
         初期化
-        
+
         Args:
-            project_client: Azure AIプロジェクトクライアント
+            project_client: Azure AIプロジェクトクライアント（同期・非同期いずれも可）
+            model: エージェントが使用するモデルのデプロイ名（省略時は環境変数 MODEL_DEPLOYMENT_NAME）
+            session_store: 会話セッションストア。指定した場合はセッション単位でスレッドを再利用する
+            thread_reaper: スレッドリーパー。指定した場合は不要になったスレッドをバックグラウンドで削除する
+            agent_registry: エージェントレジストリ（省略時はプロセス内のみで再利用するレジストリ）
+            response_cache: 応答キャッシュ。指定した場合は同じ質問への応答をエージェントを実行せずに返す
+            request_coalescer: リクエストの合流。指定した場合は処理中の同じ質問に後続のリクエストを合流させる
+            subsidies_tool: 補助金APIの関数ツール。指定した場合はOpenAPIツールの代わりに使用し、
+                ツール呼び出しをこのプロセス内で処理する（非同期クライアントのみ）
+            spec_registry: OpenAPIスペック・ツールレジストリ（省略時はこのサービス内のみで共有するレジストリ）
+            run_poller: エージェント実行のポーリング方針（省略時は既定の間隔のポーリング方針）
+            rate_limiter: モデルのクォータに合わせたレート制限。指定した場合はエージェントの実行前に
+                トークン数とリクエスト数を予約し、クォータの範囲内で実行できるまで待つ
+            run_guard: エージェント実行の保護。指定した場合は実行に期限を設け、遅い実行をヘッジし、
+                失敗が続いた場合はエージェントを実行せずに即座に失敗させる
+            admission_controller: アドミッション制御。指定した場合はリクエストに設定したレーンの実行枠を
+                エージェントを実行するときにだけ取得する（キャッシュから応答する場合や合流した場合は取得しない）
         """
         self.project_client = project_client
-        self._agent_id = None
+        self.model = model or os.getenv("MODEL_DEPLOYMENT_NAME", DEFAULT_MODEL)
+        self.session_store = session_store
+        self.thread_reaper = thread_reaper
+        self.agent_registry = agent_registry or AgentRegistry(project_client)
+        self.response_cache = response_cache
+        self.request_coalescer = request_coalescer
+        self.spec_registry = spec_registry or SpecRegistry()
+        self.run_poller = run_poller or RunPoller()
+        self.rate_limiter = rate_limiter
+        self.run_guard = run_guard
+        self.admission_controller = admission_controller
+        self.subsidies_toolset: Optional[AsyncToolSet] = None
+        if subsidies_tool is not None:
+            self.subsidies_toolset = AsyncToolSet()
+            self.subsidies_toolset.add(subsidies_tool)
 
-    def load_openapi_spec(self, file_path: str) -> Dict[str, Any]:
+    def load_openapi_spec(self, file_path: str = OPENAPI_SPEC_PATH) -> Dict[str, Any]:
         """
-        OpenAPIスペックファイルを読み込む
-        
+        OpenAPIスペックファイルを読み込む（レジストリに読み込み済みで、ファイルが更新されていない場合はそれを返す）
+
         Args:
             file_path: スペックファイルのパス
-            
+
         Returns:
             OpenAPIスペック辞書
-            
+
         Raises:
             FileNotFoundError: ファイルが存在しない場合
             json.JSONDecodeError: JSONパースエラー
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.spec_registry.load_spec(file_path)
         except FileNotFoundError:
             logger.error(f"OpenAPI specification file not found: {file_path}")
             raise
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             logger.error(f"Failed to parse OpenAPI specification: {str(e)}")
             raise
 
     def create_openapi_tool(self, spec: Dict[str, Any]) -> Any:
         """
         OpenAPIツールを作成する
-        
+
         Args:
             spec: OpenAPIスペック辞書
-            
+
         Returns:
             作成されたOpenAPIツール
         """
         try:
-            from tools.actions.swagger_spec_tool import create_subsidies_tool
-            return create_subsidies_tool(spec)
+            return swagger_spec_tool.create_subsidies_tool(spec)
         except Exception as e:
             logger.error(f"Failed to create OpenAPI tool: {str(e)}")
             raise
 
-    def process_openapi_spec(self, message: str) -> str:
+    def get_openapi_tool(self) -> Any:
+        """
+        補助金APIのOpenAPIツールを取得する
+
+        ツールはレジストリで共有し、スペックファイルが更新されるまで作り直さない。
+
+        Returns:
+            共有のOpenAPIツール
+        """
+        return self.spec_registry.get_tool(
+            OPENAPI_SPEC_PATH,
+            swagger_spec_tool.SUBSIDIES_TOOL_NAME,
+            lambda: self.create_openapi_tool(self.load_openapi_spec(OPENAPI_SPEC_PATH))
+        )
+
+    async def process_openapi_spec(self, request: MessageRequest) -> Dict[str, str]:
+        """
+        OpenAPIツールを持つエージェントでメッセージを処理し、応答を生成する
+
+        セッションストアが設定されている場合、start_session または session_id を指定したメッセージは
+        セッションのスレッドで処理し、応答に "session_id" を含める。それ以外のメッセージのスレッドは応答後すぐに解放する。
+        応答キャッシュが設定されている場合、セッションを使用しない質問はキャッシュから返す。
+        リクエストの合流が設定されている場合、そのような質問は処理中の同じ質問の実行に合流する。
+
+        Args:
+            request: ユーザーからのメッセージリクエスト
+
+        Returns:
+            応答を含む辞書（成功時は "response"、失敗時は "error" キー）
+
+        Raises:
+            AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合
+        """
+        cache_key = self._response_cache_key(request)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Returning cached response for chat message")
+                return {"response": cached}
+
+        if self.run_guard is not None and self.run_guard.circuit_open():
+            logger.warning("Circuit open, rejecting chat message without running the agent")
+            return {"error": "エージェントが一時的に利用できません。しばらくしてから再度お試しください"}
+
+        session_id = self._resolve_session_id(request)
+        if self.request_coalescer is None or session_id is not None:
+            return await self._process_openapi_message(request.message, session_id, cache_key)
+
+        key = ResponseCache.make_key(
+            request.message, self._agent_config(SUBSIDY_AGENT_NAME, SUBSIDY_AGENT_INSTRUCTIONS)
+        )
+        return await self.request_coalescer.run(
+            key, lambda: self._process_openapi_message(request.message, None, cache_key)
+        )
+
+    async def process_message_async(self, prompt: str) -> str:
+        """
+        ツールを持たないエージェントにプロンプトを送信し、応答テキストを生成する
+
+        失敗した場合は例外ではなくエラーメッセージを返す。失敗を区別する必要がある場合は generate_text を使用する。
+
+        Args:
+            prompt: エージェントに送信するプロンプト
+
+        Returns:
+            生成された応答テキスト（失敗時はエラーメッセージ）
+
+        Raises:
+            CircuitOpenError: 実行の保護の回路が開いている場合（呼び出し元が基本テンプレートなどで代替できるよう例外とする）
+            AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合
+        """
+        try:
+            return await self.generate_text(prompt)
+        except (CircuitOpenError, AdmissionRejected):
+            raise
+        except AgentRunError as e:
+            return f"Error: {e.last_error}" if e.last_error is not None else "No response found"
+        except Exception as e:
+            return f"Error processing request: {str(e)}"
+
+    async def generate_text(self, prompt: str) -> str:
         """
-        OpenAPIスペックを処理し、応答を生成する
-        
+        ツールを持たないエージェントにプロンプトを送信し、応答テキストを生成する（失敗時は例外を送出する）
+
+        リクエストの合流が設定されている場合、処理中の同じプロンプトの実行に合流する。
+
         Args:
-            message: ユーザーからのメッセージ
-            
+            prompt: エージェントに送信するプロンプト
+
         Returns:
-            生成された応答
+            生成された応答テキスト
+
+        Raises:
+            CircuitOpenError: 実行の保護の回路が開いている場合
+            AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合
+            AgentRunError: 実行が失敗した場合、または応答がなかった場合
+            Exception: エージェントサービスとの通信エラーなど
+        """
+        if self.run_guard is not None and self.run_guard.circuit_open():
+            raise CircuitOpenError(self.run_guard.breaker.retry_after())
+        if self.request_coalescer is None:
+            return await self._process_prompt(prompt)
+        key = ResponseCache.make_key(prompt, self._agent_config(BASIC_AGENT_NAME, BASIC_AGENT_INSTRUCTIONS))
+        return await self.request_coalescer.run(key, lambda: self._process_prompt(prompt))
+
+    async def stream_openapi_spec(self, request: MessageRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        process_openapi_spec のストリーミング版
+
+        エージェントの実行中に応答テキストの差分やツール呼び出しの進捗をイベントとして逐次返す。
+
+        Args:
+            request: ユーザーからのメッセージリクエスト
+
+        Yields:
+            "event"（delta / tool_call / status / done / error）と "data" を持つイベント辞書
         """
+        agent_id = None
+        thread_id = None
+        session_id = self._resolve_session_id(request)
         try:
-            # エージェントがなければ作成
-            if not self._agent_id:
-                # エージェントの作成
-                agent = self.project_client.agents.create_agent(
-                    name="補助金情報案内AIエージェント",
-                    instructions="""あなたは補助金申請のエキスパートアシスタントです。
-ユーザーからの質問に対して、OpenAPIツールを使用して補助金情報を検索し、
-わかりやすく回答してください。""",
-                    description="補助金情報案内AIエージェント"
+            agent_id = await self._get_subsidy_agent()
+            async with self._session_lock(session_id):
+                thread_id = await self._prepare_thread(request.message, await self._session_thread_id(session_id))
+                await self._save_session(session_id, thread_id)
+                async for event in self._stream_agent(agent_id, thread_id, request.message):
+                    if event["event"] in ("done", "error"):
+                        event["data"] = self._with_session(event["data"], session_id)
+                    yield event
+        except Exception as e:
+            self._forget_missing_agent(agent_id, e)
+            logger.error(f"Failed to stream OpenAPI spec: {str(e)}")
+            yield {"event": "error", "data": self._with_session(
+                {"error": f"Error processing request: {str(e)}"}, session_id
+            )}
+        finally:
+            self._release_thread(thread_id, session_id)
+
+    async def stream_message(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        process_message_async のストリーミング版
+
+        Args:
+            prompt: エージェントに送信するプロンプト
+
+        Yields:
+            "event"（delta / tool_call / status / done / error）と "data" を持つイベント辞書
+        """
+        agent_id = None
+        thread_id = None
+        try:
+            agent_id = await self._get_basic_agent()
+            thread_id = await self._prepare_thread(prompt)
+            async for event in self._stream_agent(agent_id, thread_id, prompt):
+                yield event
+        except Exception as e:
+            self._forget_missing_agent(agent_id, e)
+            logger.error(f"Failed to stream message: {str(e)}")
+            yield {"event": "error", "data": {"error": f"Error processing request: {str(e)}"}}
+        finally:
+            self._release_thread(thread_id)
+
+    async def warm_up(self, connections: int = 1) -> Dict[str, str]:
+        """
+        最初のリクエストの前にエージェントを解決し、上流への接続を確立する
+
+        エージェントの解決（未作成の場合は作成、永続化済みの場合は存在確認）により、OpenAPIスペックの読み込みと
+        ツールの作成、資格情報のトークン取得も済ませる。さらに connections 件のエージェント取得を同時に行い、
+        接続プールにその数の接続を用意する。
+
+        Args:
+            connections: 事前に確立する接続の数
+
+        Returns:
+            "subsidy"（補助金情報案内エージェント）と "basic"（テキスト生成エージェント）のエージェントID
+        """
+        agent_ids = {"subsidy": await self._get_subsidy_agent(), "basic": await self._get_basic_agent()}
+        await asyncio.gather(*[
+            self._call(self.project_client.agents.get_agent, agent_ids["basic"]) for _ in range(connections)
+        ])
+        logger.info(f"Warmed up agents and {connections} connections")
+        return agent_ids
+
+    def process_message(self, prompt: str) -> str:
+        """
+        process_message_async の同期版
+
+        イベントループ外（スレッドプールやスクリプト）から同期クライアントと組み合わせて使用する。
+        イベントループ上では process_message_async をawaitすること。
+
+        Args:
+            prompt: エージェントに送信するプロンプト
+
+        Returns:
+            生成された応答テキスト
+        """
+        return asyncio.run(self.process_message_async(prompt))
+
+    async def _process_openapi_message(
+        self, message: str, session_id: Optional[str], cache_key: Optional[str]
+    ) -> Dict[str, str]:
+        """
+        OpenAPIツールを持つエージェントでメッセージを1回処理する
+
+        Args:
+            message: ユーザーメッセージ
+            session_id: セッションID（セッションストア未設定時はNone）
+            cache_key: 応答を保存するキャッシュキー（キャッシュしない場合はNone）
+
+        Returns:
+            応答を含む辞書（成功時は "response"、失敗時は "error" キー）
+
+        Raises:
+            AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合
+        """
+        agent_id = None
+        thread_id = None
+        try:
+            agent_id = await self._get_subsidy_agent()
+
+            async with self._session_lock(session_id):
+                run, thread_id = await self._run_agent(
+                    agent_id, message, await self._session_thread_id(session_id)
                 )
-                self._agent_id = agent.id
-
-            # スレッドの作成
-            thread = self.project_client.agents.create_thread()
-            
-            # メッセージの作成
-            self.project_client.agents.create_message(
-                thread_id=thread.id,
-                role="user",
-                content=message
-            )
-            
-            # エージェントの実行
-            run = self.project_client.agents.create_and_process_run(
-                agent_id=self._agent_id,
-                thread_id=thread.id
-            )
-            
+                await self._save_session(session_id, thread_id)
+
             # エラー発生時の処理
-            if run.last_error:
+            if run.status == RunStatus.FAILED:
                 logger.error(f"Agent execution failed: {run.last_error}")
-                return f"エージェントの実行に失敗しました: {run.last_error}"
-            
-            # レスポンスの取得
-            responses = self.project_client.agents.list_messages(thread_id=thread.id)
-            for response in responses:
-                if response.role == "assistant":
-                    return response.content
-            
-            return "No response found"
-            
+                return self._with_session({"error": f"Run failed: {run.last_error}"}, session_id)
+
+            response_text = await self._get_response_text(thread_id, run.id)
+            if response_text and cache_key is not None:
+                self.response_cache.set(cache_key, response_text)
+            return self._with_session({"response": response_text or "No response found"}, session_id)
+
+        except AdmissionRejected:
+            raise
         except Exception as e:
+            self._forget_missing_agent(agent_id, e)
             logger.error(f"Failed to process OpenAPI spec: {str(e)}")
-            return f"エラーが発生しました: {str(e)}"
\ No newline at end of file
+            return self._with_session({"error": f"Error processing request: {str(e)}"}, session_id)
+        finally:
+            self._release_thread(thread_id, session_id)
+
+    async def _process_prompt(self, prompt: str) -> str:
+        """
+        ツールを持たないエージェントでプロンプトを1回処理する
+
+        Args:
+            prompt: エージェントに送信するプロンプト
+
+        Returns:
+            生成された応答テキスト
+
+        Raises:
+            AgentRunError: 実行が失敗した場合、または応答がなかった場合
+        """
+        agent_id = None
+        thread_id = None
+        try:
+            agent_id = await self._get_basic_agent()
+
+            run, thread_id = await self._run_agent(agent_id, prompt)
+
+            if run.status == RunStatus.FAILED:
+                logger.error(f"Agent execution failed: {run.last_error}")
+                raise AgentRunError(run.last_error)
+
+            response_text = await self._get_response_text(thread_id, run.id)
+            if not response_text:
+                raise AgentRunError()
+            return response_text
+
+        except AgentRunError:
+            raise
+        except Exception as e:
+            self._forget_missing_agent(agent_id, e)
+            logger.error(f"Failed to process message: {str(e)}")
+            raise
+        finally:
+            self._release_thread(thread_id)
+
+    async def _get_subsidy_agent(self) -> str:
+        """
+        補助金APIのOpenAPIツールを持つエージェントを取得する（未作成の場合のみ作成する）
+
+        Returns:
+            エージェントのID
+        """
+        with metrics.track("get_agent"):
+            if self.subsidies_toolset is not None:
+                # 関数の定義の順序はプロセスごとに変わるため、レジストリのキーが変わらないよう名前順にする
+                definitions = sorted(self.subsidies_toolset.definitions, key=lambda d: d.function.name)
+                agent_id = await self.agent_registry.get_or_create(
+                    model=self.model,
+                    name=SUBSIDY_AGENT_NAME,
+                    instructions=SUBSIDY_AGENT_INSTRUCTIONS,
+                    description=SUBSIDY_AGENT_NAME,
+                    tools=definitions
+                )
+                self._register_toolset(agent_id, self.subsidies_toolset)
+                return agent_id
+
+            tool = self.get_openapi_tool()
+            return await self.agent_registry.get_or_create(
+                model=self.model,
+                name=SUBSIDY_AGENT_NAME,
+                instructions=SUBSIDY_AGENT_INSTRUCTIONS,
+                description=SUBSIDY_AGENT_NAME,
+                tools=tool.definitions
+            )
+
+    async def _get_basic_agent(self) -> str:
+        """
+        ツールを持たないテキスト生成用エージェントを取得する（未作成の場合のみ作成する）
+
+        Returns:
+            エージェントのID
+        """
+        with metrics.track("get_agent"):
+            return await self.agent_registry.get_or_create(
+                model=self.model,
+                name=BASIC_AGENT_NAME,
+                instructions=BASIC_AGENT_INSTRUCTIONS,
+                description=BASIC_AGENT_NAME
+            )
+
+    async def _run_agent(
+        self, agent_id: str, message: str, thread_id: Optional[str] = None
+    ) -> Tuple[Any, str]:
+        """
+        スレッドにメッセージを投稿し、エージェントの実行完了を待つ
+
+        実行の保護が設定されている場合はその期限内で実行し、新しいスレッドで実行する場合に限り遅い実行をヘッジする
+        （1つのスレッドでは2つの実行を同時に行えないため）。
+        レート制限の予約は実行の保護の外で行うため、クォータの待ち時間は期限・ヘッジ・回路の判定に含まれない。
+        ヘッジの実行は開始する時点で待たずに予約できる場合に限り行い、予約できない場合はヘッジしない。
+        アドミッション制御の実行枠はここで取得するため、キャッシュから応答する場合や合流した場合は取得しない。
+
+        Args:
+            agent_id: 実行するエージェントのID
+            message: ユーザーメッセージ
+            thread_id: 再利用するスレッドのID（省略時は新しいスレッドを作成）
+
+        Returns:
+            実行結果（ThreadRun）とスレッドIDのタプル
+
+        Raises:
+            CircuitOpenError: 実行の保護の回路が開いている場合
+            AdmissionRejected: リクエストに設定したレーンの実行枠を取得できなかった場合
+            TimeoutError: 実行の保護の期限内に実行が完了しなかった場合
+            RateLimitExceeded: クォータが回復するまでの待ち時間が上限を超える場合
+        """
+        if self.run_guard is not None and self.run_guard.circuit_open():
+            raise CircuitOpenError(self.run_guard.breaker.retry_after())
+        async with self._admit():
+            reservation = await self._reserve_tokens(message)
+            hedge_reservations: List[RateLimitReservation] = []
+
+            async def reserve_hedge() -> bool:
+                if self.rate_limiter is None:
+                    return True
+                hedge_reservation = await self.rate_limiter.try_acquire(message)
+                if hedge_reservation is None:
+                    return False
+                hedge_reservations.append(hedge_reservation)
+                return True
+
+            run = None
+            try:
+                if self.run_guard is None:
+                    run, thread_id = await self._run_agent_once(agent_id, message, thread_id)
+                else:
+                    run, thread_id = await self.run_guard.run(
+                        lambda: self._run_agent_once(agent_id, message, thread_id),
+                        is_failure=lambda result: result[0].status == RunStatus.FAILED,
+                        hedge=thread_id is None,
+                        before_hedge=reserve_hedge
+                    )
+            finally:
+                await self._reconcile_tokens(reservation, getattr(run, "usage", None))
+                # 採用しなかった実行の使用量は取得できないため、ヘッジの予約は見積もりのまま精算する
+                for hedge_reservation in hedge_reservations:
+                    await self._reconcile_tokens(hedge_reservation, None)
+        return run, thread_id
+
+    async def _run_agent_once(
+        self, agent_id: str, message: str, thread_id: Optional[str] = None
+    ) -> Tuple[Any, str]:
+        """
+        _run_agent の1回分の実行（キャンセルされた場合は作成したスレッドを解放する）
+
+        Args:
+            agent_id: 実行するエージェントのID
+            message: ユーザーメッセージ
+            thread_id: 再利用するスレッドのID（省略時は新しいスレッドを作成）
+
+        Returns:
+            実行結果（ThreadRun）とスレッドIDのタプル
+        """
+        created = thread_id is None
+        thread_id = await self._prepare_thread(message, thread_id)
+        try:
+            # エージェントの実行
+            with metrics.track("run"):
+                run = await self._create_and_poll_run(thread_id, agent_id)
+        except asyncio.CancelledError:
+            # ヘッジで採用されなかった場合など、結果を返さないスレッドはここで解放する
+            if created:
+                self._release_thread(thread_id)
+            raise
+        metrics.record_tokens(getattr(run, "usage", None))
+        return run, thread_id
+
+    async def _create_and_poll_run(self, thread_id: str, agent_id: str) -> Any:
+        """
+        エージェントの実行を作成し、完了するまで状態を確認する
+
+        状態確認の間隔は run_poller に従い、待機中はイベントループを解放する。
+        関数ツールの呼び出しを要求された場合はこのプロセスで実行して結果を送信し、間隔を初期値に戻す。
+
+        Args:
+            thread_id: メッセージ投稿済みのスレッドのID
+            agent_id: 実行するエージェントのID
+
+        Returns:
+            完了した実行（ThreadRun）
+
+        Raises:
+            TimeoutError: run_poller.timeout_seconds 以内に実行が完了しなかった場合（実行はキャンセルする）
+            asyncio.CancelledError: 待機中にキャンセルされた場合（実行もキャンセルする）
+        """
+        agents = self.project_client.agents
+        poller = self.run_poller
+        deadline = time.monotonic() + poller.timeout_seconds
+        status_calls = 0
+        timed_out = False
+        run = await self._call(agents.create_run, thread_id=thread_id, agent_id=agent_id)
+        intervals = poller.intervals()
+        try:
+            while run.status in _ACTIVE_RUN_STATUSES:
+                if run.status == RunStatus.REQUIRES_ACTION and isinstance(run.required_action, SubmitToolOutputsAction):
+                    if not run.required_action.submit_tool_outputs.tool_calls:
+                        logger.warning(f"No tool calls provided, cancelling run: {run.id}")
+                        return await self._call(agents.cancel_run, thread_id=thread_id, run_id=run.id)
+                    if await self._submit_tool_outputs(thread_id, run):
+                        intervals = poller.intervals()
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    await self._cancel_run(thread_id, run.id)
+                    raise TimeoutError(f"Run did not complete within {poller.timeout_seconds} seconds: {run.id}")
+                await asyncio.sleep(min(next(intervals), remaining))
+                run = await self._call(agents.get_run, thread_id=thread_id, run_id=run.id)
+                status_calls += 1
+            return run
+        except asyncio.CancelledError:
+            # ヘッジで採用されなかった場合などは、上流の実行もキャンセルしてクォータを消費し続けないようにする
+            await asyncio.shield(self._cancel_run(thread_id, run.id))
+            raise
+        finally:
+            poller.record(status_calls, timed_out)
+
+    async def _stream_agent(self, agent_id: str, thread_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        メッセージ投稿済みのスレッドでエージェントを実行し、結果をストリーミングで受信する
+
+        Args:
+            agent_id: 実行するエージェントのID
+            thread_id: ユーザーメッセージを投稿したスレッドのID
+            message: 投稿したユーザーメッセージ（レート制限の見積もりに使用する）
+
+        Yields:
+            クライアントに送信するイベント辞書
+
+        Raises:
+            CircuitOpenError: 実行の保護の回路が開いている場合
+        """
+        if self.run_guard is not None and self.run_guard.circuit_open():
+            raise CircuitOpenError(self.run_guard.breaker.retry_after())
+        reservation = await self._reserve_tokens(message)
+        usage = None
+        try:
+            start = time.perf_counter()
+            with metrics.track("create_stream"):
+                stream = await self._call(
+                    self.project_client.agents.create_stream,
+                    thread_id=thread_id,
+                    agent_id=agent_id
+                )
+
+            chunks = []
+            async for event_type, event_data in self._iterate_stream(stream):
+                if isinstance(event_data, MessageDeltaChunk):
+                    text = event_data.text
+                    if text:
+                        if not chunks:
+                            metrics.observe("first_token", time.perf_counter() - start)
+                        chunks.append(text)
+                        yield {"event": "delta", "data": {"text": text}}
+                elif isinstance(event_data, RunStep):
+                    if event_data.type == RunStepType.TOOL_CALLS:
+                        yield {"event": "tool_call", "data": self._describe_tool_step(event_data)}
+                elif isinstance(event_data, ThreadRun):
+                    if event_type == AgentStreamEvent.THREAD_RUN_FAILED:
+                        logger.error(f"Agent execution failed: {event_data.last_error}")
+                        metrics.observe("run_stream", time.perf_counter() - start, error=True)
+                        yield {"event": "error", "data": {"error": f"Run failed: {event_data.last_error}"}}
+                        return
+                    if event_type == AgentStreamEvent.THREAD_RUN_COMPLETED:
+                        metrics.record_tokens(event_data.usage)
+                        usage = event_data.usage
+                    yield {"event": "status", "data": {"status": str(event_data.status)}}
+                elif event_type == AgentStreamEvent.ERROR:
+                    logger.error(f"Agent stream error: {event_data}")
+                    metrics.observe("run_stream", time.perf_counter() - start, error=True)
+                    yield {"event": "error", "data": {"error": f"Stream error: {event_data}"}}
+                    return
+
+            metrics.observe("run_stream", time.perf_counter() - start)
+            yield {"event": "done", "data": {"response": "".join(chunks) or "No response found"}}
+        finally:
+            await self._reconcile_tokens(reservation, usage)
+
+    async def _iterate_stream(self, stream: Any) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        SDKのストリームを (イベント種別, イベントデータ) の非同期イテレーターとして扱う
+
+        非同期クライアントのストリームはそのまま反復し、同期クライアントのストリームは
+        1イベントずつスレッドプールで読み出す。
+
+        Args:
+            stream: create_stream の戻り値（AgentRunStream または AsyncAgentRunStream）
+
+        Yields:
+            イベント種別とイベントデータのタプル
+        """
+        if hasattr(stream, "__aenter__"):
+            async with stream as event_handler:
+                async for event_type, event_data, _ in event_handler:
+                    yield event_type, event_data
+            return
+
+        with stream as event_handler:
+            iterator: Iterator = iter(event_handler)
+            while True:
+                event = await asyncio.to_thread(next, iterator, _STREAM_END)
+                if event is _STREAM_END:
+                    break
+                event_type, event_data, _ = event
+                yield event_type, event_data
+
+    async def _submit_tool_outputs(self, thread_id: str, run: ThreadRun) -> bool:
+        """
+        実行が要求した関数ツールの呼び出しを処理し、結果を送信する
+
+        関数以外のツール（Azure Functionsなど）の呼び出しはサービス側で処理されるため、完了を待つだけとする。
+
+        Args:
+            thread_id: スレッドID
+            run: ツールの呼び出しを要求している実行
+
+        Returns:
+            結果を送信した場合はTrue
+
+        Raises:
+            ValueError: 関数ツールの呼び出しを処理するツールセットがない場合
+        """
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        if not any(tool_call.type == "function" for tool_call in tool_calls):
+            return False
+
+        toolsets = getattr(self.project_client.agents, "_toolset", None)
+        toolset = toolsets.get(run.agent_id) if isinstance(toolsets, dict) else None
+        toolset = toolset or self.subsidies_toolset
+        if toolset is None:
+            raise ValueError("Toolset is not available in the client.")
+
+        tool_outputs = await self._call(toolset.execute_tool_calls, tool_calls)
+        if tool_outputs:
+            await self._call(
+                self.project_client.agents.submit_tool_outputs_to_run,
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=tool_outputs
+            )
+            return True
+        return False
+
+    async def _cancel_run(self, thread_id: str, run_id: str) -> None:
+        """タイムアウトした実行や採用しなかった実行をキャンセルする（失敗しても処理を続ける）"""
+        try:
+            await self._call(self.project_client.agents.cancel_run, thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            logger.warning(f"Failed to cancel run {run_id}: {str(e)}")
+
+    def _describe_tool_step(self, step: RunStep) -> Dict[str, Any]:
+        """
+        ツール呼び出しのRunStepを進捗イベント用の辞書に変換する
+
+        Args:
+            step: ツール呼び出しを含むRunStep
+
+        Returns:
+            ステップID・状態・呼び出されたツール名を含む辞書
+        """
+        tool_calls = getattr(step.step_details, "tool_calls", None) or []
+        tools = []
+        for tool_call in tool_calls:
+            function = getattr(tool_call, "function", None)
+            tools.append(getattr(function, "name", None) or tool_call.type)
+        return {"step_id": step.id, "status": str(step.status), "tools": tools}
+
+    async def _prepare_thread(self, message: str, thread_id: Optional[str] = None) -> str:
+        """
+        スレッドにユーザーメッセージを投稿する
+
+        Args:
+            message: ユーザーメッセージ
+            thread_id: 再利用するスレッドのID（省略時は新しいスレッドを作成）
+
+        Returns:
+            メッセージを投稿したスレッドのID
+        """
+        agents = self.project_client.agents
+
+        # スレッドの作成（既存のスレッドがあれば作成のラウンドトリップを省略する）
+        if not thread_id:
+            with metrics.track("create_thread"):
+                thread = await self._call(agents.create_thread)
+            thread_id = thread.id
+        if self.thread_reaper is not None:
+            self.thread_reaper.track(thread_id)
+
+        # メッセージの作成
+        with metrics.track("create_message"):
+            await self._call(
+                agents.create_message,
+                thread_id=thread_id,
+                role=MessageRole.USER,
+                content=message
+            )
+        return thread_id
+
+    def _admit(self) -> Any:
+        """アドミッション制御が設定されている場合、リクエストに設定したレーンの実行枠を取得するコンテキストを返す"""
+        if self.admission_controller is None:
+            return contextlib.nullcontext()
+        return self.admission_controller.admit_current()
+
+    async def _reserve_tokens(self, message: str) -> Optional[RateLimitReservation]:
+        """
+        レート制限が設定されている場合、実行1回分のクォータを予約して実行できるまで待つ
+
+        Args:
+            message: エージェントに送信するメッセージ
+
+        Returns:
+            予約（レート制限が未設定の場合はNone）
+        """
+        if self.rate_limiter is None:
+            return None
+        with metrics.track("rate_limit_wait"):
+            return await self.rate_limiter.acquire(message)
+
+    async def _reconcile_tokens(self, reservation: Optional[RateLimitReservation], usage: Any) -> None:
+        """予約したトークン数を実際の使用量で精算する"""
+        if reservation is not None:
+            await self.rate_limiter.reconcile(reservation, usage)
+
+    def _release_thread(self, thread_id: Optional[str], session_id: Optional[str] = None) -> None:
+        """
+        会話を継続しないスレッドをリーパーの削除対象にする
+
+        セッションに紐づくスレッドはセッションの破棄時に解放されるため、ここでは解放しない。
+
+        Args:
+            thread_id: スレッドID
+            session_id: スレッドが紐づくセッションID
+        """
+        if self.thread_reaper is not None and thread_id and session_id is None:
+            self.thread_reaper.release(thread_id)
+
+    def _resolve_session_id(self, request: MessageRequest) -> Optional[str]:
+        """
+        リクエストのセッションIDを決定する
+
+        セッションを要求しない1回限りのメッセージにはセッションを発行せず、スレッドを応答後すぐに解放する。
+
+        Args:
+            request: ユーザーからのメッセージリクエスト
+
+        Returns:
+            リクエストで指定されたセッションID、start_session の場合は新しく発行したセッションID。
+            セッションを使用しない場合（セッションストア未設定時を含む）はNone
+        """
+        if self.session_store is None:
+            return None
+        if request.session_id:
+            return request.session_id
+        return self.session_store.new_session_id() if request.start_session else None
+
+    def _response_cache_key(self, request: MessageRequest) -> Optional[str]:
+        """
+        リクエストの応答キャッシュのキーを返す
+
+        会話の途中のメッセージは過去のやり取りによって応答が変わるため、キャッシュの対象外とする。
+        セッションを開始するメッセージも、応答にセッション（スレッド）を返す必要があるため対象外とする。
+
+        Args:
+            request: ユーザーからのメッセージリクエスト
+
+        Returns:
+            キャッシュキー。キャッシュを使用しない場合はNone
+        """
+        if self.response_cache is None or request.bypass_cache or request.session_id or request.start_session:
+            return None
+        return self.response_cache.make_key(
+            request.message, self._agent_config(SUBSIDY_AGENT_NAME, SUBSIDY_AGENT_INSTRUCTIONS)
+        )
+
+    def _agent_config(self, name: str, instructions: str) -> str:
+        """応答を左右するエージェント構成（モデル・名前・指示）のハッシュを返す"""
+        return AgentRegistry.config_key(self.model, name, instructions)
+
+    def _session_lock(self, session_id: Optional[str]) -> Any:
+        """同一セッションのメッセージを直列化するためのロックを返す"""
+        if session_id is None:
+            return contextlib.nullcontext()
+        return self.session_store.lock(session_id)
+
+    async def _session_thread_id(self, session_id: Optional[str]) -> Optional[str]:
+        """セッションに対応する再利用可能なスレッドIDを返す"""
+        if session_id is None:
+            return None
+        return await self.session_store.get_thread_id(session_id)
+
+    async def _save_session(self, session_id: Optional[str], thread_id: str) -> None:
+        """セッションとスレッドの対応を保存する"""
+        if session_id is not None:
+            await self.session_store.save(session_id, thread_id)
+
+    def _with_session(self, response: Dict[str, Any], session_id: Optional[str]) -> Dict[str, Any]:
+        """セッションが有効な場合は応答にセッションIDを付与する"""
+        if session_id is None:
+            return response
+        return {**response, "session_id": session_id}
+
+    async def _get_response_text(self, thread_id: str, run_id: Optional[str] = None) -> Optional[str]:
+        """
+        スレッドから最新のエージェント応答をテキストとして取得する
+
+        スレッド全体ではなく最新のメッセージ1件のみを取得するため、会話の長さに関わらず一定のコストで取得できる。
+
+        Args:
+            thread_id: スレッドID
+            run_id: 実行ID。指定した場合はその実行が作成したメッセージのみを対象とする
+
+        Returns:
+            応答テキスト。エージェントの応答がない場合はNone
+        """
+        with metrics.track("list_messages"):
+            messages = await self._call(
+                self.project_client.agents.list_messages,
+                thread_id=thread_id,
+                run_id=run_id,
+                limit=1,
+                order=ListSortOrder.DESCENDING
+            )
+        for message in messages.data:
+            if message.role == MessageRole.AGENT:
+                return self._message_text(message)
+        return None
+
+    def _message_text(self, message: Any) -> str:
+        """
+        メッセージのテキストの部分を改行でつないだ文字列に変換する（画像などのテキスト以外の部分は除く）
+
+        Args:
+            message: スレッドのメッセージ（ThreadMessage）
+
+        Returns:
+            メッセージのテキスト
+        """
+        return "\n".join(
+            content.text.value
+            for content in message.content
+            if isinstance(content, MessageTextContent) and content.text.value
+        )
+
+    def _forget_missing_agent(self, agent_id: Optional[str], error: Exception) -> None:
+        """
+        エージェントがサービス上から削除されていた場合、次回のリクエストで作り直せるよう登録を外す
+
+        Args:
+            agent_id: 実行に使用したエージェントのID
+            error: 発生した例外
+        """
+        if agent_id and isinstance(error, ResourceNotFoundError):
+            logger.warning(f"Agent not found, removing from registry: {agent_id}")
+            self.agent_registry.invalidate(agent_id)
+
+    def _register_toolset(self, agent_id: str, toolset: AsyncToolSet) -> None:
+        """
+        エージェントの関数ツールの呼び出しをこのプロセスで処理できるよう、クライアントにツールセットを登録する
+
+        SDKは create_agent(toolset=...) で作成したエージェントのツールセットしか保持しないため、
+        レジストリが再利用するエージェント（他のワーカーや再起動前に作成したもの）にも登録する。
+
+        Args:
+            agent_id: エージェントのID
+            toolset: ツールセット
+        """
+        toolsets = getattr(self.project_client.agents, "_toolset", None)
+        if isinstance(toolsets, dict) and toolsets.get(agent_id) is not toolset:
+            toolsets[agent_id] = toolset
+
+    async def _call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        SDKメソッドをイベントループをブロックせずに呼び出す
+
+        Args:
+            func: 呼び出すSDKメソッド
+            *args: 位置引数
+            **kwargs: キーワード引数
+
+        Returns:
+            SDKメソッドの戻り値
+        """
+        return await call_client(func, *args, **kwargs)
@@ -0,0 +1,29 @@
+"""
+Azure AI Projects クライアント呼び出しの共通ユーティリティ
+"""
+
+import asyncio
+import inspect
+from typing import Any, Callable
+
+async def call_client(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    SDKメソッドをイベントループをブロックせずに呼び出す
+
+    非同期クライアント（azure.ai.projects.aio）のメソッドはそのままawaitし、
+    同期クライアントのメソッドはスレッドプールで実行する。
+
+    Args:
+        func: 呼び出すSDKメソッド
+        *args: 位置引数
+        **kwargs: キーワード引数
+
+    Returns:
+        SDKメソッドの戻り値
+    """
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    result = await asyncio.to_thread(func, *args, **kwargs)
+    if inspect.isawaitable(result):
+        return await result
+    return result
@@ -0,0 +1,372 @@
+"""
+非同期ジョブキュー
+
+時間のかかる処理をジョブとして受け付け、上限付きのワーカープールでバックグラウンド実行する。
+HTTPリクエストはジョブIDを返した時点で終了し、結果は状態確認用のAPIから取得する。
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# ジョブの状態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class JobQueueFull(Exception):
+    """ジョブキューが上限に達しているため受け付けられない"""
+
+@dataclass
+class Job:
+    """ジョブ"""
+    job_id: str
+    status: str
+    payload: Dict[str, Any]
+    created_at: float
+    updated_at: float
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        """ジョブが完了（成功または失敗）しているか"""
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        APIの応答用の辞書に変換する
+
+        Returns:
+            ジョブID・状態・日時と、完了している場合は結果またはエラーを含む辞書
+        """
+        data: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.status == JOB_SUCCEEDED:
+            data["result"] = self.result
+        elif self.status == JOB_FAILED:
+            data["error"] = self.error
+        return data
+
+class JobStore:
+    """
+    ジョブの保存先
+
+    メモリ上で保持し、最終更新から ttl_seconds を過ぎた完了済みジョブは破棄する（evict_expired はリーパーの定期処理から呼び出す）。
+    persist_path を指定した場合はSQLiteにも書き込み、他のワーカーや再起動後からも参照できるようにする。
+    SQLiteの読み書きはイベントループをブロックしないようスレッドプールで行う。
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, persist_path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            ttl_seconds: 完了したジョブを保持する秒数
+            persist_path: ジョブを永続化するSQLiteファイルのパス（省略時はメモリのみ）
+        """
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._jobs: Dict[str, Job] = {}
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False, timeout=10)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs "
+                    "(job_id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                    "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+                )
+
+    async def save(self, job: Job) -> None:
+        """
+        ジョブを保存する
+
+        Args:
+            job: ジョブ
+        """
+        self._jobs[job.job_id] = job
+        if self._db is not None:
+            await asyncio.to_thread(self._persist, job)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """
+        ジョブを取得する
+
+        メモリ上の完了済みジョブを優先し、そうでなければ永続化先の最新の状態を読み込む。
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            ジョブ。未知または期限切れの場合はNone
+        """
+        cutoff = time.time() - self.ttl_seconds
+        job = self._jobs.get(job_id)
+        if job is not None and self._expired(job, cutoff):
+            # 定期処理の前に期限切れになったジョブは、ここで個別に破棄する
+            del self._jobs[job_id]
+            job = None
+        if self._db is None or (job is not None and job.finished):
+            return job
+        loaded = await asyncio.to_thread(self._load, job_id)
+        if loaded is not None and self._expired(loaded, cutoff):
+            return None
+        return loaded or job
+
+    async def evict_expired(self, now: Optional[float] = None) -> int:
+        """
+        保持期限を過ぎた完了済みジョブを破棄する
+
+        永続化している場合、SQLiteからの削除はイベントループをブロックしないようスレッドプールで行う。
+
+        Args:
+            now: 現在時刻（UNIX時間）。省略時は現在時刻
+
+        Returns:
+            メモリから破棄したジョブ数
+        """
+        now = now if now is not None else time.time()
+        cutoff = now - self.ttl_seconds
+        expired: List[str] = [job_id for job_id, job in self._jobs.items() if self._expired(job, cutoff)]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self._db is not None:
+            await asyncio.to_thread(self._delete_expired, cutoff)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    @staticmethod
+    def _expired(job: Job, cutoff: float) -> bool:
+        """完了済みで保持期限を過ぎたジョブか"""
+        return job.finished and job.updated_at <= cutoff
+
+    def _persist(self, job: Job) -> None:
+        """ジョブを永続化先に書き込む（スレッドプールから呼び出す）"""
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(job_id, status, payload, result, error, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.job_id,
+                    job.status,
+                    json.dumps(job.payload, ensure_ascii=False),
+                    json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                    job.error,
+                    job.created_at,
+                    job.updated_at,
+                )
+            )
+
+    def _delete_expired(self, cutoff: float) -> None:
+        """永続化先から保持期限を過ぎた完了済みジョブを削除する（スレッドプールから呼び出す）"""
+        with self._db_lock, self._db:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at <= ?",
+                (JOB_SUCCEEDED, JOB_FAILED, cutoff)
+            )
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        """永続化先からジョブを読み込む（スレッドプールから呼び出す）"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT status, payload, result, error, created_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, payload, result, error, created_at, updated_at = row
+        return Job(
+            job_id=job_id,
+            status=status,
+            payload=json.loads(payload),
+            result=json.loads(result) if result is not None else None,
+            error=error,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+class JobQueue:
+    """
+    上限付きのワーカープールでジョブを実行するキュー
+
+    待ち行列が max_queue_size に達している場合は新しいジョブを受け付けない。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        store: Optional[JobStore] = None,
+        workers: int = 4,
+        max_queue_size: int = 100,
+        poll_interval_seconds: float = 0.5
+    ):
+        """
+        初期化
+
+        Args:
+            handler: ジョブのペイロードを受け取り、結果の辞書を返すコルーチン関数
+            store: ジョブの保存先（省略時はメモリのみのストア）
+            workers: 同時に実行するジョブ数の上限
+            max_queue_size: 実行待ちのジョブ数の上限
+            poll_interval_seconds: 他のワーカーが実行中のジョブの完了を待つ際のポーリング間隔（秒）
+        """
+        self.handler = handler
+        self.store = store if store is not None else JobStore()
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._events: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    async def submit(self, payload: Dict[str, Any]) -> Job:
+        """
+        ジョブを登録する
+
+        Args:
+            payload: ハンドラーに渡すペイロード（JSONシリアライズ可能な辞書）
+
+        Returns:
+            登録したジョブ
+
+        Raises:
+            JobQueueFull: 実行待ちのジョブ数が上限に達している場合
+        """
+        now = time.time()
+        job = Job(
+            job_id=uuid.uuid4().hex,
+            status=JOB_QUEUED,
+            payload=payload,
+            created_at=now,
+            updated_at=now,
+        )
+        try:
+            self._queue.put_nowait(job.job_id)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.max_queue_size} jobs waiting)")
+        self._events[job.job_id] = asyncio.Event()
+        await self.store.save(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """
+        ジョブを取得する
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            ジョブ。未知または期限切れの場合はNone
+        """
+        return await self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """
+        ジョブの完了を最大 timeout 秒待つ（ロングポーリング）
+
+        Args:
+            job_id: ジョブID
+            timeout: 待機する最大秒数
+
+        Returns:
+            ジョブ（期限までに完了しなかった場合は未完了の状態）。未知のジョブの場合はNone
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.finished or remaining <= 0:
+                return job
+            event = self._events.get(job_id)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                else:
+                    # 他のワーカーが受け付けたジョブは永続化先をポーリングする
+                    await asyncio.sleep(min(self.poll_interval_seconds, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キューの状態を取得する
+
+        Returns:
+            queued（実行待ち）、workers（ワーカー数）、jobs（保持しているジョブ数）
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "workers": len(self._tasks),
+            "jobs": len(self.store),
+        }
+
+    def start(self) -> None:
+        """ワーカーを起動する"""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        """ワーカーを停止する"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        """キューからジョブを取り出して実行し続ける"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        """
+        ジョブを実行し、結果を保存する
+
+        Args:
+            job_id: ジョブID
+        """
+        job = await self.store.get(job_id)
+        if job is None:
+            return
+        job.status = JOB_RUNNING
+        job.updated_at = time.time()
+        await self.store.save(job)
+        try:
+            job.result = await self.handler(job.payload)
+            job.status = JOB_SUCCEEDED
+        except asyncio.CancelledError:
+            job.status = JOB_FAILED
+            job.error = "Job was cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job.updated_at = time.time()
+            await self.store.save(job)
+            event = self._events.pop(job_id, None)
+            if event is not None:
+                event.set()
@@ -0,0 +1,222 @@
+"""
+処理段階ごとのレイテンシ計測
+
+エージェント呼び出しの各段階（エージェントの取得・スレッド作成・メッセージ投稿・実行・応答取得など）の
+所要時間をヒストグラムに記録し、実行中の件数・トークン使用量・各コンポーネントの統計と合わせて
+Prometheusのテキスト形式で出力する。外部のコレクターやライブラリは使用しない。
+リクエスト単位で計測した段階は Server-Timing ヘッダーとしても返せる。
+"""
+
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120
+)
+
+# 処理中のリクエストで計測した段階（段階名と所要時間の一覧）
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+class _Histogram:
+    """ラベル1組分のヒストグラム"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class Metrics:
+    """
+    段階ごとのレイテンシ・実行中の件数・トークン使用量の計測
+
+    スレッドプールから呼ばれる同期処理でも共有できるよう、更新はロックで保護する。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "app"):
+        """
+        初期化
+
+        Args:
+            buckets: 所要時間のヒストグラムのバケット（秒、昇順）
+            prefix: 出力するメトリクス名の接頭辞
+        """
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._histograms: Dict[str, _Histogram] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._tokens: Dict[str, int] = {"prompt": 0, "completion": 0}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def track(self, stage: str) -> Iterator[None]:
+        """
+        ブロック内の処理を1つの段階として計測する
+
+        例外が発生した場合も所要時間を記録し、エラー数に加える。
+
+        Args:
+            stage: 段階名
+        """
+        with self._lock:
+            self._in_flight[stage] = self._in_flight.get(stage, 0) + 1
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            with self._lock:
+                self._in_flight[stage] -= 1
+            self.observe(stage, time.perf_counter() - start, error)
+
+    def observe(self, stage: str, seconds: float, error: bool = False) -> None:
+        """
+        段階の所要時間を記録する
+
+        Args:
+            stage: 段階名
+            seconds: 所要時間（秒）
+            error: 段階が失敗した場合はTrue
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram(self.buckets)
+            histogram.counts[index] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    def record_tokens(self, usage: Any) -> None:
+        """
+        エージェント実行のトークン使用量を記録する
+
+        Args:
+            usage: 実行のトークン使用量（prompt_tokens と completion_tokens を持つ RunCompletionUsage）。Noneの場合は何もしない
+        """
+        if usage is None:
+            return
+        with self._lock:
+            for kind in ("prompt", "completion"):
+                value = getattr(usage, f"{kind}_tokens", None)
+                if isinstance(value, int):
+                    self._tokens[kind] += value
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, Any]]) -> None:
+        """
+        出力時に呼び出す統計の取得関数を登録する（キャッシュやキューの stats() など）
+
+        Args:
+            name: メトリクス名に含めるコンポーネント名
+            collect: 項目名と数値の辞書を返す関数
+        """
+        self._collectors[name] = collect
+
+    def begin_request(self) -> contextvars.Token:
+        """
+        現在のリクエストで計測した段階の記録を開始する
+
+        Returns:
+            end_request に渡すトークン
+        """
+        return _request_timings.set([])
+
+    def end_request(self, token: contextvars.Token) -> None:
+        """
+        現在のリクエストの段階の記録を終了する
+
+        Args:
+            token: begin_request の戻り値
+        """
+        _request_timings.reset(token)
+
+    def server_timing(self) -> str:
+        """
+        現在のリクエストで計測した段階を Server-Timing ヘッダーの値に変換する
+
+        同じ段階を複数回計測した場合は所要時間を合計する。
+
+        Returns:
+            Server-Timing ヘッダーの値（計測した段階がない場合は空文字列）
+        """
+        timings = _request_timings.get()
+        if not timings:
+            return ""
+        totals: Dict[str, float] = {}
+        for stage, seconds in timings:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+    def render(self) -> str:
+        """
+        メトリクスをPrometheusのテキスト形式で出力する
+
+        Returns:
+            Prometheusのテキスト形式（version 0.0.4）の文字列
+        """
+        name = f"{self.prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of each processing stage in seconds.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                label = _format_label(stage)
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f'{name}_bucket{{stage="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{label}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{label}"}} {histogram.count}')
+
+            lines.extend(self._render_labeled(
+                "stage_in_flight", "gauge", "Number of stages currently running.", "stage", self._in_flight
+            ))
+            lines.extend(self._render_labeled(
+                "stage_errors_total", "counter", "Number of stages that raised an error.", "stage", self._errors
+            ))
+            lines.extend(self._render_labeled(
+                "agent_tokens_total", "counter", "Tokens used by agent runs.", "type", self._tokens
+            ))
+
+        for component, collect in sorted(self._collectors.items()):
+            for key, value in collect().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f"{self.prefix}_{component}_{key}"
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _render_labeled(
+        self, suffix: str, metric_type: str, help_text: str, label_name: str, values: Dict[str, int]
+    ) -> List[str]:
+        """ラベル1つを持つメトリクスの行を作成する"""
+        name = f"{self.prefix}_{suffix}"
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        for label, value in sorted(values.items()):
+            lines.append(f'{name}{{{label_name}="{_format_label(label)}"}} {value}')
+        return lines
+
+def _format_label(value: str) -> str:
+    """ラベルの値をPrometheusのテキスト形式用にエスケープする"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# アプリケーション全体で共有する計測
+metrics = Metrics()
@@ -0,0 +1,77 @@
+"""
+Azure AIプロジェクトクライアントの生成
+
+アプリケーション全体で1つのクライアントを共有し、HTTP接続をキープアライブで使い回す。
+"""
+
+import logging
+from typing import Any
+
+import aiohttp
+from azure.ai.projects.aio import AIProjectClient
+from azure.core.pipeline.transport import AioHttpTransport
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class PooledAioHttpTransport(AioHttpTransport):
+    """
+    接続プールの大きさとキープアライブ時間を指定できるaiohttpトランスポート
+
+    aiohttpのセッションはイベントループ上で作成する必要があるため、最初のリクエスト時に作成する。
+    """
+
+    def __init__(self, pool_size: int = 100, keepalive_timeout: float = 30, **kwargs: Any):
+        """
+        初期化
+
+        Args:
+            pool_size: 同時に保持するHTTP接続の上限数
+            keepalive_timeout: 使用していない接続を保持する秒数
+            **kwargs: AioHttpTransport に渡す引数
+        """
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+
+    async def open(self):
+        """接続プールを持つセッションを作成して開く"""
+        if self.session is None and self._session_owner and not self._has_been_opened:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                trust_env=self._use_env_settings,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                auto_decompress=False,
+            )
+            logger.info(f"Opened pooled HTTP session (pool size: {self.pool_size})")
+        await super().open()
+
+def create_project_client(
+    conn_str: str,
+    credential: Any,
+    pool_size: int = 100,
+    keepalive_timeout: float = 30
+) -> AIProjectClient:
+    """
+    接続プールを共有する非同期のAIProjectClientを作成する
+
+    クライアント内部のエンドポイントごとのパイプラインも同じトランスポート（接続プール）を使用する。
+
+    Args:
+        conn_str: プロジェクトの接続文字列
+        credential: 非同期の資格情報
+        pool_size: 同時に保持するHTTP接続の上限数
+        keepalive_timeout: 使用していない接続を保持する秒数
+
+    Returns:
+        非同期のAIProjectClient
+    """
+    transport = PooledAioHttpTransport(pool_size=pool_size, keepalive_timeout=keepalive_timeout)
+    return AIProjectClient.from_connection_string(
+        credential=credential, conn_str=conn_str, transport=transport
+    )
@@ -0,0 +1,278 @@
+"""
+モデルのクォータ（TPM・RPM）に合わせたトークンバケット方式のレート制限
+
+エージェントを実行する前にプロンプトのトークン数を見積もって予約し、実行後に実際の使用量との差を精算する。
+予約はバケットの残量を負にしてでも即座に行い、残量が0に戻るまでの時間だけ待ってから実行するため、
+同時に到着したリクエストは上流の429を受けずに一定の間隔で順に実行される。
+persist_path を指定した場合はバケットをSQLiteファイル（/dev/shm 上のファイルなど）に置き、同じホストのワーカー間で共有する。
+ファイルの読み書きは他のワーカーのロックを待つことがあるため、イベントループを止めないようスレッドプールで行う。
+"""
+
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# バケット名
+TOKENS = "tokens"
+REQUESTS = "requests"
+
+class RateLimitExceeded(Exception):
+    """クォータの残量が回復するまでの待ち時間が上限を超えている"""
+
+    def __init__(self, wait_seconds: float):
+        """
+        初期化
+
+        Args:
+            wait_seconds: 実行できるまでに必要な待ち時間（秒）
+        """
+        super().__init__(f"Rate limit wait of {wait_seconds:.1f} seconds exceeds the limit")
+        self.wait_seconds = wait_seconds
+
+@dataclass
+class RateLimitReservation:
+    """実行1回分の予約（reconcile は1回のみ有効）"""
+    estimated_tokens: int
+    wait_seconds: float
+    reconciled: bool = False
+
+class TokenRateLimiter:
+    """
+    トークン数（TPM）とリクエスト数（RPM）の2つのバケットによるレート制限
+
+    どちらのバケットも1分あたりの上限の割合で回復し、burst_seconds 秒分までためられる。
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int = 0,
+        requests_per_minute: int = 0,
+        burst_seconds: float = 10,
+        overhead_tokens: int = 200,
+        expected_completion_tokens: int = 500,
+        max_wait_seconds: float = 60,
+        persist_path: Optional[str] = None,
+        namespace: str = "default"
+    ):
+        """
+        初期化
+
+        Args:
+            tokens_per_minute: 1分あたりのトークン数の上限（0以下の場合は制限しない）
+            requests_per_minute: 1分あたりのリクエスト数の上限（0以下の場合は制限しない）
+            burst_seconds: 何秒分の上限までまとめて実行できるか（Azure OpenAIはRPMを10秒単位でも適用する）
+            overhead_tokens: メッセージ以外にプロンプトに含まれるトークン数の見積もり（エージェントの指示・ツール定義など）
+            expected_completion_tokens: 応答のトークン数の見積もり
+            max_wait_seconds: 予約の待ち時間の上限（秒）。超える場合は待たずに RateLimitExceeded を送出する
+            persist_path: バケットを共有するSQLiteファイルのパス（省略時はプロセス内のみ）
+            namespace: 同じファイルを共有するデプロイメントを区別する名前
+        """
+        self.burst_seconds = burst_seconds
+        self.overhead_tokens = overhead_tokens
+        self.expected_completion_tokens = expected_completion_tokens
+        self.max_wait_seconds = max_wait_seconds
+        self.persist_path = persist_path
+        self.namespace = namespace
+        # バケット名ごとの（容量, 1秒あたりの回復量）
+        self._limits: Dict[str, Tuple[float, float]] = {}
+        for name, per_minute in ((TOKENS, tokens_per_minute), (REQUESTS, requests_per_minute)):
+            if per_minute > 0:
+                self._limits[name] = (max(per_minute * burst_seconds / 60, 1.0), per_minute / 60)
+        self._levels: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False, timeout=10)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_limits "
+                    "(name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+                )
+        self._reservations = 0
+        self._delayed = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+        self._estimated_tokens = 0
+        self._actual_tokens = 0
+
+    def estimate_tokens(self, text: str) -> int:
+        """
+        実行1回で使用するトークン数を見積もる
+
+        英数字は4文字で1トークン、日本語などそれ以外の文字は1文字で1トークンとして数え、
+        プロンプトのその他の部分と応答の見積もりを加える。
+
+        Args:
+            text: エージェントに送信するメッセージ
+
+        Returns:
+            見積もったトークン数
+        """
+        ascii_chars = sum(1 for char in text if char < "\x80")
+        message_tokens = math.ceil(ascii_chars / 4) + len(text) - ascii_chars
+        return message_tokens + self.overhead_tokens + self.expected_completion_tokens
+
+    async def acquire(self, text: str) -> RateLimitReservation:
+        """
+        実行1回分のトークン数とリクエスト数を予約し、クォータの範囲内で実行できるまで待つ
+
+        Args:
+            text: エージェントに送信するメッセージ
+
+        Returns:
+            予約。実行後に reconcile に渡す
+
+        Raises:
+            RateLimitExceeded: 待ち時間が max_wait_seconds を超える場合（予約は取り消す）
+        """
+        tokens = self.estimate_tokens(text)
+        deltas = {TOKENS: -tokens, REQUESTS: -1}
+        wait = self._wait_seconds_for(await self._update(deltas))
+        if wait > self.max_wait_seconds:
+            await self._update({TOKENS: tokens, REQUESTS: 1})
+            with self._lock:
+                self._rejected += 1
+            logger.warning(f"Rate limit wait too long, rejecting run: {wait:.1f}s")
+            raise RateLimitExceeded(wait)
+
+        with self._lock:
+            self._reservations += 1
+            self._estimated_tokens += tokens
+            if wait > 0:
+                self._delayed += 1
+                self._wait_seconds += wait
+        if wait > 0:
+            logger.info(f"Delaying run by {wait:.2f}s to stay within the model quota")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 実行しないまま取り消された場合は予約を返す
+                await self._update({TOKENS: tokens, REQUESTS: 1})
+                raise
+        return RateLimitReservation(estimated_tokens=tokens, wait_seconds=wait)
+
+    async def try_acquire(self, text: str) -> Optional[RateLimitReservation]:
+        """
+        待たずに実行できる場合に限り、実行1回分のトークン数とリクエスト数を予約する
+
+        ヘッジの実行など、クォータを待つよりも実行しない方がよい場合に使用する。
+
+        Args:
+            text: エージェントに送信するメッセージ
+
+        Returns:
+            予約（実行後に reconcile に渡す）。クォータの残量が足りない場合はNone（予約は取り消す）
+        """
+        tokens = self.estimate_tokens(text)
+        wait = self._wait_seconds_for(await self._update({TOKENS: -tokens, REQUESTS: -1}))
+        if wait > 0:
+            await self._update({TOKENS: tokens, REQUESTS: 1})
+            return None
+
+        with self._lock:
+            self._reservations += 1
+            self._estimated_tokens += tokens
+        return RateLimitReservation(estimated_tokens=tokens, wait_seconds=0.0)
+
+    async def reconcile(self, reservation: RateLimitReservation, usage: Any) -> None:
+        """
+        実際のトークン使用量と見積もりの差をバケットに反映する
+
+        Args:
+            reservation: acquire の戻り値
+            usage: 実行のトークン使用量（prompt_tokens と completion_tokens を持つ RunCompletionUsage）。
+                Noneの場合（実行に失敗した場合など）は見積もりのまま精算する
+        """
+        if reservation.reconciled:
+            return
+        reservation.reconciled = True
+        tokens = [getattr(usage, f"{kind}_tokens", None) for kind in ("prompt", "completion")]
+        if not all(isinstance(value, int) for value in tokens):
+            return
+        actual = sum(tokens)
+        with self._lock:
+            self._actual_tokens += actual
+        if actual != reservation.estimated_tokens:
+            await self._update({TOKENS: reservation.estimated_tokens - actual})
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        レート制限の統計情報を取得する
+
+        Returns:
+            reservations（予約数）、delayed（待たせた数）、rejected（拒否した数）、wait_seconds（待ち時間の合計）、
+            estimated_tokens・actual_tokens（見積もり・実際のトークン数の合計）と、各バケットの残量
+            （persist_path を指定した場合は、ファイルを読まずに最後に確認した残量から回復分を見積もる）
+        """
+        now = time.time()
+        with self._lock:
+            levels = {name: self._recovered_level(name, now)[0] for name in self._limits}
+            stats: Dict[str, Any] = {
+                "reservations": self._reservations,
+                "delayed": self._delayed,
+                "rejected": self._rejected,
+                "wait_seconds": self._wait_seconds,
+                "estimated_tokens": self._estimated_tokens,
+                "actual_tokens": self._actual_tokens,
+            }
+        for name, level in levels.items():
+            stats[f"{name}_available"] = level
+        return stats
+
+    async def _update(self, deltas: Dict[str, float]) -> Dict[str, float]:
+        """_apply を実行する（ファイルに置いたバケットはスレッドプールで更新する）"""
+        if self._db is None:
+            return self._apply(deltas)
+        return await asyncio.to_thread(self._apply, deltas)
+
+    def _apply(self, deltas: Dict[str, float]) -> Dict[str, float]:
+        """各バケットを現在時刻まで回復させてから増減し、増減後の残量を返す（制限しないバケットは無視する）"""
+        now = time.time()
+        levels = {}
+        if self._db is None:
+            with self._lock:
+                for name in self._limits:
+                    level, updated_at = self._recovered_level(name, now)
+                    level = min(self._limits[name][0], level + deltas.get(name, 0))
+                    self._levels[name] = (level, updated_at)
+                    levels[name] = level
+            return levels
+
+        # 1つのトランザクションで回復と増減を行い、他のワーカーの更新と競合しないようにする
+        with self._lock, self._db:
+            for name, (capacity, rate) in self._limits.items():
+                key = f"{self.namespace}:{name}"
+                self._db.execute(
+                    "INSERT OR IGNORE INTO rate_limits (name, level, updated_at) VALUES (?, ?, ?)",
+                    (key, capacity, now)
+                )
+                self._db.execute(
+                    "UPDATE rate_limits SET "
+                    "level = MIN(?1, MIN(?1, level + MAX(?2 - updated_at, 0) * ?3) + ?4), "
+                    "updated_at = MAX(updated_at, ?2) WHERE name = ?5",
+                    (capacity, now, rate, deltas.get(name, 0), key)
+                )
+                levels[name], updated_at = self._db.execute(
+                    "SELECT level, updated_at FROM rate_limits WHERE name = ?", (key,)
+                ).fetchone()
+                self._levels[name] = (levels[name], updated_at)
+        return levels
+
+    def _recovered_level(self, name: str, now: float) -> Tuple[float, float]:
+        """最後に確認した残量を現在時刻まで回復させた残量と基準時刻（_lock を取得して呼び出す）"""
+        capacity, rate = self._limits[name]
+        level, updated_at = self._levels.get(name, (capacity, now))
+        return min(capacity, level + max(now - updated_at, 0) * rate), max(updated_at, now)
+
+    def _wait_seconds_for(self, levels: Dict[str, float]) -> float:
+        """残量が負のバケットが0に戻るまでの秒数"""
+        waits = [-level / self._limits[name][1] for name, level in levels.items() if level < 0]
+        return max(waits, default=0.0)
@@ -0,0 +1,90 @@
+"""
+同一リクエストの合流（コアレッシング）
+
+同じキーのリクエストが処理中の場合は新しく実行せず、実行中の処理の結果を共有する。
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+@dataclass
+class _InFlight:
+    """処理中のリクエスト"""
+    task: asyncio.Task
+    waiters: int = 0
+
+class RequestCoalescer:
+    """
+    処理中の同一リクエストを1回の実行にまとめる
+
+    実行は呼び出し元とは独立したタスクで行うため、最初の呼び出し元が切断（キャンセル）されても
+    合流した他の呼び出し元には影響しない。待っている呼び出し元が全員いなくなった場合のみ実行をキャンセルする。
+    """
+
+    def __init__(self):
+        """初期化"""
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        キーに対応する処理を実行する（同じキーの処理が実行中の場合はその結果を待つ）
+
+        Args:
+            key: リクエストを識別するキー
+            factory: 処理を開始するコルーチンを返す関数（合流した場合は呼び出されない）
+
+        Returns:
+            処理の結果
+        """
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = _InFlight(task=asyncio.ensure_future(factory()))
+            self._inflight[key] = inflight
+            inflight.task.add_done_callback(lambda task: self._finish(key, inflight))
+            self._started += 1
+        else:
+            self._coalesced += 1
+            logger.info(f"Coalesced request into in-flight run ({inflight.waiters} waiting)")
+
+        inflight.waiters += 1
+        try:
+            # 呼び出し元のキャンセルが共有の実行に伝播しないよう shield で待つ
+            return await asyncio.shield(inflight.task)
+        finally:
+            inflight.waiters -= 1
+            if inflight.waiters == 0 and not inflight.task.done():
+                logger.info("All callers cancelled, cancelling in-flight run")
+                # キャンセルの完了（上流の実行のキャンセル）を待つ間に届いた同じリクエストが合流しないよう、先に取り除く
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+                inflight.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        合流の統計情報を取得する
+
+        Returns:
+            inflight（実行中）、started（実行した数）、coalesced（合流した数）の件数
+        """
+        return {
+            "inflight": len(self._inflight),
+            "started": self._started,
+            "coalesced": self._coalesced,
+        }
+
+    def _finish(self, key: Hashable, inflight: _InFlight) -> None:
+        """完了した処理を実行中の一覧から取り除く"""
+        if self._inflight.get(key) is inflight:
+            del self._inflight[key]
+        # 待っている呼び出し元がいない場合でも例外が未取得の警告にならないよう取得しておく
+        if not inflight.task.cancelled():
+            inflight.task.exception()
@@ -0,0 +1,137 @@
+"""
+エージェント応答キャッシュ
+
+正規化したプロンプトとエージェント構成をキーに応答を保持し、
+同じ質問に対するエージェントの実行を省略する。
+"""
+
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    キャッシュキー用にプロンプトを正規化する
+
+    NFKC正規化（全角英数字・半角カナの統一）と大文字小文字の統一を行い、
+    句読点・記号を取り除いて空白を1つにまとめる。
+
+    Args:
+        prompt: プロンプト
+
+    Returns:
+        正規化されたプロンプト
+    """
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = "".join(
+        " " if unicodedata.category(char).startswith("P") else char
+        for char in text
+    )
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+class ResponseCache:
+    """
+    件数上限付きのLRU + TTLキャッシュ
+
+    スレッドプールから呼ばれる同期処理でも共有できるよう、操作はロックで保護する。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600):
+        """
+        初期化
+
+        Args:
+            max_entries: 保持するエントリ数の上限
+            ttl_seconds: エントリの有効期間（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def make_key(prompt: str, config: str = "") -> str:
+        """
+        正規化したプロンプトとエージェント構成からキャッシュキーを作成する
+
+        Args:
+            prompt: プロンプト
+            config: エージェント構成を表す文字列（モデル名・指示など）
+
+        Returns:
+            キャッシュキー
+        """
+        payload = f"{config}\x00{normalize_prompt(prompt)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        キャッシュから値を取得する
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            キャッシュされた値。存在しないか期限切れの場合はNone
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        キャッシュに値を保存する
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キャッシュの統計情報を取得する
+
+        Returns:
+            hits、misses、evictions、expirations、size の件数
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,306 @@
+"""
+エージェント実行のヘッジングとサーキットブレーカー
+
+エージェントの実行にリクエスト単位の期限を設け、最初の実行が最近の実行時間の上位パーセンタイルを超えても
+完了しない場合は2つ目の実行（ヘッジ）を開始して、先に成功した方を採用し、もう一方はキャンセルする。
+実行の失敗が続いた場合は回路を開き、一定時間は上流に送らずに即座に失敗させる（呼び出し元は基本テンプレートや
+キャッシュ済みの応答で代替する）。時間が経過すると1件だけ試行し、成功すれば回路を閉じる。
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 回路の状態
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """上流の失敗が続いているため、実行せずに即座に失敗させた"""
+
+    def __init__(self, retry_after: float):
+        """
+        初期化
+
+        Args:
+            retry_after: 回路が試行を再開するまでの秒数
+        """
+        super().__init__(f"Agent backend is unavailable, retry after {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """連続した失敗の回数で開くサーキットブレーカー"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: float = 30):
+        """
+        初期化
+
+        Args:
+            failure_threshold: 回路を開く連続した失敗の回数
+            reset_timeout_seconds: 回路を開いてから試行を再開するまでの秒数（試行が応答しない場合の再試行の間隔も兼ねる）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._opens = 0
+
+    def is_open(self) -> bool:
+        """
+        実行を即座に拒否する状態かを判定する（試行の権利は消費しない）
+
+        Returns:
+            回路が開いていて試行を再開する時刻前の場合、または試行中の場合はTrue
+        """
+        now = time.monotonic()
+        if self.state == CIRCUIT_OPEN:
+            return now < self._opened_at + self.reset_timeout_seconds
+        if self.state == CIRCUIT_HALF_OPEN:
+            return self._probe_started_at is not None and now < self._probe_started_at + self.reset_timeout_seconds
+        return False
+
+    def allow(self) -> bool:
+        """
+        実行してよいかを判定する（試行を再開する場合は、この呼び出し元が試行の権利を得る）
+
+        Returns:
+            実行してよい場合はTrue。Trueの場合は record_success または record_failure で結果を記録する
+        """
+        if self.is_open():
+            return False
+        if self.state != CIRCUIT_CLOSED:
+            self.state = CIRCUIT_HALF_OPEN
+            self._probe_started_at = time.monotonic()
+            logger.info("Circuit half-open, sending a probe run")
+        return True
+
+    def record_success(self) -> None:
+        """実行の成功を記録し、回路を閉じる"""
+        if self.state != CIRCUIT_CLOSED:
+            logger.info("Circuit closed after a successful probe run")
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        """実行の失敗を記録し、連続した失敗が上限に達した場合（試行中の場合は1回）は回路を開く"""
+        self._failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                self._opens += 1
+                logger.warning(f"Circuit opened after {self._failures} consecutive failures")
+            self.state = CIRCUIT_OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+
+    def retry_after(self) -> float:
+        """
+        試行を再開するまでの秒数
+
+        Returns:
+            秒数（回路が閉じている場合は0）
+        """
+        if self.state == CIRCUIT_CLOSED:
+            return 0.0
+        started = self._probe_started_at if self.state == CIRCUIT_HALF_OPEN and self._probe_started_at else self._opened_at
+        return max(started + self.reset_timeout_seconds - time.monotonic(), 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        サーキットブレーカーの統計情報を取得する
+
+        Returns:
+            open（開いている場合は1）、half_open（試行中の場合は1）、consecutive_failures、opens（開いた回数）
+        """
+        return {
+            "open": int(self.state == CIRCUIT_OPEN),
+            "half_open": int(self.state == CIRCUIT_HALF_OPEN),
+            "consecutive_failures": self._failures,
+            "opens": self._opens,
+        }
+
+class RunGuard:
+    """
+    期限・ヘッジング・サーキットブレーカーによるエージェント実行の保護
+
+    イベントループ上からのみ使用する。
+    """
+
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker] = None,
+        deadline_seconds: Optional[float] = 120,
+        hedging: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay_seconds: float = 1.0,
+        window_size: int = 200
+    ):
+        """
+        初期化
+
+        Args:
+            breaker: サーキットブレーカー（省略時は回路を開かない）
+            deadline_seconds: リクエスト単位の期限（秒）。Noneの場合は期限なし
+            hedging: ヘッジの実行を行うか
+            hedge_percentile: ヘッジを開始する実行時間のパーセンタイル（0〜1）
+            hedge_min_samples: ヘッジを開始するのに必要な実行時間の記録数（記録が少ない間はヘッジしない）
+            hedge_min_delay_seconds: ヘッジを開始するまでの最短の秒数
+            window_size: パーセンタイルの計算に使用する直近の実行時間の記録数
+        """
+        self.breaker = breaker
+        self.deadline_seconds = deadline_seconds
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self._latencies: Deque[float] = deque(maxlen=window_size)
+        self._runs = 0
+        self._hedges = 0
+        self._hedges_skipped = 0
+        self._hedge_wins = 0
+        self._timeouts = 0
+        self._failures = 0
+        self._rejected = 0
+
+    def circuit_open(self) -> bool:
+        """
+        回路が開いていて、実行を即座に拒否する状態かを判定する
+
+        Returns:
+            拒否する状態の場合はTrue
+        """
+        return self.breaker is not None and self.breaker.is_open()
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        ヘッジを開始するまでの秒数
+
+        Returns:
+            直近の成功した実行時間の hedge_percentile パーセンタイル（hedge_min_delay_seconds 以上）。
+            記録が hedge_min_samples 未満の場合はNone
+        """
+        if not self._latencies or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(max(math.ceil(self.hedge_percentile * len(ordered)) - 1, 0), len(ordered) - 1)
+        return max(ordered[index], self.hedge_min_delay_seconds)
+
+    async def run(
+        self,
+        attempt: Callable[[], Awaitable[T]],
+        is_failure: Optional[Callable[[T], bool]] = None,
+        hedge: bool = True,
+        before_hedge: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> T:
+        """
+        実行を保護して行う
+
+        Args:
+            attempt: 実行を1回行うコルーチンを返す関数（ヘッジする場合は2回呼び出す）。
+                キャンセルされた場合は自身が作成したリソースを解放すること
+            is_failure: 正常に返った結果を失敗として扱うかを判定する関数（実行の状態が FAILED の場合など）
+            hedge: ヘッジしてよいか（同じスレッドで2つの実行を行えない場合などはFalse）
+            before_hedge: ヘッジを開始する直前に呼び出す関数。Falseを返した場合はヘッジしない
+                （ヘッジの実行のクォータを予約できない場合など）
+
+        Returns:
+            先に成功した実行の結果（すべて失敗した場合は最後に完了した実行の結果）
+
+        Raises:
+            CircuitOpenError: 回路が開いている場合
+            TimeoutError: deadline_seconds 以内に実行が完了しなかった場合（実行はキャンセルする）
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            self._rejected += 1
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.deadline_seconds if self.deadline_seconds else None
+        delay = self.hedge_delay() if self.hedging and hedge else None
+        hedge_at = start + delay if delay is not None else None
+        self._runs += 1
+        tasks: Dict[asyncio.Future, float] = {asyncio.ensure_future(attempt()): start}
+        last: Optional[asyncio.Future] = None
+        try:
+            while tasks:
+                timers = [at for at in (hedge_at, deadline) if at is not None]
+                timeout = max(min(timers) - loop.time(), 0) if timers else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    started = tasks.pop(task)
+                    if task.exception() is None and not (is_failure is not None and is_failure(task.result())):
+                        self._latencies.append(loop.time() - started)
+                        if started != start:
+                            self._hedge_wins += 1
+                        self._record(True)
+                        return task.result()
+                    last = task
+
+                now = loop.time()
+                if deadline is not None and now >= deadline:
+                    self._timeouts += 1
+                    self._record(False)
+                    raise TimeoutError(f"Agent run did not complete within {self.deadline_seconds} seconds")
+                if hedge_at is not None and now >= hedge_at and tasks:
+                    hedge_at = None
+                    if before_hedge is None or await before_hedge():
+                        self._hedges += 1
+                        logger.info(f"Agent run exceeded {delay:.2f}s, starting a hedged run")
+                        tasks[asyncio.ensure_future(attempt())] = now
+                    else:
+                        self._hedges_skipped += 1
+                        logger.info(f"Agent run exceeded {delay:.2f}s, skipping the hedged run")
+
+            self._record(False)
+            return last.result()
+        finally:
+            # 採用しなかった実行はキャンセルする
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        実行の保護の統計情報を取得する
+
+        Returns:
+            runs（実行数）、hedges（ヘッジした数）、hedges_skipped（before_hedge によりヘッジしなかった数）、
+            hedge_wins（ヘッジが先に成功した数）、timeouts（期限切れの数）、
+            failures（失敗した数）、rejected（回路が開いていて拒否した数）、hedge_delay_seconds（現在のヘッジまでの秒数）と
+            サーキットブレーカーの統計
+        """
+        stats: Dict[str, Any] = {
+            "runs": self._runs,
+            "hedges": self._hedges,
+            "hedges_skipped": self._hedges_skipped,
+            "hedge_wins": self._hedge_wins,
+            "timeouts": self._timeouts,
+            "failures": self._failures,
+            "rejected": self._rejected,
+            "hedge_delay_seconds": self.hedge_delay() or 0.0,
+        }
+        if self.breaker is not None:
+            stats.update({f"circuit_{key}": value for key, value in self.breaker.stats().items()})
+        return stats
+
+    def _record(self, success: bool) -> None:
+        """実行の結果をサーキットブレーカーに記録する"""
+        if success:
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return
+        self._failures += 1
+        if self.breaker is not None:
+            self.breaker.record_failure()
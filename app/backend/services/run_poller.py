@@ -0,0 +1,93 @@
+"""
+エージェント実行のポーリング方針
+
+実行の開始直後は短い間隔で状態を確認し、その後はジッター付きの指数バックオフで間隔を広げる。
+短い実行は完了をすぐに検知し、長い実行では状態確認の呼び出し回数を抑える。
+"""
+
+import random
+from typing import Dict, Iterator
+
+class RunPoller:
+    """
+    エージェント実行の状態確認の間隔と、実行ごとの状態確認回数の統計
+
+    統計はイベントループ上からのみ更新する。
+    """
+
+    def __init__(
+        self,
+        initial_interval_seconds: float = 0.2,
+        max_interval_seconds: float = 2.0,
+        backoff_factor: float = 1.5,
+        fast_polls: int = 3,
+        jitter_ratio: float = 0.2,
+        timeout_seconds: float = 300
+    ):
+        """
+        初期化
+
+        Args:
+            initial_interval_seconds: 実行開始直後の状態確認の間隔（秒）
+            max_interval_seconds: 状態確認の間隔の上限（秒）
+            backoff_factor: fast_polls 回を超えた後、確認ごとに間隔に掛ける倍率
+            fast_polls: initial_interval_seconds の間隔で確認する回数
+            jitter_ratio: 間隔をランダムにずらす割合（0.2 の場合は ±20%）
+            timeout_seconds: 1回の実行の完了を待つ上限（秒）
+        """
+        self.initial_interval_seconds = initial_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.backoff_factor = backoff_factor
+        self.fast_polls = fast_polls
+        self.jitter_ratio = jitter_ratio
+        self.timeout_seconds = timeout_seconds
+        self._runs = 0
+        self._status_calls = 0
+        self._max_status_calls = 0
+        self._timeouts = 0
+
+    def intervals(self) -> Iterator[float]:
+        """
+        状態確認の間隔を順に返す
+
+        Yields:
+            次の状態確認までの待ち時間（秒）
+        """
+        interval = self.initial_interval_seconds
+        polls = 0
+        while True:
+            polls += 1
+            if polls > self.fast_polls:
+                interval = min(interval * self.backoff_factor, self.max_interval_seconds)
+            jitter = random.uniform(-self.jitter_ratio, self.jitter_ratio)
+            yield max(interval * (1 + jitter), 0)
+
+    def record(self, status_calls: int, timed_out: bool = False) -> None:
+        """
+        1回の実行の状態確認回数を記録する
+
+        Args:
+            status_calls: 実行の完了（またはタイムアウト）までに状態を確認した回数
+            timed_out: 実行がタイムアウトした場合はTrue
+        """
+        self._runs += 1
+        self._status_calls += status_calls
+        self._max_status_calls = max(self._max_status_calls, status_calls)
+        if timed_out:
+            self._timeouts += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        ポーリングの統計情報を取得する
+
+        Returns:
+            runs、status_calls、max_status_calls、timeouts の件数と、
+            avg_status_calls（実行あたりの平均状態確認回数）
+        """
+        return {
+            "runs": self._runs,
+            "status_calls": self._status_calls,
+            "max_status_calls": self._max_status_calls,
+            "timeouts": self._timeouts,
+            "avg_status_calls": self._status_calls / self._runs if self._runs else 0.0,
+        }
@@ -0,0 +1,232 @@
+"""
+会話セッションストア
+
+セッションIDとエージェントのスレッドIDの対応を保持し、同じ会話の後続メッセージで
+スレッドを再利用できるようにする。
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Session:
+    """会話セッション"""
+    session_id: str
+    thread_id: str
+    last_used: float
+
+class SessionStore:
+    """
+    セッションIDとスレッドIDの対応表
+
+    メモリ上のLRUで保持し、上限数を超えた場合は最も長く使われていないセッションから破棄する。
+    一定時間使われなかったセッションはアイドル期限切れとして扱い、evict_expired（リーパーの定期処理から呼び出す）で破棄する。
+    persist_path を指定した場合はSQLiteにも書き込み、再起動後や他のワーカーからも参照できるようにする。
+    SQLiteの読み書きはイベントループをブロックしないようスレッドプールで行う。
+    その場合、メモリ上限による追い出しはキャッシュからの除外のみで、セッション自体はアイドル期限まで有効とする。
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl_seconds: float = 1800,
+        persist_path: Optional[str] = None,
+        on_expire: Optional[Callable[[str], None]] = None
+    ):
+        """
+        初期化
+
+        Args:
+            max_sessions: 同時に保持するセッションの上限数
+            idle_ttl_seconds: 最終利用からセッションを破棄するまでの秒数
+            persist_path: セッションを永続化するSQLiteファイルのパス（省略時はメモリのみ）
+            on_expire: セッションが破棄されたときにスレッドIDを受け取るコールバック
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.persist_path = persist_path
+        self.on_expire = on_expire
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions "
+                    "(session_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, last_used REAL NOT NULL)"
+                )
+
+    @staticmethod
+    def new_session_id() -> str:
+        """
+        新しいセッションIDを発行する
+
+        Returns:
+            推測困難なセッションID
+        """
+        return uuid.uuid4().hex
+
+    async def get_thread_id(self, session_id: str) -> Optional[str]:
+        """
+        セッションに対応するスレッドIDを取得し、最終利用時刻を更新する
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            スレッドID。未知または期限切れのセッションの場合はNone
+        """
+        now = time.time()
+        session = self._sessions.get(session_id)
+        if session is not None and session.last_used <= now - self.idle_ttl_seconds:
+            # 定期処理の前に期限切れになったセッションは、ここで個別に破棄する
+            self._forget(session_id)
+            if self._db is None:
+                self._notify_expired(session.thread_id)
+            session = None
+        if session is None:
+            if self._db is None:
+                return None
+            session = await asyncio.to_thread(self._load, session_id, now)
+            if session is None:
+                return None
+
+        session.last_used = now
+        self._remember(session)
+        await self._write(session)
+        return session.thread_id
+
+    async def save(self, session_id: str, thread_id: str) -> None:
+        """
+        セッションとスレッドの対応を保存する
+
+        Args:
+            session_id: セッションID
+            thread_id: スレッドID
+        """
+        session = Session(session_id=session_id, thread_id=thread_id, last_used=time.time())
+        self._remember(session)
+        await self._write(session)
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """
+        セッション単位のロックを取得する
+
+        同じスレッドで複数の実行を同時に行うことはできないため、同一セッションのメッセージは直列に処理する。
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            セッションに対応するasyncio.Lock
+        """
+        if session_id not in self._locks and len(self._locks) >= self.max_sessions:
+            # 保存されずに終わったセッションのロックが溜まらないよう、未使用のものを掃除する
+            for stale_id in [sid for sid, lock in self._locks.items()
+                             if sid not in self._sessions and not lock.locked()]:
+                del self._locks[stale_id]
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    async def evict_expired(self, now: Optional[float] = None) -> int:
+        """
+        アイドル期限切れのセッションを破棄する
+
+        永続化している場合、SQLiteからの削除はイベントループをブロックしないようスレッドプールで行う。
+
+        Args:
+            now: 現在時刻（UNIX時間）。省略時は現在時刻
+
+        Returns:
+            破棄したセッション数
+        """
+        now = now if now is not None else time.time()
+        cutoff = now - self.idle_ttl_seconds
+        expired_threads: List[str] = []
+        # OrderedDictは最終利用の古い順に並んでいるため、先頭から期限切れを取り除く
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used > cutoff:
+                break
+            self._forget(session.session_id)
+            # 永続化している場合は他のワーカーが利用中の可能性があるため、期限切れの判定はDBに任せる
+            if self._db is None:
+                expired_threads.append(session.thread_id)
+        if self._db is not None:
+            expired_threads.extend(await asyncio.to_thread(self._delete_expired, cutoff))
+
+        for thread_id in expired_threads:
+            self._notify_expired(thread_id)
+        return len(expired_threads)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _remember(self, session: Session) -> None:
+        """セッションをLRUの末尾に登録し、上限を超えた分を破棄する"""
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions.values()))
+            logger.info(f"Session limit reached, evicting session: {oldest.session_id}")
+            self._forget(oldest.session_id)
+            if self._db is None:
+                self._notify_expired(oldest.thread_id)
+
+    def _forget(self, session_id: str) -> None:
+        """セッションをメモリから取り除く"""
+        self._sessions.pop(session_id, None)
+        lock = self._locks.get(session_id)
+        if lock is not None and not lock.locked():
+            del self._locks[session_id]
+
+    def _notify_expired(self, thread_id: str) -> None:
+        """破棄されたセッションのスレッドIDをコールバックに通知する"""
+        if self.on_expire is None:
+            return
+        try:
+            self.on_expire(thread_id)
+        except Exception as e:
+            logger.error(f"Session expiry callback failed for thread {thread_id}: {str(e)}")
+
+    async def _write(self, session: Session) -> None:
+        """永続化している場合、スレッドプールでセッションを書き込む"""
+        if self._db is not None:
+            await asyncio.to_thread(self._persist, session)
+
+    def _load(self, session_id: str, now: float) -> Optional[Session]:
+        """永続化先からセッションを読み込む（スレッドプールから呼び出す）"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT thread_id, last_used FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or row[1] <= now - self.idle_ttl_seconds:
+            return None
+        return Session(session_id=session_id, thread_id=row[0], last_used=row[1])
+
+    def _delete_expired(self, cutoff: float) -> List[str]:
+        """永続化先から期限切れのセッションを削除し、そのスレッドIDを返す"""
+        with self._db_lock, self._db:
+            rows = self._db.execute(
+                "DELETE FROM sessions WHERE last_used <= ? RETURNING thread_id", (cutoff,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _persist(self, session: Session) -> None:
+        """セッションを永続化先に書き込む（スレッドプールから呼び出す）"""
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, thread_id, last_used) VALUES (?, ?, ?)",
+                (session.session_id, session.thread_id, session.last_used)
+            )
@@ -0,0 +1,122 @@
+"""
+OpenAPIスペック・ツールレジストリ
+
+OpenAPIスペックファイルを一度だけ読み込み、スペックから作成したツールをプロセス内で共有する。
+ファイルの更新日時（mtime）とサイズが変わった場合は、次に取得するときに読み込み直す。
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class SpecRegistry:
+    """
+    OpenAPIスペックとツールのレジストリ
+
+    取得したスペックとツールはすべての呼び出し元で共有するため、呼び出し元で変更しないこと。
+    スレッドプールから呼ばれる同期処理でも共有できるよう、操作はロックで保護する。
+    """
+
+    def __init__(self, resolve_refs: bool = True):
+        """
+        初期化
+
+        Args:
+            resolve_refs: Trueの場合は読み込み時に $ref をすべて解決し、通常の辞書として保持する。
+                Falseの場合は参照先を最初にアクセスしたときに解決する（jsonrefのプロキシ）
+        """
+        self.resolve_refs = resolve_refs
+        self._specs: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self._tools: Dict[Tuple[str, str], Tuple[Tuple[int, int], Any]] = {}
+        self._lock = threading.RLock()
+        self._loads = 0
+        self._builds = 0
+
+    def load_spec(self, path: str) -> Dict[str, Any]:
+        """
+        OpenAPIスペックを取得する（未読み込みか、ファイルが更新されている場合のみ読み込む）
+
+        Args:
+            path: スペックファイルのパス
+
+        Returns:
+            OpenAPIスペック辞書
+
+        Raises:
+            FileNotFoundError: ファイルが存在しない場合
+            ValueError: JSONパースエラー
+        """
+        version = self._file_version(path)
+        with self._lock:
+            entry = self._specs.get(path)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+            # jsonrefは読み込みに時間がかかるため、スペックを初めて読み込むときに読み込む
+            import jsonref
+
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            if self.resolve_refs:
+                spec = jsonref.loads(text, proxies=False, lazy_load=False)
+            else:
+                spec = jsonref.loads(text)
+            self._specs[path] = (version, spec)
+            self._loads += 1
+            logger.info(f"Loaded OpenAPI specification: {path}")
+            return spec
+
+    def get_tool(self, path: str, name: str, build: Callable[[], Any]) -> Any:
+        """
+        スペックファイルから作成したツールを取得する（未作成か、ファイルが更新されている場合のみ作成する）
+
+        Args:
+            path: ツールの元になるスペックファイルのパス（更新の検知に使用する）
+            name: ツールの名前（同じファイルから複数のツールを作成する場合の区別に使用する）
+            build: ツールを作成する関数
+
+        Returns:
+            共有のツール
+        """
+        key = (path, name)
+        version = self._file_version(path)
+        with self._lock:
+            entry = self._tools.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+            tool = build()
+            self._tools[key] = (version, tool)
+            self._builds += 1
+            logger.info(f"Built tool '{name}' from OpenAPI specification: {path}")
+            return tool
+
+    def clear(self) -> None:
+        """保持しているスペックとツールをすべて破棄する"""
+        with self._lock:
+            self._specs.clear()
+            self._tools.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        レジストリの統計情報を取得する
+
+        Returns:
+            loads（スペックの読み込み回数）、builds（ツールの作成回数）、specs・tools（保持している件数）
+        """
+        with self._lock:
+            return {
+                "loads": self._loads,
+                "builds": self._builds,
+                "specs": len(self._specs),
+                "tools": len(self._tools),
+            }
+
+    def _file_version(self, path: str) -> Tuple[int, int]:
+        """ファイルの更新を検知するためのバージョン（更新日時とサイズ）を返す"""
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
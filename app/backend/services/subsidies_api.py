@@ -0,0 +1,266 @@
+"""
+補助金API（jgrants）クライアント
+
+接続プールを共有するHTTPクライアントで補助金APIを呼び出し、正規化したクエリパラメーターをキーに
+応答をキャッシュする。期限切れのキャッシュはETagで再検証し、変更がなければ本文を再取得しない。
+fixture_dir を指定した場合は上流のAPIを呼ばず、スナップショットファイルから応答する（オフライン検証用）。
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import re
+import time
+import unicodedata
+from urllib.parse import quote
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from services.request_coalescer import RequestCoalescer
+from services.response_cache import ResponseCache
+from services.subsidy_catalog import SubsidyCatalog
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 補助金APIのベースURL
+DEFAULT_BASE_URL = "https://api.jgrants-portal.go.jp/exp/v1/public"
+
+# 補助金一覧APIのクエリパラメーターの既定値（OpenAPIスペックの default）
+LIST_DEFAULTS: Dict[str, str] = {
+    "keyword": "補助金",
+    "sort": "created_date",
+    "order": "DESC",
+    "acceptance": "1",
+}
+
+# 補助金IDの形式（OpenAPIスペックの id: 英数字・最大18文字）
+SUBSIDY_ID_PATTERN = re.compile(r"^[A-Za-z0-9]{1,18}$")
+
+class SubsidiesApiError(Exception):
+    """補助金APIの呼び出しに失敗した"""
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, str]:
+    """
+    キャッシュキー用にクエリパラメーターを正規化する
+
+    値のないパラメーターを除き、既定値を補い、値をNFKC正規化して前後の空白を取り除く。
+
+    Args:
+        params: クエリパラメーター
+
+    Returns:
+        正規化したクエリパラメーター
+    """
+    normalized = dict(LIST_DEFAULTS)
+    for name, value in params.items():
+        if value is None:
+            continue
+        text = " ".join(unicodedata.normalize("NFKC", str(value)).split())
+        if text:
+            normalized[name] = text
+    return normalized
+
+class SubsidiesApiClient:
+    """
+    補助金APIクライアント
+
+    応答は ttl_seconds の間はそのまま返し、その後 stale_ttl_seconds までは保持してETagで再検証する。
+    上流のAPIが失敗した場合は保持している応答を返す。処理中の同じ呼び出しは1回の実行にまとめる。
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        ttl_seconds: float = 300,
+        stale_ttl_seconds: float = 3600,
+        max_entries: int = 1024,
+        pool_size: int = 20,
+        timeout_seconds: float = 10,
+        fixture_dir: Optional[str] = None
+    ):
+        """
+        初期化
+
+        Args:
+            base_url: 補助金APIのベースURL（ローカルのスタブサーバーも指定できる）
+            ttl_seconds: 応答を再検証せずに返す秒数
+            stale_ttl_seconds: 応答を再検証用に保持する秒数
+            max_entries: キャッシュする応答の上限数
+            pool_size: 同時に保持するHTTP接続の上限数
+            timeout_seconds: 上流のAPI呼び出しのタイムアウト（秒）
+            fixture_dir: 指定した場合は上流のAPIを呼ばず、このディレクトリのスナップショットファイルから応答する
+        """
+        self.base_url = base_url.rstrip("/")
+        self.ttl_seconds = ttl_seconds
+        self.pool_size = pool_size
+        self.timeout_seconds = timeout_seconds
+        self.fixture_dir = fixture_dir
+        self._cache = ResponseCache(max_entries=max_entries, ttl_seconds=max(ttl_seconds, stale_ttl_seconds))
+        self._coalescer = RequestCoalescer()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._fixtures: Optional[SubsidyCatalog] = None
+        self._fixtures_lock = asyncio.Lock()
+        self._upstream_calls = 0
+        self._revalidated = 0
+        self._stale_served = 0
+
+    async def list_subsidies(self, **params: Any) -> Dict[str, Any]:
+        """
+        補助金を検索する（補助金一覧API）
+
+        Args:
+            **params: クエリパラメーター（keyword、sort、order、acceptance、use_purpose、industry、
+                target_number_of_employees、target_area_search）
+
+        Returns:
+            補助金一覧APIの応答
+
+        Raises:
+            SubsidiesApiError: 上流のAPIの呼び出しに失敗し、保持している応答もない場合
+        """
+        normalized = normalize_params(params)
+        return await self._get("/subsidies", normalized)
+
+    async def get_subsidy(self, subsidy_id: str) -> Dict[str, Any]:
+        """
+        補助金の詳細を取得する（補助金詳細API）
+
+        Args:
+            subsidy_id: 補助金ID
+
+        Returns:
+            補助金詳細APIの応答
+
+        Raises:
+            SubsidiesApiError: 補助金IDの形式が正しくない場合（APIもキャッシュも使用しない）、
+                または上流のAPIの呼び出しに失敗し、保持している応答もない場合
+        """
+        # IDはモデルが指定するため、パスやクエリを書き換えられないよう形式を確認してからURLに埋め込む
+        subsidy_id = subsidy_id.strip()
+        if not SUBSIDY_ID_PATTERN.match(subsidy_id):
+            raise SubsidiesApiError(f"Invalid subsidy ID: {subsidy_id!r}")
+        return await self._get(f"/subsidies/id/{quote(subsidy_id, safe='')}", {})
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キャッシュと上流のAPI呼び出しの統計を取得する
+
+        Returns:
+            キャッシュの統計に加え、upstream_calls（上流の呼び出し数）、revalidated（304で再検証した数）、
+            stale_served（上流の失敗時に保持していた応答を返した数）
+        """
+        return {
+            **self._cache.stats(),
+            "upstream_calls": self._upstream_calls,
+            "revalidated": self._revalidated,
+            "stale_served": self._stale_served,
+        }
+
+    async def close(self) -> None:
+        """HTTPセッションを閉じる"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get(self, path: str, params: Dict[str, str]) -> Dict[str, Any]:
+        """キャッシュを使用してGETリクエストを送信する"""
+        key = json.dumps([path, sorted(params.items())], ensure_ascii=False)
+        entry: Optional[Tuple[float, Optional[str], Dict[str, Any]]] = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[2]
+        return await self._coalescer.run(key, lambda: self._fetch(key, path, params, entry))
+
+    async def _fetch(
+        self,
+        key: str,
+        path: str,
+        params: Dict[str, str],
+        entry: Optional[Tuple[float, Optional[str], Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """上流のAPI（またはスナップショット）から応答を取得してキャッシュする"""
+        if self.fixture_dir:
+            try:
+                data = await self._fixture_response(path, params)
+            except (OSError, ValueError) as e:
+                # モデルが指定した並べ替えなどをカタログが受け付けない場合も、上流のAPIのエラーと同様に扱う
+                raise SubsidiesApiError(f"Subsidies fixture request failed: {str(e)}") from e
+            self._cache.set(key, (time.monotonic(), None, data))
+            return data
+
+        etag = entry[1] if entry is not None else None
+        headers = {"If-None-Match": etag} if etag else {}
+        try:
+            self._upstream_calls += 1
+            async with self._get_session().get(
+                f"{self.base_url}{path}",
+                params=params,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)
+            ) as response:
+                if response.status == 304 and entry is not None:
+                    self._revalidated += 1
+                    data = entry[2]
+                elif response.status == 200:
+                    data = await response.json(content_type=None)
+                    etag = response.headers.get("ETag")
+                else:
+                    raise SubsidiesApiError(f"Subsidies API returned {response.status}: {await response.text()}")
+        except (aiohttp.ClientError, TimeoutError, SubsidiesApiError, ValueError) as e:
+            if entry is not None:
+                logger.warning(f"Subsidies API request failed, serving cached response: {str(e)}")
+                self._stale_served += 1
+                return entry[2]
+            if isinstance(e, SubsidiesApiError):
+                raise
+            raise SubsidiesApiError(f"Subsidies API request failed: {str(e)}") from e
+
+        self._cache.set(key, (time.monotonic(), etag, data))
+        return data
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """接続プールを持つHTTPセッションを取得する（イベントループ上で初めて使うときに作成する）"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    async def _fixture_response(self, path: str, params: Dict[str, str]) -> Dict[str, Any]:
+        """
+        スナップショットファイルから応答を作成する
+
+        一覧はキーワード・補助対象地域・募集期間内の絞り込みと並べ替えのみに対応する。
+
+        Raises:
+            OSError: スナップショットファイルを読み込めない場合
+            ValueError: スナップショットファイルの形式、または並べ替える項目や順序が不正な場合
+        """
+        catalog = await self._load_fixtures()
+
+        if path.startswith("/subsidies/id/"):
+            record = catalog.get(path.rsplit("/", 1)[-1])
+            matched = [record] if record is not None else []
+            return {"metadata": {"resultset": {"count": len(matched)}}, "result": matched}
+
+        sort = params["sort"] if params["sort"] != "created_date" else "acceptance_start_datetime"
+        return catalog.search(
+            keyword=params["keyword"],
+            area=params.get("target_area_search"),
+            deadline_from=datetime.datetime.now(datetime.timezone.utc) if params["acceptance"] == "1" else None,
+            sort=sort,
+            order=params["order"].upper(),
+            limit=max(len(catalog), 1)
+        )
+
+    async def _load_fixtures(self) -> SubsidyCatalog:
+        """スナップショットのカタログを取得する（初めて使うときにスレッドプールで読み込む）"""
+        async with self._fixtures_lock:
+            if self._fixtures is None:
+                catalog = SubsidyCatalog()
+                await asyncio.to_thread(catalog.load, self.fixture_dir)
+                self._fixtures = catalog
+        return self._fixtures
@@ -0,0 +1,463 @@
+"""
+ローカル補助金カタログ
+
+jgrants の補助金一覧APIと同じ形式のスナップショットファイルを読み込み、プロセス内で検索する。
+キーワードは文字n-gramの転置インデックス、受付終了日時・補助上限額はソート済みインデックス、
+補助対象地域・従業員数は値ごとのインデックスで絞り込み、エージェントを介さずに構造化された検索に応答する。
+"""
+
+import bisect
+import datetime
+import glob
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.response_cache import normalize_prompt
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# キーワード検索の対象とする項目
+SEARCH_FIELDS = ("title", "name", "detail", "use_purpose", "industry", "institution_name")
+
+# 並べ替えに使用できる項目
+SORT_FIELDS = ("acceptance_end_datetime", "acceptance_start_datetime", "subsidy_max_limit")
+
+# 補助対象地域の区切り（「 / 」）
+AREA_SEPARATOR = "/"
+
+# 全国を対象とする補助対象地域
+NATIONWIDE = "全国"
+
+# 地方ごとの都道府県
+REGION_PREFECTURES: Dict[str, Tuple[str, ...]] = {
+    "北海道地方": ("北海道",),
+    "東北地方": ("青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県"),
+    "関東・甲信越地方": ("茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県", "新潟県", "山梨県", "長野県"),
+    "東海・北陸地方": ("富山県", "石川県", "福井県", "岐阜県", "静岡県", "愛知県", "三重県"),
+    "近畿地方": ("滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県"),
+    "中国地方": ("鳥取県", "島根県", "岡山県", "広島県", "山口県"),
+    "四国地方": ("徳島県", "香川県", "愛媛県", "高知県"),
+    "九州・沖縄地方": ("福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県"),
+}
+
+_PREFECTURE_REGION: Dict[str, str] = {
+    prefecture: region
+    for region, prefectures in REGION_PREFECTURES.items()
+    for prefecture in prefectures
+}
+
+# 一致した件数が全体の 1/_DENSE_MATCH_RATIO 以上の場合は、並べ替えにソート済みインデックスを走査する
+_DENSE_MATCH_RATIO = 8
+
+_EMPLOYEES_AT_MOST = re.compile(r"(\d+)[名人]以下")
+_EMPLOYEES_AT_LEAST = re.compile(r"(\d+)[名人]以上")
+
+def parse_employee_range(category: Optional[str]) -> Tuple[float, float]:
+    """
+    従業員数の区分（例: 「50名以下」）を対象となる従業員数の範囲に変換する
+
+    Args:
+        category: 従業員数の区分
+
+    Returns:
+        対象となる従業員数の下限と上限。制約がない、または解釈できない場合は (0, inf)
+    """
+    if not category:
+        return 0, math.inf
+    match = _EMPLOYEES_AT_MOST.search(category)
+    if match:
+        return 0, int(match.group(1))
+    match = _EMPLOYEES_AT_LEAST.search(category)
+    if match:
+        return int(match.group(1)), math.inf
+    return 0, math.inf
+
+def parse_datetime(value: Any) -> Optional[float]:
+    """
+    ISO形式の日時をUNIX時間に変換する（タイムゾーンがない場合はUTCとして扱う）
+
+    Args:
+        value: ISO形式の日時文字列、または datetime
+
+    Returns:
+        UNIX時間。解釈できない場合はNone
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+@dataclass
+class _CatalogIndex:
+    """カタログの検索用インデックス（読み込みのたびに作り直し、差し替える）"""
+    records: List[Dict[str, Any]] = field(default_factory=list)
+    positions: Dict[str, int] = field(default_factory=dict)
+    texts: List[str] = field(default_factory=list)
+    ngrams: Dict[str, Set[int]] = field(default_factory=dict)
+    areas: Dict[str, Set[int]] = field(default_factory=dict)
+    employees: Dict[str, Set[int]] = field(default_factory=dict)
+    employee_ranges: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    # 並べ替え・範囲検索に使用する項目の位置ごとの値と、値と位置の組を値の昇順に並べたソート済みインデックス
+    values: Dict[str, List[Optional[float]]] = field(default_factory=dict)
+    sorted_values: Dict[str, List[Tuple[float, int]]] = field(default_factory=dict)
+    # 地域（都道府県・地方・全国とカタログ内の地域）ごとの検索結果と、従業員数の区分の境界（昇順）で
+    # 区切った範囲ごとの検索結果（いずれも作成時に計算する）
+    area_matches: Dict[str, Set[int]] = field(default_factory=dict)
+    employee_bounds: List[float] = field(default_factory=list)
+    employee_matches: List[Set[int]] = field(default_factory=list)
+
+class SubsidyCatalog:
+    """
+    補助金情報のローカルカタログ
+
+    インデックスは読み込みのたびに新しく作成して差し替えるため、検索中に読み込みが行われても
+    検索は読み込み前か後のどちらかの一貫した状態を参照する。
+    """
+
+    def __init__(self, ngram_size: int = 2):
+        """
+        初期化
+
+        Args:
+            ngram_size: キーワード検索に使用する文字n-gramの長さ
+        """
+        self.ngram_size = ngram_size
+        self._index = _CatalogIndex()
+
+    def load(self, path: str) -> int:
+        """
+        スナップショットファイルを読み込み、カタログを置き換える
+
+        Args:
+            path: スナップショットのJSONファイル、またはJSONファイルを含むディレクトリのパス。
+                ファイルは補助金一覧APIの応答（"result" に補助金情報のリストを持つ）または補助金情報のリスト
+
+        Returns:
+            読み込んだ補助金情報の件数
+        """
+        paths = sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+        records: List[Dict[str, Any]] = []
+        for file_path in paths:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            records.extend((data.get("result") or []) if isinstance(data, dict) else data)
+        count = self.replace(records)
+        logger.info(f"Loaded {count} subsidies from {len(paths)} snapshot file(s) at {path}")
+        return count
+
+    def replace(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        補助金情報でカタログを置き換える
+
+        同じIDの補助金情報が複数ある場合は後のものを使用し、IDがないものは除外する。
+
+        Args:
+            records: 補助金情報の辞書の列
+
+        Returns:
+            カタログの件数
+        """
+        unique: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            if not isinstance(record, dict) or not record.get("id"):
+                logger.warning(f"Skipping subsidy record without id: {str(record)[:100]}")
+                continue
+            unique[record["id"]] = record
+        self._index = self._build(list(unique.values()))
+        return len(unique)
+
+    def search(
+        self,
+        keyword: Optional[str] = None,
+        area: Optional[str] = None,
+        employees: Optional[int] = None,
+        deadline_from: Optional[datetime.datetime] = None,
+        deadline_to: Optional[datetime.datetime] = None,
+        min_limit: Optional[float] = None,
+        max_limit: Optional[float] = None,
+        sort: str = "acceptance_end_datetime",
+        order: str = "ASC",
+        offset: int = 0,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        条件に一致する補助金情報を検索する
+
+        Args:
+            keyword: 補助金名などに含まれるキーワード（空白区切りですべてを含むものに絞り込む）
+            area: 事業所の地域（都道府県または地方）。全国対象と、その地域を含む補助金に絞り込む
+            employees: 従業員数。この従業員数を対象とする補助金に絞り込む（区分がないものを含む）
+            deadline_from: 受付終了日時の下限（この日時以降に締め切る補助金）
+            deadline_to: 受付終了日時の上限（この日時までに締め切る補助金）
+            min_limit: 補助上限額の下限（円）
+            max_limit: 補助上限額の上限（円）
+            sort: 並べ替える項目（SORT_FIELDS のいずれか。値がないものは最後になる）
+            order: 並べ替えの順序（"ASC" または "DESC"）
+            offset: 返す結果の開始位置
+            limit: 返す結果の最大件数
+
+        Returns:
+            補助金一覧APIと同じ形式の辞書（"metadata" の件数は条件に一致した総数）
+
+        Raises:
+            ValueError: 並べ替える項目または順序が不正な場合
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+        if order not in ("ASC", "DESC"):
+            raise ValueError("order must be ASC or DESC")
+        index = self._index
+
+        # 条件ごとに（件数、該当する位置の集合、位置が該当するかの判定）を求め、
+        # 最も件数の少ない条件の集合を残りの条件の判定で絞り込む
+        filters: List[Tuple[int, Callable[[], Set[int]], Callable[[int], bool]]] = []
+        terms = self._normalize(keyword).split() if keyword else []
+        if terms:
+            filters.append(self._set_filter(self._match_keyword(index, terms)))
+        if area:
+            filters.append(self._set_filter(self._match_area(index, area)))
+        if employees is not None:
+            filters.append(self._set_filter(self._match_employees(index, employees)))
+        if deadline_from is not None or deadline_to is not None:
+            filters.append(self._range_filter(
+                index, "acceptance_end_datetime",
+                parse_datetime(deadline_from) if deadline_from is not None else None,
+                parse_datetime(deadline_to) if deadline_to is not None else None
+            ))
+        if min_limit is not None or max_limit is not None:
+            filters.append(self._range_filter(index, "subsidy_max_limit", min_limit, max_limit))
+
+        matched: Optional[Set[int]] = None
+        if filters:
+            filters.sort(key=lambda f: f[0])
+            matched = filters[0][1]()
+            for _, _, accepts in filters[1:]:
+                matched = {position for position in matched if accepts(position)}
+
+        total = len(index.records) if matched is None else len(matched)
+        positions = self._sorted_positions(index, matched, sort, order == "DESC", offset + limit)
+        return {
+            "metadata": {"resultset": {"count": total}},
+            "result": [index.records[position] for position in positions[offset:offset + limit]],
+        }
+
+    def get(self, subsidy_id: str) -> Optional[Dict[str, Any]]:
+        """
+        補助金情報をIDで取得する
+
+        Args:
+            subsidy_id: 補助金ID
+
+        Returns:
+            補助金情報。カタログにない場合はNone
+        """
+        index = self._index
+        position = index.positions.get(subsidy_id)
+        return index.records[position] if position is not None else None
+
+    def __len__(self) -> int:
+        return len(self._index.records)
+
+    def _build(self, records: List[Dict[str, Any]]) -> _CatalogIndex:
+        """補助金情報から検索用インデックスを作成する"""
+        index = _CatalogIndex(records=records)
+        for field_name in SORT_FIELDS:
+            index.sorted_values[field_name] = []
+            index.values[field_name] = []
+
+        for position, record in enumerate(records):
+            index.positions[record["id"]] = position
+            text = self._normalize(" ".join(
+                str(record[field_name]) for field_name in SEARCH_FIELDS if record.get(field_name)
+            ))
+            index.texts.append(text)
+            for gram in self._ngrams(text):
+                index.ngrams.setdefault(gram, set()).add(position)
+
+            for area in self._split_areas(record.get("target_area_search")):
+                index.areas.setdefault(area, set()).add(position)
+
+            category = record.get("target_number_of_employees") or ""
+            index.employees.setdefault(category, set()).add(position)
+            if category not in index.employee_ranges:
+                index.employee_ranges[category] = parse_employee_range(category)
+
+            for field_name in SORT_FIELDS:
+                value = self._sort_value(record, field_name)
+                index.values[field_name].append(value)
+                if value is not None:
+                    index.sorted_values[field_name].append((value, position))
+
+        for values in index.sorted_values.values():
+            values.sort()
+
+        # 地域の検索結果は既知の地域についてのみ作成時に計算し、検索時には書き換えない
+        # （任意の文字列を指定した検索でメモリが増え続けず、並行する検索からも安全に参照できる）
+        for area in {NATIONWIDE, *_PREFECTURE_REGION, *REGION_PREFECTURES, *index.areas}:
+            matched: Set[int] = set()
+            for target in self._area_targets(area):
+                matched |= index.areas.get(target, set())
+            index.area_matches[area] = matched
+        # 従業員数は区分の境界の間では同じ区分に該当するため、境界ごとに一度だけ計算する
+        ranges = index.employee_ranges.values()
+        index.employee_bounds = sorted(
+            {0, *(lower for lower, _ in ranges), *(upper + 1 for _, upper in ranges if upper != math.inf)}
+        )
+        for bound in index.employee_bounds:
+            matched = set()
+            for category, (lower, upper) in index.employee_ranges.items():
+                if lower <= bound <= upper:
+                    matched |= index.employees[category]
+            index.employee_matches.append(matched)
+        return index
+
+    def _match_keyword(self, index: _CatalogIndex, terms: List[str]) -> Set[int]:
+        """正規化したキーワードのすべての語を含む補助金の位置を返す"""
+        # すべての語のn-gramの転置リストを件数の少ない順に積集合をとって候補を絞り込む
+        postings = [
+            index.ngrams.get(gram, set())
+            for term in terms if len(term) >= self.ngram_size
+            for gram in self._term_ngrams(term)
+        ]
+        if postings:
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = set(range(len(index.records)))
+        # n-gramの一致だけでは語の連続を保証できないため本文で確認する（n文字の語はn-gramの一致で確定する）
+        unverified = [term for term in terms if len(term) != self.ngram_size]
+        if not unverified:
+            return candidates
+        texts = index.texts
+        return {
+            position for position in candidates
+            if all(term in texts[position] for term in unverified)
+        }
+
+    def _match_area(self, index: _CatalogIndex, area: str) -> Set[int]:
+        """指定した地域で利用できる補助金の位置を返す（未知の地域は全国対象の補助金のみ）"""
+        return index.area_matches.get(area.strip(), index.area_matches[NATIONWIDE])
+
+    @staticmethod
+    def _area_targets(area: str) -> Set[str]:
+        """地域で利用できる補助対象地域（全国・その地域・属する地方、地方の場合はその都道府県）を返す"""
+        targets = {NATIONWIDE, area}
+        if area in _PREFECTURE_REGION:
+            targets.add(_PREFECTURE_REGION[area])
+        targets.update(REGION_PREFECTURES.get(area, ()))
+        return targets
+
+    def _match_employees(self, index: _CatalogIndex, employees: int) -> Set[int]:
+        """指定した従業員数を対象とする補助金の位置を返す（作成時に計算した、従業員数を含む範囲の結果）"""
+        position = bisect.bisect_right(index.employee_bounds, employees) - 1
+        return index.employee_matches[position] if position >= 0 else set()
+
+    @staticmethod
+    def _set_filter(matched: Set[int]) -> Tuple[int, Callable[[], Set[int]], Callable[[int], bool]]:
+        """位置の集合による条件"""
+        return len(matched), lambda: matched, matched.__contains__
+
+    @staticmethod
+    def _range_filter(
+        index: _CatalogIndex,
+        field_name: str,
+        lower: Optional[float],
+        upper: Optional[float]
+    ) -> Tuple[int, Callable[[], Set[int]], Callable[[int], bool]]:
+        """ソート済みインデックスによる値の範囲（両端を含む）の条件"""
+        sorted_values = index.sorted_values[field_name]
+        start = 0 if lower is None else bisect.bisect_left(sorted_values, (lower, -1))
+        end = len(sorted_values) if upper is None else bisect.bisect_right(sorted_values, (upper, math.inf))
+        values = index.values[field_name]
+        low = -math.inf if lower is None else lower
+        high = math.inf if upper is None else upper
+
+        def accepts(position: int) -> bool:
+            value = values[position]
+            return value is not None and low <= value <= high
+
+        return max(end - start, 0), lambda: {position for _, position in sorted_values[start:end]}, accepts
+
+    @staticmethod
+    def _sorted_positions(
+        index: _CatalogIndex,
+        matched: Optional[Set[int]],
+        sort: str,
+        descending: bool,
+        count: int
+    ) -> List[int]:
+        """一致した補助金の位置を並べ替え、先頭から count 件を返す（値がないものは最後になる）"""
+        values = index.values[sort]
+        sorted_values = index.sorted_values[sort]
+        if matched is not None and len(matched) * _DENSE_MATCH_RATIO < len(index.records):
+            # 一致が少ない場合は一致したものだけを並べ替える
+            select = heapq.nlargest if descending else heapq.nsmallest
+            positions = select(
+                count,
+                (position for position in matched if values[position] is not None),
+                key=lambda position: (values[position], position)
+            )
+        else:
+            # 一致が多い場合はソート済みインデックスを先頭から走査する
+            ordered = reversed(sorted_values) if descending else sorted_values
+            positions = list(itertools.islice(
+                (position for _, position in ordered if matched is None or position in matched),
+                count
+            ))
+        if len(positions) < count:
+            positions += list(itertools.islice(
+                (
+                    position for position, value in enumerate(values)
+                    if value is None and (matched is None or position in matched)
+                ),
+                count - len(positions)
+            ))
+        return positions
+
+    def _ngrams(self, text: str) -> Set[str]:
+        """本文に含まれる語ごとの文字n-gram"""
+        grams: Set[str] = set()
+        for term in text.split():
+            grams.update(self._term_ngrams(term))
+        return grams
+
+    def _term_ngrams(self, term: str) -> List[str]:
+        """語の文字n-gram（n未満の語はそのまま）"""
+        size = self.ngram_size
+        if len(term) < size:
+            return [term]
+        return [term[i:i + size] for i in range(len(term) - size + 1)]
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """検索用に文字列を正規化する"""
+        return normalize_prompt(text)
+
+    @staticmethod
+    def _split_areas(value: Any) -> List[str]:
+        """補助対象地域を地域ごとに分割する"""
+        if not value:
+            return []
+        return [area.strip() for area in str(value).split(AREA_SEPARATOR) if area.strip()]
+
+    @staticmethod
+    def _sort_value(record: Dict[str, Any], field_name: str) -> Optional[float]:
+        """並べ替え・範囲検索に使用する値（日時はUNIX時間）"""
+        value = record.get(field_name)
+        if field_name == "subsidy_max_limit":
+            return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+        return parse_datetime(value)
@@ -0,0 +1,201 @@
+"""
+エージェントスレッドの回収（リーパー）
+
+サービスが作成したスレッドを記録し、不要になったスレッドをバックグラウンドでまとめて削除する。
+削除はリクエスト処理とは独立したタスクで行い、レート制限をかけてバッチ単位で実行する。
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from services.client_utils import call_client
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class ThreadReaper:
+    """
+    スレッドのライフサイクル管理
+
+    track() で記録したスレッドは release() されると削除対象になる。
+    解放されないまま max_idle_seconds を超えて使われなかったスレッドも削除対象とする。
+    """
+
+    def __init__(
+        self,
+        project_client: Any,
+        interval_seconds: float = 30,
+        batch_size: int = 20,
+        max_deletes_per_second: float = 5,
+        max_idle_seconds: float = 86400,
+        max_retries: int = 3
+    ):
+        """
+        初期化
+
+        Args:
+            project_client: Azure AIプロジェクトクライアント（同期・非同期いずれも可）
+            interval_seconds: 回収処理を実行する間隔（秒）
+            batch_size: 1回の回収処理で削除するスレッドの最大数
+            max_deletes_per_second: 1秒あたりの削除リクエストの上限
+            max_idle_seconds: 解放されなかったスレッドを最終利用から強制的に削除するまでの秒数
+            max_retries: 削除に失敗したスレッドを再試行する回数
+        """
+        self.project_client = project_client
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_deletes_per_second = max_deletes_per_second
+        self.max_idle_seconds = max_idle_seconds
+        self.max_retries = max_retries
+        # 作成済みで未解放のスレッド（最終利用の古い順）
+        self._tracked: "OrderedDict[str, float]" = OrderedDict()
+        # 削除待ちのスレッド
+        self._pending: Deque[str] = deque()
+        self._queued: set = set()
+        self._attempts: Dict[str, int] = {}
+        self._reaped = 0
+        self._failed = 0
+        self._sweepers: List[Callable[[], Any]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, thread_id: str) -> None:
+        """
+        作成または再利用したスレッドを記録する
+
+        Args:
+            thread_id: スレッドID
+        """
+        self._tracked[thread_id] = time.time()
+        self._tracked.move_to_end(thread_id)
+
+    def release(self, thread_id: str) -> None:
+        """
+        スレッドを削除対象にする（削除はバックグラウンドで行われる）
+
+        Args:
+            thread_id: スレッドID
+        """
+        self._tracked.pop(thread_id, None)
+        if thread_id not in self._queued:
+            self._queued.add(thread_id)
+            self._pending.append(thread_id)
+
+    def add_sweeper(self, sweeper: Callable[[], Any]) -> None:
+        """
+        回収処理の前に一定間隔で実行する掃除処理を登録する（セッションの期限切れの破棄など）
+
+        Args:
+            sweeper: 掃除処理の関数（同期関数・コルーチン関数のいずれも可）。破棄したスレッドは release() で解放する
+        """
+        self._sweepers.append(sweeper)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        スレッド数のカウンターを取得する
+
+        Returns:
+            live（未削除）、pending（削除待ち）、reaped（削除済み）、failed（削除失敗）の件数
+        """
+        return {
+            "live": len(self._tracked) + len(self._pending),
+            "pending": len(self._pending),
+            "reaped": self._reaped,
+            "failed": self._failed,
+        }
+
+    async def reap(self, now: Optional[float] = None) -> int:
+        """
+        削除対象のスレッドを1バッチ分削除する
+
+        Args:
+            now: 現在時刻（UNIX時間）。省略時は現在時刻
+
+        Returns:
+            削除できたスレッド数
+        """
+        now = now if now is not None else time.time()
+        # 解放されないまま期限を超えたスレッドを削除対象に移す
+        while self._tracked:
+            thread_id, last_used = next(iter(self._tracked.items()))
+            if now - last_used < self.max_idle_seconds:
+                break
+            self.release(thread_id)
+
+        reaped = 0
+        delay = 1 / self.max_deletes_per_second if self.max_deletes_per_second > 0 else 0
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        for index, thread_id in enumerate(batch):
+            if index and delay:
+                await asyncio.sleep(delay)
+            if await self._delete_thread(thread_id):
+                reaped += 1
+        if reaped:
+            logger.info(f"Reaped {reaped} agent threads: {self.stats()}")
+        return reaped
+
+    def start(self) -> None:
+        """バックグラウンドの回収タスクを開始する"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """バックグラウンドの回収タスクを停止する"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        """一定間隔で回収処理を繰り返す"""
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            for sweeper in self._sweepers:
+                try:
+                    await call_client(sweeper)
+                except Exception as e:
+                    logger.error(f"Thread reaper sweeper failed: {str(e)}")
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Thread reaper iteration failed: {str(e)}")
+
+    async def _delete_thread(self, thread_id: str) -> bool:
+        """
+        スレッドを削除する（失敗時は上限回数まで再試行キューに戻す）
+
+        Args:
+            thread_id: スレッドID
+
+        Returns:
+            削除できた（または既に存在しない）場合はTrue
+        """
+        try:
+            await call_client(self.project_client.agents.delete_thread, thread_id)
+        except ResourceNotFoundError:
+            pass
+        except Exception as e:
+            attempts = self._attempts.get(thread_id, 0) + 1
+            if attempts < self.max_retries:
+                self._attempts[thread_id] = attempts
+                self._pending.append(thread_id)
+                logger.warning(f"Failed to delete thread {thread_id}, will retry: {str(e)}")
+            else:
+                self._attempts.pop(thread_id, None)
+                self._queued.discard(thread_id)
+                self._failed += 1
+                logger.error(f"Failed to delete thread {thread_id}: {str(e)}")
+            return False
+
+        self._attempts.pop(thread_id, None)
+        self._queued.discard(thread_id)
+        self._reaped += 1
+        return True
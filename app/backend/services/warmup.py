@@ -0,0 +1,113 @@
+"""
+起動時のウォームアップ
+
+OpenAPIスペックの読み込み、エージェントの解決（作成）、資格情報のトークン取得、HTTP接続の確立など、
+最初のリクエストが負担していた初期化をバックグラウンドで済ませる。すべての手順が完了するまで
+レディネス（/api/ready）は準備中を返し、ロードバランサーやオーケストレーターはトラフィックを送らない。
+失敗した手順は間隔を広げながら成功するまで再試行する。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.client_utils import call_client
+from services.metrics import metrics
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """名前付きの初期化手順を順に実行し、完了したかを保持する"""
+
+    def __init__(self, retry_initial_seconds: float = 1, retry_max_seconds: float = 30):
+        """
+        初期化
+
+        Args:
+            retry_initial_seconds: 失敗した手順を再試行するまでの最初の待ち時間（秒）
+            retry_max_seconds: 再試行までの待ち時間の上限（秒）
+        """
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.ready = False
+        self._steps: List[Tuple[str, Callable[[], Any]]] = []
+        self._status: Dict[str, str] = {}
+        self._attempts = 0
+        self._failures = 0
+        self._duration_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def add_step(self, name: str, step: Callable[[], Any]) -> None:
+        """
+        初期化手順を追加する
+
+        Args:
+            name: 手順の名前（メトリクスの段階名は "warmup_<name>"）
+            step: 手順を実行する関数（同期関数・コルーチン関数のいずれも可）
+        """
+        self._steps.append((name, step))
+        self._status[name] = "pending"
+
+    def start(self) -> None:
+        """バックグラウンドでウォームアップを開始する"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """実行中のウォームアップを停止する"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run(self) -> None:
+        """すべての手順を順に実行し（失敗した手順は成功するまで再試行する）、完了したら準備完了にする"""
+        start = time.perf_counter()
+        for name, step in self._steps:
+            delay = self.retry_initial_seconds
+            while True:
+                self._attempts += 1
+                self._status[name] = "running"
+                try:
+                    with metrics.track(f"warmup_{name}"):
+                        await call_client(step)
+                    break
+                except Exception as e:
+                    self._failures += 1
+                    self._status[name] = "failed"
+                    logger.warning(f"Warmup step {name} failed, retrying in {delay:.0f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.retry_max_seconds)
+            self._status[name] = "done"
+        self._duration_seconds = time.perf_counter() - start
+        self.ready = True
+        logger.info(f"Warmup completed in {self._duration_seconds:.2f}s")
+
+    def status(self) -> Dict[str, Any]:
+        """
+        レディネスの状態を取得する
+
+        Returns:
+            "status"（ready または warming_up）と手順ごとの状態（pending / running / failed / done）を含む辞書
+        """
+        return {"status": "ready" if self.ready else "warming_up", "steps": dict(self._status)}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        ウォームアップの統計情報を取得する
+
+        Returns:
+            ready（準備完了の場合は1）、attempts（手順の実行回数）、failures（失敗回数）、duration_seconds（所要時間）
+        """
+        return {
+            "ready": int(self.ready),
+            "attempts": self._attempts,
+            "failures": self._failures,
+            "duration_seconds": self._duration_seconds,
+        }
@@ -1,19 +1,56 @@
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
 
+from models.models import ApplicationFormRequest
+from services.admission_controller import LANE_BULK, LANE_INTERACTIVE, AdmissionController, AdmissionLane
+from services.agent_registry import AgentRegistry
 from services.assistant_manager_service import AssistantManagerService
+from services.job_queue import JobQueue, JobStore
+from services.metrics import metrics
+from services.rate_limiter import TokenRateLimiter
+from services.request_coalescer import RequestCoalescer
+from services.response_cache import ResponseCache
+from services.run_guard import CircuitBreaker, RunGuard
+from services.run_poller import RunPoller
+from services.session_store import SessionStore
+from services.spec_registry import SpecRegistry
+from services.subsidy_catalog import SubsidyCatalog
+from services.thread_reaper import ThreadReaper
+from services.warmup import Warmup
+from tools.actions.application_doc_generator_tool import ApplicationFormGenerator
 
 
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリケーションのライフサイクル管理（バックグラウンドタスクの起動・停止と非同期クライアントのクローズ）"""
+    thread_reaper.start()
+    application_job_queue.start()
+    if SUBSIDY_CATALOG_PATH:
+        subsidy_catalog.load(SUBSIDY_CATALOG_PATH)
+    # 最初のリクエストが負担していた初期化をバックグラウンドで済ませ、完了後に /api/ready を準備完了にする
+    warmup.start()
+    yield
+    await warmup.stop()
+    await application_job_queue.stop()
+    await thread_reaper.stop()
+    if subsidies_api_client is not None:
+        await subsidies_api_client.close()
+    await project_client.close()
+    if credential is not None:
+        await credential.close()
+
+
 app: FastAPI = FastAPI(
     title="API Sample for Agent SDK",
     description="API for Agent SDK",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -25,11 +62,225 @@ app.add_middleware(
     allow_headers=["*"],  # すべてのHTTPヘッダーを許可
 )
 
-project_client: AIProjectClient = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), conn_str=os.environ["PROJECT_CONNECTION_STRING"]
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """リクエストの処理中に計測した段階の所要時間を Server-Timing ヘッダーで返す"""
+    token = metrics.begin_request()
+    try:
+        response = await call_next(request)
+        server_timing = metrics.server_timing()
+        if server_timing:
+            response.headers["Server-Timing"] = server_timing
+        return response
+    finally:
+        metrics.end_request(token)
+
+# 非同期クライアントを使用し、エージェント実行の待機中もイベントループを解放する
+# クライアントはアプリケーション全体で1つだけ作成し、キープアライブの接続プールを共有する
+# AGENTS_BACKEND=fake の場合はAzureを使わず、ローカルのフェイクで応答する（ベンチマーク・負荷試験用）
+# 資格情報やトランスポートのSDKは読み込みに時間がかかるため、使用するバックエンドの分だけ読み込む
+USE_FAKE_AGENTS = os.getenv("AGENTS_BACKEND", "azure").lower() == "fake"
+credential = None
+if USE_FAKE_AGENTS:
+    from benchmarks.fake_agents import DEFAULT_LATENCIES, FakeProjectClient
+    fake_failure_rate = float(os.getenv("FAKE_AGENTS_FAILURE_RATE", "0"))
+    project_client = FakeProjectClient(
+        seed=int(os.getenv("FAKE_AGENTS_SEED", "0")),
+        time_scale=float(os.getenv("FAKE_AGENTS_TIME_SCALE", "1")),
+        failure_rates={operation: fake_failure_rate for operation in DEFAULT_LATENCIES},
+    )
+else:
+    from azure.identity.aio import DefaultAzureCredential
+    from services.project_client import create_project_client
+    credential = DefaultAzureCredential()
+    project_client = create_project_client(
+        os.environ["PROJECT_CONNECTION_STRING"],
+        credential,
+        pool_size=int(os.getenv("PROJECT_CLIENT_POOL_SIZE", "100")),
+        keepalive_timeout=float(os.getenv("PROJECT_CLIENT_KEEPALIVE_SECONDS", "30")),
+    )
+
+# 不要になったスレッドをバックグラウンドで削除するリーパー
+thread_reaper = ThreadReaper(
+    project_client,
+    interval_seconds=float(os.getenv("THREAD_REAPER_INTERVAL_SECONDS", "30")),
+    batch_size=int(os.getenv("THREAD_REAPER_BATCH_SIZE", "20")),
+    max_deletes_per_second=float(os.getenv("THREAD_REAPER_MAX_DELETES_PER_SECOND", "5")),
+)
+
+# 会話セッション（セッションIDとスレッドの対応表）。破棄されたセッションのスレッドはリーパーが削除する
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+    idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800")),
+    persist_path=os.getenv("SESSION_STORE_PATH"),
+    on_expire=thread_reaper.release,
+)
+# アイドル期限切れのセッションはリクエスト処理ではなく、リーパーの定期処理で破棄する
+thread_reaper.add_sweeper(session_store.evict_expired)
+
+# エージェントを構成ごとに一度だけ作成するレジストリ。AGENT_REGISTRY_PATH を指定した場合はワーカー間・再起動後も再利用する
+# （起動したディレクトリにファイルを作らないよう、既定ではプロセス内のみとする。フェイクのエージェントIDは永続化しない）
+agent_registry = AgentRegistry(
+    project_client,
+    persist_path=None if USE_FAKE_AGENTS else os.getenv("AGENT_REGISTRY_PATH") or None,
+)
+
+# 同じ質問への応答を再利用するキャッシュ（チャットと申請書のAI生成で共有する）
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600")),
+)
+
+# 処理中の同じリクエストを1回の実行にまとめる（チャット・メッセージ生成・申請書生成で共有する）
+request_coalescer = RequestCoalescer()
+
+# OpenAPIスペックを一度だけ読み込み、作成したツールを共有するレジストリ（ファイルの更新時は読み込み直す）
+spec_registry = SpecRegistry(
+    resolve_refs=os.getenv("OPENAPI_SPEC_RESOLVE_REFS", "true").lower() == "true",
+)
+
+# 補助金APIのツール（"openapi": エージェントサービスがAPIを呼び出す、"function": このプロセスでキャッシュを介して呼び出す）
+subsidies_api_client = None
+subsidies_tool = None
+if os.getenv("SUBSIDIES_TOOL_MODE", "openapi").lower() == "function":
+    from services.subsidies_api import DEFAULT_BASE_URL, SubsidiesApiClient
+    from tools.actions.subsidies_proxy_tool import create_subsidies_function_tool
+    subsidies_api_client = SubsidiesApiClient(
+        base_url=os.getenv("SUBSIDIES_API_BASE_URL", DEFAULT_BASE_URL),
+        ttl_seconds=float(os.getenv("SUBSIDIES_API_CACHE_TTL_SECONDS", "300")),
+        stale_ttl_seconds=float(os.getenv("SUBSIDIES_API_CACHE_STALE_SECONDS", "3600")),
+        max_entries=int(os.getenv("SUBSIDIES_API_CACHE_MAX_ENTRIES", "1024")),
+        pool_size=int(os.getenv("SUBSIDIES_API_POOL_SIZE", "20")),
+        timeout_seconds=float(os.getenv("SUBSIDIES_API_TIMEOUT_SECONDS", "10")),
+        fixture_dir=os.getenv("SUBSIDIES_API_FIXTURE_DIR") or None,
+    )
+    subsidies_tool = create_subsidies_function_tool(subsidies_api_client)
+
+# エージェント実行の完了待ち（開始直後は短い間隔で確認し、その後は間隔を広げる）
+run_poller = RunPoller(
+    initial_interval_seconds=float(os.getenv("RUN_POLL_INITIAL_INTERVAL_SECONDS", "0.2")),
+    max_interval_seconds=float(os.getenv("RUN_POLL_MAX_INTERVAL_SECONDS", "2.0")),
+    backoff_factor=float(os.getenv("RUN_POLL_BACKOFF_FACTOR", "1.5")),
+    fast_polls=int(os.getenv("RUN_POLL_FAST_POLLS", "3")),
+    jitter_ratio=float(os.getenv("RUN_POLL_JITTER_RATIO", "0.2")),
+    timeout_seconds=float(os.getenv("RUN_TIMEOUT_SECONDS", "300")),
+)
+
+# モデルのクォータ（TPM・RPM）に合わせたレート制限（どちらも0の場合は無効。保存先を指定するとワーカー間で共有する）
+RATE_LIMIT_TOKENS_PER_MINUTE = int(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "0"))
+RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "0"))
+rate_limiter = None
+if RATE_LIMIT_TOKENS_PER_MINUTE > 0 or RATE_LIMIT_REQUESTS_PER_MINUTE > 0:
+    rate_limiter = TokenRateLimiter(
+        tokens_per_minute=RATE_LIMIT_TOKENS_PER_MINUTE,
+        requests_per_minute=RATE_LIMIT_REQUESTS_PER_MINUTE,
+        burst_seconds=float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10")),
+        expected_completion_tokens=int(os.getenv("RATE_LIMIT_EXPECTED_COMPLETION_TOKENS", "500")),
+        max_wait_seconds=float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "60")),
+        persist_path=os.getenv("RATE_LIMIT_STORE_PATH") or None,
+        namespace=os.getenv("MODEL_DEPLOYMENT_NAME", "default"),
+    )
+
+# エージェント実行の保護（期限・遅い実行のヘッジ・失敗が続いた場合に即座に失敗させるサーキットブレーカー）
+run_guard = RunGuard(
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+        reset_timeout_seconds=float(os.getenv("CIRCUIT_RESET_TIMEOUT_SECONDS", "30")),
+    ),
+    deadline_seconds=float(os.getenv("RUN_DEADLINE_SECONDS", "120")) or None,
+    hedging=os.getenv("RUN_HEDGING", "false").lower() == "true",
+    hedge_percentile=float(os.getenv("RUN_HEDGE_PERCENTILE", "0.95")),
+    hedge_min_samples=int(os.getenv("RUN_HEDGE_MIN_SAMPLES", "20")),
+    hedge_min_delay_seconds=float(os.getenv("RUN_HEDGE_MIN_DELAY_SECONDS", "1")),
+)
+
+# エージェントを実行するリクエストのアドミッション制御（対話的なチャットを申請書の生成より優先し、混雑時は429で早めに断る）
+# 実行枠はサービスがエージェントを実行するときにだけ取得する（レーンを設定しないジョブのワーカーは取得しない）
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16"))
+admission_controller = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    lanes={
+        LANE_INTERACTIVE: AdmissionLane(
+            priority=0,
+            max_concurrency=ADMISSION_MAX_CONCURRENCY,
+            max_queue_size=int(os.getenv("ADMISSION_INTERACTIVE_MAX_QUEUE", "64")),
+            queue_timeout_seconds=float(os.getenv("ADMISSION_INTERACTIVE_QUEUE_TIMEOUT_SECONDS", "10")),
+        ),
+        LANE_BULK: AdmissionLane(
+            priority=1,
+            max_concurrency=int(os.getenv("ADMISSION_BULK_MAX_CONCURRENCY", "4")),
+            max_queue_size=int(os.getenv("ADMISSION_BULK_MAX_QUEUE", "16")),
+            queue_timeout_seconds=float(os.getenv("ADMISSION_BULK_QUEUE_TIMEOUT_SECONDS", "30")),
+        ),
+    },
+)
+
+assistant_manager_service = AssistantManagerService(
+    project_client,
+    session_store=session_store,
+    thread_reaper=thread_reaper,
+    agent_registry=agent_registry,
+    response_cache=response_cache,
+    request_coalescer=request_coalescer,
+    subsidies_tool=subsidies_tool,
+    spec_registry=spec_registry,
+    run_poller=run_poller,
+    rate_limiter=rate_limiter,
+    run_guard=run_guard,
+    admission_controller=admission_controller,
+)
+
+# 補助金申請書の生成（AI拡張には共有のサービスと応答キャッシュを使用する）
+application_form_generator = ApplicationFormGenerator(
+    service=assistant_manager_service,
+    response_cache=response_cache,
+    parallel_sections=os.getenv("APPLICATION_PARALLEL_SECTIONS", "false").lower() == "true",
+    max_section_concurrency=int(os.getenv("APPLICATION_SECTION_CONCURRENCY", "3")),
+    section_timeout_seconds=float(os.getenv("APPLICATION_SECTION_TIMEOUT_SECONDS", "60")),
+    request_coalescer=request_coalescer,
+    max_batch_concurrency=int(os.getenv("APPLICATION_BATCH_CONCURRENCY", "4")),
+)
+
+# 申請書生成ジョブ（HTTPリクエストを待たせず、上限付きのワーカープールで生成する）
+application_job_queue = JobQueue(
+    lambda payload: application_form_generator.generate_form(ApplicationFormRequest(**payload)),
+    store=JobStore(
+        ttl_seconds=float(os.getenv("APPLICATION_JOB_TTL_SECONDS", "3600")),
+        persist_path=os.getenv("APPLICATION_JOB_STORE_PATH"),
+    ),
+    workers=int(os.getenv("APPLICATION_JOB_WORKERS", "4")),
+    max_queue_size=int(os.getenv("APPLICATION_JOB_MAX_QUEUE_SIZE", "100")),
+)
+# 保持期限を過ぎたジョブは状態の取得時ではなく、リーパーの定期処理で破棄する
+thread_reaper.add_sweeper(application_job_queue.store.evict_expired)
+
+# 補助金情報のローカルカタログ（スナップショットから読み込み、構造化された検索にエージェントを介さず応答する）
+SUBSIDY_CATALOG_PATH = os.getenv("SUBSIDY_CATALOG_PATH")
+subsidy_catalog = SubsidyCatalog(ngram_size=int(os.getenv("SUBSIDY_CATALOG_NGRAM_SIZE", "2")))
+
+# 起動時のウォームアップ（OpenAPIスペックの読み込み、エージェントの解決、トークン取得と接続の確立）
+warmup = Warmup()
+if subsidies_api_client is None:
+    warmup.add_step("openapi_spec", assistant_manager_service.get_openapi_tool)
+warmup.add_step(
+    "agents",
+    lambda: assistant_manager_service.warm_up(connections=int(os.getenv("WARMUP_CONNECTIONS", "4")))
 )
 
-assistant_manager_service = AssistantManagerService(project_client)
+# /metrics で出力する各コンポーネントの統計
+metrics.register_collector("response_cache", response_cache.stats)
+metrics.register_collector("request_coalescer", request_coalescer.stats)
+metrics.register_collector("spec_registry", spec_registry.stats)
+metrics.register_collector("run_poller", run_poller.stats)
+metrics.register_collector("run_guard", run_guard.stats)
+metrics.register_collector("warmup", warmup.stats)
+metrics.register_collector("thread_reaper", thread_reaper.stats)
+metrics.register_collector("application_jobs", application_job_queue.stats)
+metrics.register_collector("admission", admission_controller.stats)
+if rate_limiter is not None:
+    metrics.register_collector("rate_limiter", rate_limiter.stats)
+if subsidies_api_client is not None:
+    metrics.register_collector("subsidies_api", subsidies_api_client.stats)
 
 import controller
 app.include_router(controller.router)
\ No newline at end of file
@@ -0,0 +1,23 @@
+from benchmarks.bench_api import compare, percentile, summarize
+
+
+class TestBenchApi:
+
+    def test_percentile(self):
+        """パーセンタイルを線形補間で求めることをテスト"""
+        values = [0.1, 0.2, 0.3, 0.4, 0.5]
+
+        assert percentile(values, 50) == 0.3
+        assert round(percentile(values, 95), 3) == 0.48
+        assert percentile([], 99) == 0.0
+
+    def test_summarize_and_compare(self):
+        """計測結果の集計と、以前の結果との比較をテスト"""
+        baseline = {"results": {"chat": summarize([0.1, 0.2, 0.3, 0.4], 1, 2.0)}}
+        current = {"results": {"chat": summarize([0.05, 0.1, 0.15, 0.2], 0, 1.0)}}
+
+        assert baseline["results"]["chat"]["throughput_rps"] == 2.0
+        assert baseline["results"]["chat"]["error_rate"] == 0.25
+        lines = compare(baseline, current)
+        assert any(line.startswith("chat") and "p50_ms" in line and "(-50.0%) better" in line for line in lines)
+        assert any("throughput_rps" in line and "(+100.0%) better" in line for line in lines)
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import random
+import pytest
+from azure.core.exceptions import HttpResponseError
+from benchmarks.fake_agents import DEFAULT_LATENCIES, FakeProjectClient, Latency
+from models.models import MessageRequest
+from services.assistant_manager_service import AssistantManagerService
+from services.run_guard import CircuitBreaker, RunGuard
+from services.run_poller import RunPoller
+from tools.actions.application_doc_generator_tool import ApplicationFormGenerator, request_ai_content
+
+
+class SequenceLatency:
+    """指定した順に所要時間を返す分布（最後の値を繰り返す）"""
+
+    def __init__(self, *seconds):
+        self.seconds = list(seconds)
+
+    def sample(self, rng):
+        return self.seconds.pop(0) if len(self.seconds) > 1 else self.seconds[0]
+
+
+class TestFakeAgents:
+
+    def test_latency_distribution(self):
+        """所要時間の分布の解析と、シードを固定した場合に同じ値を返すことをテスト"""
+        latency = Latency.parse("0.1:0.5")
+
+        samples = [latency.sample(random.Random(1)) for _ in range(2)]
+
+        assert latency.median_seconds == 0.1 and latency.sigma == 0.5
+        assert samples[0] == samples[1]
+        assert Latency.parse("0.2").sample(random.Random()) == 0.2
+
+    @pytest.mark.asyncio
+    async def test_service_runs_against_fake(self):
+        """サービスがフェイクのエージェントで応答を生成できることをテスト"""
+        client = FakeProjectClient(time_scale=0)
+        service = AssistantManagerService(client)
+
+        result = await service.process_openapi_spec(MessageRequest(message="IT導入の補助金を教えてください"))
+
+        assert result["response"].startswith("補助金に関するお問い合わせへの回答です")
+        assert client.agents.calls["create_agent"] == 1
+        assert client.agents.calls["list_messages"] == 1
+
+    @pytest.mark.asyncio
+    async def test_run_poller_against_fake(self):
+        """実行のポーリングで完了を検知できることをテスト"""
+        client = FakeProjectClient(time_scale=0.01)
+        service = AssistantManagerService(
+            client, run_poller=RunPoller(initial_interval_seconds=0.005, jitter_ratio=0)
+        )
+
+        content = await request_ai_content({"title": "テスト補助金"}, "テスト事業", service)
+
+        assert set(content) >= {"application_reason", "business_plan", "expected_effects"}
+        assert client.agents.calls["get_run"] >= 1
+
+    @pytest.mark.asyncio
+    async def test_injected_failures(self):
+        """指定した失敗率で操作とエージェントの実行が失敗することをテスト"""
+        client = FakeProjectClient(time_scale=0, failure_rates={"create_thread": 1.0})
+        with pytest.raises(HttpResponseError):
+            await client.agents.create_thread()
+
+        client = FakeProjectClient(time_scale=0, failure_rates={"run": 1.0})
+        result = await AssistantManagerService(client).process_message_async("テスト")
+
+        assert result.startswith("Error:")
+
+    @pytest.mark.asyncio
+    async def test_slow_run_is_hedged_against_fake(self):
+        """遅い実行をヘッジし、採用しなかった実行をキャンセルすることをテスト"""
+        latencies = {name: Latency(0) for name in DEFAULT_LATENCIES}
+        latencies["run"] = SequenceLatency(0.01, 0.01, 0.01, 5, 0.01)
+        client = FakeProjectClient(time_scale=1, latencies=latencies)
+        guard = RunGuard(hedge_min_samples=3, hedge_min_delay_seconds=0.05)
+        service = AssistantManagerService(
+            client, run_poller=RunPoller(initial_interval_seconds=0.005, max_interval_seconds=0.01, jitter_ratio=0),
+            run_guard=guard
+        )
+        for _ in range(3):
+            await service.process_message_async("ウォームアップ")
+
+        result = await asyncio.wait_for(service.process_message_async("テスト"), timeout=2)
+        await asyncio.sleep(0.05)
+
+        assert result.startswith("補助金に関するお問い合わせへの回答です")
+        assert guard.stats()["hedge_wins"] == 1
+        assert client.agents.calls["cancel_run"] == 1
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_falls_back_to_basic_template(self):
+        """実行の失敗が続いた場合、エージェントを実行せずに基本テンプレートで応答することをテスト"""
+        client = FakeProjectClient(time_scale=0, failure_rates={"run": 1.0})
+        guard = RunGuard(breaker=CircuitBreaker(failure_threshold=2), hedging=False)
+        generator = ApplicationFormGenerator(service=AssistantManagerService(client, run_guard=guard))
+        for _ in range(2):
+            await generator.generate_ai_enhanced({"title": "テスト補助金"}, "テスト事業")
+        runs = client.agents.calls["create_run"]
+
+        template = await generator.generate_ai_enhanced({"title": "テスト補助金"}, "テスト事業")
+
+        assert template == generator.generate_application_text({"title": "テスト補助金"}) + (
+            "\n\n※AI拡張機能は現在利用できません。基本テンプレートをご利用ください。"
+        )
+        assert client.agents.calls["create_run"] == runs
+        assert guard.circuit_open()
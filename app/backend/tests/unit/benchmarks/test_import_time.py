@@ -0,0 +1,39 @@
+from benchmarks.import_time import find_forbidden, forbidden_for, measure, parse_importtime, total_us
+
+
+SAMPLE_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:        80 |        300 |     jsonref.proxytypes
+import time:       400 |        700 |   jsonref
+import time:      1000 |       2000 | startup
+Traceback (most recent call last):
+"""
+
+
+class TestImportTime:
+
+    def test_parse_importtime(self):
+        """-X importtime の出力からモジュールごとの読み込み時間と階層を解析することをテスト"""
+        records = parse_importtime(SAMPLE_OUTPUT)
+
+        assert [(record.module, record.depth) for record in records] == [
+            ("_io", 1), ("jsonref.proxytypes", 2), ("jsonref", 1), ("startup", 0)
+        ]
+        assert records[2].self_us == 400
+        assert total_us(records, "startup") == 2000
+        assert total_us(records, "controller") == 0
+
+    def test_find_forbidden_matches_submodules(self):
+        """読み込んではいけないパッケージのサブモジュールも検出し、フェイクではAzureのSDKも禁止することをテスト"""
+        records = parse_importtime(SAMPLE_OUTPUT)
+
+        assert find_forbidden(records, ["jsonref", "json", "openai"]) == ["jsonref"]
+        assert "azure.identity" in forbidden_for("fake")
+        assert "azure.identity" not in forbidden_for("azure")
+
+    def test_startup_does_not_import_unused_sdks(self):
+        """フェイクのバックエンドで起動した場合に、未使用のSDKやAzureの資格情報のSDKを読み込まないことをテスト"""
+        records = measure("startup", "fake")
+
+        assert total_us(records, "startup") > 0
+        assert find_forbidden(records, forbidden_for("fake")) == []
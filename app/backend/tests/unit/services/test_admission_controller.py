@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+from services.admission_controller import (
+    LANE_BULK, LANE_INTERACTIVE, AdmissionController, AdmissionLane, AdmissionRejected
+)
+
+
+def make_controller(max_concurrency=1, max_queue_size=4, queue_timeout_seconds=1.0, bulk_max_concurrency=1):
+    return AdmissionController(
+        max_concurrency=max_concurrency,
+        lanes={
+            LANE_INTERACTIVE: AdmissionLane(
+                priority=0,
+                max_concurrency=max_concurrency,
+                max_queue_size=max_queue_size,
+                queue_timeout_seconds=queue_timeout_seconds,
+            ),
+            LANE_BULK: AdmissionLane(
+                priority=1,
+                max_concurrency=bulk_max_concurrency,
+                max_queue_size=max_queue_size,
+                queue_timeout_seconds=queue_timeout_seconds,
+            ),
+        },
+    )
+
+
+class TestAdmissionController:
+
+    @pytest.mark.asyncio
+    async def test_admit_bounds_concurrency(self):
+        """同時に実行されるリクエスト数が上限を超えないことをテスト"""
+        controller = make_controller(max_concurrency=2)
+        running = 0
+        peak = 0
+
+        async def handle():
+            nonlocal running, peak
+            async with controller.admit(LANE_INTERACTIVE):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(handle() for _ in range(4)))
+
+        assert peak == 2
+        assert controller.stats()["in_flight"] == 0
+        assert controller.stats()["interactive_admitted"] == 4
+
+    @pytest.mark.asyncio
+    async def test_interactive_lane_is_admitted_before_bulk(self):
+        """空きができた際に、先に待っていた一括生成より対話的なリクエストが優先されることをテスト"""
+        controller = make_controller(max_concurrency=1)
+        ticket = await controller.acquire(LANE_INTERACTIVE)
+        order = []
+
+        async def wait(lane):
+            async with controller.admit(lane):
+                order.append(lane)
+
+        bulk = asyncio.create_task(wait(LANE_BULK))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(wait(LANE_INTERACTIVE))
+        await asyncio.sleep(0)
+
+        controller.release(ticket)
+        await asyncio.gather(bulk, interactive)
+
+        assert order == [LANE_INTERACTIVE, LANE_BULK]
+
+    @pytest.mark.asyncio
+    async def test_bulk_lane_is_capped_below_global_limit(self):
+        """一括生成のレーンは全体に空きがあってもレーンの上限までしか実行されないことをテスト"""
+        controller = make_controller(max_concurrency=3, bulk_max_concurrency=1, queue_timeout_seconds=0.05)
+        await controller.acquire(LANE_BULK)
+
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(LANE_BULK)
+        # 対話的なリクエストは残りの実行枠を使用できる
+        await controller.acquire(LANE_INTERACTIVE)
+        assert controller.stats()["in_flight"] == 2
+
+    @pytest.mark.asyncio
+    async def test_full_queue_is_rejected_immediately(self):
+        """キューが満杯の場合は待たずに拒否し、再試行までの秒数を返すことをテスト"""
+        controller = make_controller(max_concurrency=1, max_queue_size=1, queue_timeout_seconds=10)
+        await controller.acquire(LANE_INTERACTIVE)
+        waiting = asyncio.create_task(controller.acquire(LANE_INTERACTIVE))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await controller.acquire(LANE_INTERACTIVE)
+
+        assert exc_info.value.reason == "queue_full"
+        assert 1 <= exc_info.value.retry_after <= 60
+        assert controller.stats()["interactive_rejected"] == 1
+        waiting.cancel()
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_rejects_and_leaves_queue(self):
+        """キューで待てる時間を超えたリクエストが拒否され、キューから取り除かれることをテスト"""
+        controller = make_controller(max_concurrency=1, queue_timeout_seconds=0.01)
+        await controller.acquire(LANE_INTERACTIVE)
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await controller.acquire(LANE_INTERACTIVE)
+
+        assert exc_info.value.reason == "queue_timeout"
+        stats = controller.stats()
+        assert stats["interactive_queued"] == 0
+        assert stats["interactive_timed_out"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """待機中にキャンセルされたリクエストが実行枠を消費しないことをテスト"""
+        controller = make_controller(max_concurrency=1)
+        ticket = await controller.acquire(LANE_INTERACTIVE)
+        waiting = asyncio.create_task(controller.acquire(LANE_INTERACTIVE))
+        await asyncio.sleep(0)
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        controller.release(ticket)
+
+        assert controller.stats()["in_flight"] == 0
+        assert controller.stats()["interactive_queued"] == 0
+        # 空いた実行枠は次のリクエストがすぐに取得できる
+        await asyncio.wait_for(controller.acquire(LANE_INTERACTIVE), timeout=0.1)
+
+    @pytest.mark.asyncio
+    async def test_release_is_idempotent(self):
+        """同じ実行枠を2回返しても実行中の件数がずれないことをテスト"""
+        controller = make_controller(max_concurrency=1)
+        ticket = await controller.acquire(LANE_INTERACTIVE)
+
+        controller.release(ticket)
+        controller.release(ticket)
+
+        assert controller.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_admit_current_uses_lane_of_request(self):
+        """設定したレーンの実行枠を取得し、レーンが未設定の場合は取得しないことをテスト"""
+        controller = make_controller(max_concurrency=1, max_queue_size=1, queue_timeout_seconds=0.01)
+
+        async with controller.admit_current() as ticket:
+            assert ticket is None
+            assert controller.stats()["in_flight"] == 0
+
+        with controller.lane(LANE_INTERACTIVE):
+            async with controller.admit_current() as ticket:
+                assert ticket.lane == LANE_INTERACTIVE
+                with pytest.raises(AdmissionRejected):
+                    async with controller.admit_current():
+                        pass
+
+        assert controller.stats()["in_flight"] == 0
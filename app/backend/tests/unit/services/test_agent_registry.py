@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from azure.core.exceptions import ResourceNotFoundError
+from services.agent_registry import AgentRegistry
+
+
+@pytest.fixture
+def mock_async_project_client():
+    """非同期AIProjectClientのモックを作成するフィクスチャ"""
+    client = Mock()
+    client.agents = AsyncMock()
+    agent = Mock()
+    agent.id = "test-agent-id"
+    client.agents.create_agent.return_value = agent
+    return client
+
+
+class TestAgentRegistry:
+    
+    def test_config_key_depends_on_configuration(self):
+        """構成が変わるとハッシュキーが変わることをテスト"""
+        key = AgentRegistry.config_key("gpt-4o", "agent", "instructions", [{"type": "openapi"}])
+        
+        assert key == AgentRegistry.config_key("gpt-4o", "agent", "instructions", [{"type": "openapi"}])
+        assert key != AgentRegistry.config_key("gpt-4o", "agent", "other instructions", [{"type": "openapi"}])
+        assert key != AgentRegistry.config_key("gpt-4o", "agent", "instructions", [])
+    
+    @pytest.mark.asyncio
+    async def test_get_or_create_is_single_flight(self, mock_async_project_client):
+        """同時呼び出しでもエージェントが1回だけ作成されることをテスト"""
+        registry = AgentRegistry(mock_async_project_client)
+        
+        agent_ids = await asyncio.gather(*[
+            registry.get_or_create("gpt-4o", "agent", "instructions") for _ in range(10)
+        ])
+        
+        assert set(agent_ids) == {"test-agent-id"}
+        mock_async_project_client.agents.create_agent.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_persisted_agent_is_reused_after_restart(self, mock_async_project_client, tmp_path):
+        """永続化したエージェントIDが再起動後のレジストリで再利用されることをテスト"""
+        db_path = str(tmp_path / "agents.db")
+        await AgentRegistry(mock_async_project_client, persist_path=db_path).get_or_create("gpt-4o", "agent", "instructions")
+        
+        agent_id = await AgentRegistry(mock_async_project_client, persist_path=db_path).get_or_create(
+            "gpt-4o", "agent", "instructions"
+        )
+        
+        assert agent_id == "test-agent-id"
+        mock_async_project_client.agents.create_agent.assert_awaited_once()
+        mock_async_project_client.agents.get_agent.assert_awaited_once_with("test-agent-id")
+    
+    @pytest.mark.asyncio
+    async def test_deleted_agent_is_recreated(self, mock_async_project_client, tmp_path):
+        """永続化されたエージェントがサービス上に存在しない場合に作り直すことをテスト"""
+        db_path = str(tmp_path / "agents.db")
+        await AgentRegistry(mock_async_project_client, persist_path=db_path).get_or_create("gpt-4o", "agent", "instructions")
+        mock_async_project_client.agents.get_agent.side_effect = ResourceNotFoundError("Not found")
+        
+        await AgentRegistry(mock_async_project_client, persist_path=db_path).get_or_create("gpt-4o", "agent", "instructions")
+        
+        assert mock_async_project_client.agents.create_agent.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_waits_for_other_worker_claim(self, mock_async_project_client, tmp_path):
+        """他のワーカーが作成中の場合はその完了を待って同じエージェントを使うことをテスト"""
+        db_path = str(tmp_path / "agents.db")
+        other_worker = AgentRegistry(mock_async_project_client, persist_path=db_path)
+        key = AgentRegistry.config_key("gpt-4o", "agent", "instructions")
+        assert other_worker._claim(key)
+        registry = AgentRegistry(mock_async_project_client, persist_path=db_path, poll_interval_seconds=0.01)
+        
+        waiting = asyncio.create_task(registry.get_or_create("gpt-4o", "agent", "instructions"))
+        await asyncio.sleep(0.05)
+        other_worker._write(key, "other-agent-id")
+        
+        assert await waiting == "other-agent-id"
+        mock_async_project_client.agents.create_agent.assert_not_awaited()
@@ -1,11 +1,27 @@
 import os
+import asyncio
+import time
 import pytest
 import json
-from unittest.mock import Mock, patch, mock_open, PropertyMock
+from unittest.mock import AsyncMock, Mock, patch, mock_open, PropertyMock
 from json.decoder import JSONDecodeError
-from azure.ai.projects.models import RunStatus, MessageRole, MessageTextContent
-from services.assistant_manager_service import AssistantManagerService
+from azure.ai.projects.models import (
+    AgentStreamEvent, MessageDeltaChunk, RunStatus, MessageRole, MessageTextContent, RunStep, RunStepType, ThreadRun,
+    SubmitToolOutputsAction, ListSortOrder, MessageImageFileContent
+)
+from services.admission_controller import LANE_INTERACTIVE, AdmissionController, AdmissionLane, AdmissionRejected
+from services.assistant_manager_service import AgentRunError, AssistantManagerService
+from services.metrics import metrics
+from services.rate_limiter import RateLimitExceeded, TokenRateLimiter
+from services.request_coalescer import RequestCoalescer
+from services.response_cache import ResponseCache
+from services.run_guard import CIRCUIT_CLOSED, CircuitBreaker, RunGuard
+from services.run_poller import RunPoller
+from services.session_store import SessionStore
+from services.subsidies_api import SubsidiesApiClient
+from services.thread_reaper import ThreadReaper
 from models.models import MessageRequest
+from tools.actions.subsidies_proxy_tool import create_subsidies_function_tool
 
 
 @pytest.fixture
@@ -35,6 +51,36 @@ def service(mock_project_client):
     return AssistantManagerService(mock_project_client)
 
 
+@pytest.fixture
+def mock_async_project_client():
+    """非同期AIProjectClient（azure.ai.projects.aio）のモックを作成するフィクスチャ"""
+    client = Mock()
+    client.agents = AsyncMock()
+    
+    agent = Mock()
+    agent.id = "test-agent-id"
+    client.agents.create_agent.return_value = agent
+    
+    thread = Mock()
+    thread.id = "test-thread-id"
+    client.agents.create_thread.return_value = thread
+    
+    run = Mock()
+    run.status = RunStatus.COMPLETED
+    client.agents.create_run.return_value = run
+    
+    message = Mock()
+    message.role = MessageRole.AGENT
+    message_content = Mock(spec=MessageTextContent)
+    message_content.text.value = "This is a test response"
+    message.content = [message_content]
+    messages = Mock()
+    messages.data = [message]
+    client.agents.list_messages.return_value = messages
+    
+    return client
+
+
 @pytest.fixture
 def valid_openapi_spec():
     """有効なOpenAPIスペックを返すフィクスチャ"""
@@ -59,6 +105,70 @@ def valid_openapi_spec():
     }
 
 
+def make_stream_events(*texts):
+    """ツール呼び出しとテキスト差分を含むストリームイベントの一覧を作成する"""
+    step = Mock(spec=RunStep)
+    step.id = "step-1"
+    step.type = RunStepType.TOOL_CALLS
+    step.status = "in_progress"
+    tool_call = Mock()
+    tool_call.type = "openapi"
+    tool_call.function.name = "subsidies_api_getSubsidiesList"
+    step.step_details.tool_calls = [tool_call]
+    events = [(AgentStreamEvent.THREAD_RUN_STEP_CREATED, step, None)]
+    for text in texts:
+        chunk = Mock(spec=MessageDeltaChunk)
+        chunk.text = text
+        events.append((AgentStreamEvent.THREAD_MESSAGE_DELTA, chunk, None))
+    events.append((AgentStreamEvent.DONE, "[DONE]", None))
+    return events
+
+
+def make_run(status, required_action=None):
+    """指定した状態の実行（ThreadRun）のモックを作成する"""
+    run = Mock()
+    run.id = "test-run-id"
+    run.agent_id = "test-agent-id"
+    run.status = status
+    run.required_action = required_action
+    return run
+
+
+def make_poller(timeout_seconds=60):
+    """待ち時間なしで状態を確認するポーリング方針を作成する"""
+    return RunPoller(initial_interval_seconds=0, max_interval_seconds=0, jitter_ratio=0, timeout_seconds=timeout_seconds)
+
+
+class FakeAsyncRunStream:
+    """AsyncAgentRunStreamの代替となる非同期ストリーム"""
+    
+    def __init__(self, events):
+        self.events = events
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return None
+    
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+
+class FakeRunStream:
+    """AgentRunStreamの代替となる同期ストリーム"""
+    
+    def __init__(self, events):
+        self.events = events
+    
+    def __enter__(self):
+        return iter(self.events)
+    
+    def __exit__(self, *exc_info):
+        return None
+
+
 class TestAssistantManagerService:
     
     # TS-002: OpenAPIスペックファイル不在テスト
@@ -107,7 +217,7 @@ class TestAssistantManagerService:
         run = Mock()
         # Azure SDKのRunStatusの正しい値を使用
         type(run).status = PropertyMock(side_effect=lambda: RunStatus.FAILED.__class__("completed"))
-        mock_project_client.agents.create_and_process_run.return_value = run
+        mock_project_client.agents.create_run.return_value = run
         
         # メッセージリストのモック
         message = Mock()
@@ -127,7 +237,7 @@ class TestAssistantManagerService:
         
         # 検証
         assert result == {"response": "This is a test response"}
-        mock_project_client.agents.delete_agent.assert_called_once()
+        mock_project_client.agents.delete_agent.assert_not_called()
     
     # TS-006: エージェント実行失敗テスト
     @pytest.mark.asyncio
@@ -147,7 +257,7 @@ class TestAssistantManagerService:
         status_property = PropertyMock(return_value=RunStatus.FAILED)
         type(run).status = status_property
         run.last_error = "Test error"
-        mock_project_client.agents.create_and_process_run.return_value = run
+        mock_project_client.agents.create_run.return_value = run
         
         # リクエスト作成
         request = MessageRequest(message="Test message")
@@ -157,7 +267,7 @@ class TestAssistantManagerService:
         
         # 検証
         assert result == {"error": f"Run failed: {run.last_error}"}
-        mock_project_client.agents.delete_agent.assert_called_once()
+        mock_project_client.agents.delete_agent.assert_not_called()
     
     # TS-007: 予期しない例外処理テスト
     @pytest.mark.asyncio
@@ -189,7 +299,7 @@ class TestAssistantManagerService:
         run = Mock()
         # Azure SDKのRunStatusの正しい値を使用
         type(run).status = PropertyMock(side_effect=lambda: RunStatus.FAILED.__class__("completed"))
-        mock_project_client.agents.create_and_process_run.return_value = run
+        mock_project_client.agents.create_run.return_value = run
         
         # 空のメッセージリストのモック
         messages = Mock()
@@ -204,7 +314,7 @@ class TestAssistantManagerService:
         
         # 検証
         assert result == {"response": "No response found"}
-        mock_project_client.agents.delete_agent.assert_called_once()
+        mock_project_client.agents.delete_agent.assert_not_called()
     
     # 新規テスト: process_message メソッドのテスト
     def test_process_message_success(self, service, mock_project_client):
@@ -212,7 +322,7 @@ class TestAssistantManagerService:
         # 実行成功のモック
         run = Mock()
         type(run).status = PropertyMock(side_effect=lambda: RunStatus.FAILED.__class__("completed"))
-        mock_project_client.agents.create_and_process_run.return_value = run
+        mock_project_client.agents.create_run.return_value = run
         
         # メッセージリストのモック
         message = Mock()
@@ -232,8 +342,8 @@ class TestAssistantManagerService:
         mock_project_client.agents.create_agent.assert_called_once()
         mock_project_client.agents.create_thread.assert_called_once()
         mock_project_client.agents.create_message.assert_called_once()
-        mock_project_client.agents.create_and_process_run.assert_called_once()
-        mock_project_client.agents.delete_agent.assert_called_once()
+        mock_project_client.agents.create_run.assert_called_once()
+        mock_project_client.agents.delete_agent.assert_not_called()
     
     def test_process_message_run_failed(self, service, mock_project_client):
         """エージェント実行が失敗した場合のprocess_messageメソッドの挙動をテスト"""
@@ -241,21 +351,21 @@ class TestAssistantManagerService:
         run = Mock()
         type(run).status = PropertyMock(return_value=RunStatus.FAILED)
         run.last_error = "Test error"
-        mock_project_client.agents.create_and_process_run.return_value = run
+        mock_project_client.agents.create_run.return_value = run
         
         # メソッド実行
         result = service.process_message("Test prompt")
         
         # 検証
         assert result == "Error: Test error"
-        mock_project_client.agents.delete_agent.assert_called_once()
+        mock_project_client.agents.delete_agent.assert_not_called()
     
     def test_process_message_no_response(self, service, mock_project_client):
         """エージェントから応答がない場合のprocess_messageメソッドの挙動をテスト"""
         # 実行成功のモック
         run = Mock()
         type(run).status = PropertyMock(side_effect=lambda: RunStatus.FAILED.__class__("completed"))
-        mock_project_client.agents.create_and_process_run.return_value = run
+        mock_project_client.agents.create_run.return_value = run
         
         # 空のメッセージリストのモック
         messages = Mock()
@@ -267,13 +377,602 @@ class TestAssistantManagerService:
         
         # 検証
         assert result == "No response found"
-        mock_project_client.agents.delete_agent.assert_called_once()
+        mock_project_client.agents.delete_agent.assert_not_called()
     
-    @patch.object(AssistantManagerService, "_create_basic_agent", side_effect=Exception("Unexpected error"))
+    @patch.object(AssistantManagerService, "_get_basic_agent", side_effect=Exception("Unexpected error"))
     def test_process_message_unexpected_exception(self, mock_create_agent, service):
         """予期しない例外が発生した場合のprocess_messageメソッドの挙動をテスト"""
         # メソッド実行
         result = service.process_message("Test prompt")
         
         # 検証
-        assert result == "Error processing request: Unexpected error"
\ No newline at end of file
+        assert result == "Error processing request: Unexpected error"
+    
+    # 非同期クライアント対応テスト
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_process_openapi_spec_async_client(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """非同期クライアントのメソッドがそのままawaitされることをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        service = AssistantManagerService(mock_async_project_client)
+        
+        result = await service.process_openapi_spec(MessageRequest(message="Test message"))
+        
+        assert result == {"response": "This is a test response"}
+        mock_async_project_client.agents.create_run.assert_awaited_once_with(
+            thread_id="test-thread-id", agent_id="test-agent-id"
+        )
+        mock_async_project_client.agents.delete_agent.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_process_openapi_spec_runs_concurrently(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """複数のリクエストがイベントループをブロックせず並行に処理されることをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        run = mock_async_project_client.agents.create_run.return_value
+        
+        async def slow_run(**kwargs):
+            await asyncio.sleep(0.2)
+            return run
+        mock_async_project_client.agents.create_run.side_effect = slow_run
+        service = AssistantManagerService(mock_async_project_client)
+        
+        started = time.perf_counter()
+        results = await asyncio.gather(*[
+            service.process_openapi_spec(MessageRequest(message=f"Test message {i}"))
+            for i in range(20)
+        ])
+        elapsed = time.perf_counter() - started
+        
+        assert all(result == {"response": "This is a test response"} for result in results)
+        assert elapsed < 1.0
+
+    @pytest.mark.asyncio
+    async def test_run_wait_keeps_event_loop_responsive(self, mock_async_project_client):
+        """ポーリング方針を指定しない場合も実行の完了待ちで実際に待機しつつ、イベントループを解放し続けることをテスト"""
+        agents = mock_async_project_client.agents
+        agents.create_run.return_value = make_run(RunStatus.QUEUED)
+        agents.get_run.side_effect = [make_run(RunStatus.IN_PROGRESS), make_run(RunStatus.COMPLETED)]
+        service = AssistantManagerService(mock_async_project_client)
+        gaps = []
+
+        async def ticker():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                gaps.append(time.perf_counter() - started)
+
+        ticking = asyncio.create_task(ticker())
+        try:
+            started = time.perf_counter()
+            result = await service.process_message_async("Test prompt")
+            elapsed = time.perf_counter() - started
+        finally:
+            ticking.cancel()
+
+        assert result == "This is a test response"
+        agents.create_and_process_run.assert_not_called()
+        assert elapsed >= 0.3
+        assert len(gaps) >= 10
+        assert max(gaps) < 0.1
+
+    @pytest.mark.asyncio
+    async def test_generate_text_raises_on_failed_run(self, mock_async_project_client):
+        """generate_textは実行の失敗を例外で通知し、process_message_asyncはエラーメッセージを返すことをテスト"""
+        run = make_run(RunStatus.FAILED)
+        run.last_error = "rate_limit_exceeded"
+        mock_async_project_client.agents.create_run.return_value = run
+        service = AssistantManagerService(mock_async_project_client)
+        
+        with pytest.raises(AgentRunError) as error:
+            await service.generate_text("Test prompt")
+        
+        assert error.value.last_error == "rate_limit_exceeded"
+        assert await service.process_message_async("Test prompt") == "Error: rate_limit_exceeded"
+    
+    @pytest.mark.asyncio
+    async def test_process_message_async(self, mock_async_project_client):
+        """process_message_asyncメソッドが非同期クライアントで応答を返すことをテスト"""
+        service = AssistantManagerService(mock_async_project_client)
+        
+        result = await service.process_message_async("Test prompt")
+        
+        assert result == "This is a test response"
+        mock_async_project_client.agents.delete_agent.assert_not_awaited()
+
+    
+    # ストリーミング応答テスト
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_stream_openapi_spec_async_client(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """stream_openapi_specメソッドがツール進捗とテキスト差分を逐次返すことをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        mock_async_project_client.agents.create_stream.return_value = FakeAsyncRunStream(
+            make_stream_events("東京都の", "補助金です")
+        )
+        service = AssistantManagerService(mock_async_project_client)
+        
+        events = [event async for event in service.stream_openapi_spec(MessageRequest(message="Test message"))]
+        
+        assert events == [
+            {"event": "tool_call", "data": {"step_id": "step-1", "status": "in_progress", "tools": ["subsidies_api_getSubsidiesList"]}},
+            {"event": "delta", "data": {"text": "東京都の"}},
+            {"event": "delta", "data": {"text": "補助金です"}},
+            {"event": "done", "data": {"response": "東京都の補助金です"}},
+        ]
+        mock_async_project_client.agents.delete_agent.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_stream_message_sync_client(self, service, mock_project_client):
+        """同期クライアントのストリームもイベントループをブロックせずに反復できることをテスト"""
+        mock_project_client.agents.create_stream.return_value = FakeRunStream(make_stream_events("テスト応答"))
+        
+        events = [event async for event in service.stream_message("Test prompt")]
+        
+        assert events[-2:] == [
+            {"event": "delta", "data": {"text": "テスト応答"}},
+            {"event": "done", "data": {"response": "テスト応答"}},
+        ]
+        mock_project_client.agents.delete_agent.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_stream_message_run_failed(self, service, mock_project_client):
+        """実行失敗イベントを受信した場合にerrorイベントで終了することをテスト"""
+        run = Mock(spec=ThreadRun)
+        run.last_error = "Test error"
+        mock_project_client.agents.create_stream.return_value = FakeRunStream([
+            (AgentStreamEvent.THREAD_RUN_FAILED, run, None),
+        ])
+        
+        events = [event async for event in service.stream_message("Test prompt")]
+        
+        assert events == [{"event": "error", "data": {"error": "Run failed: Test error"}}]
+
+    
+    # 会話セッションテスト
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_process_openapi_spec_reuses_session_thread(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """同じセッションIDの後続メッセージでスレッド作成を省略することをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        service = AssistantManagerService(mock_async_project_client, session_store=SessionStore())
+        
+        first = await service.process_openapi_spec(MessageRequest(message="最初の質問", start_session=True))
+        second = await service.process_openapi_spec(
+            MessageRequest(message="続けての質問", session_id=first["session_id"])
+        )
+        
+        assert first["response"] == "This is a test response"
+        assert second == {"response": "This is a test response", "session_id": first["session_id"]}
+        mock_async_project_client.agents.create_thread.assert_awaited_once()
+        assert mock_async_project_client.agents.create_message.await_count == 2
+        mock_async_project_client.agents.create_message.assert_awaited_with(
+            thread_id="test-thread-id", role=MessageRole.USER, content="続けての質問"
+        )
+
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_one_shot_message_releases_thread_without_session(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """セッションを要求しないメッセージはセッションを作成せず、スレッドをすぐに解放することをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        store = SessionStore()
+        reaper = ThreadReaper(mock_async_project_client)
+        service = AssistantManagerService(mock_async_project_client, session_store=store, thread_reaper=reaper)
+        
+        result = await service.process_openapi_spec(MessageRequest(message="質問"))
+        
+        assert result == {"response": "This is a test response"}
+        assert len(store) == 0
+        assert reaper.stats()["pending"] == 1
+
+    
+    # スレッド回収テスト
+    @pytest.mark.asyncio
+    async def test_process_message_releases_thread(self, mock_async_project_client):
+        """セッションに紐づかないスレッドが実行後にリーパーへ解放されることをテスト"""
+        reaper = ThreadReaper(mock_async_project_client)
+        service = AssistantManagerService(mock_async_project_client, thread_reaper=reaper)
+        
+        await service.process_message_async("Test prompt")
+        
+        assert reaper.stats()["pending"] == 1
+        mock_async_project_client.agents.delete_thread.assert_not_awaited()
+
+    
+    # エージェント再利用テスト
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_create_agent_once(self, mock_async_project_client):
+        """同時に到着したリクエストでもエージェントが1回だけ作成されることをテスト"""
+        agent = mock_async_project_client.agents.create_agent.return_value
+        
+        async def slow_create_agent(**kwargs):
+            await asyncio.sleep(0.05)
+            return agent
+        mock_async_project_client.agents.create_agent.side_effect = slow_create_agent
+        service = AssistantManagerService(mock_async_project_client)
+        
+        results = await asyncio.gather(*[service.process_message_async(f"Prompt {i}") for i in range(10)])
+        
+        assert all(result == "This is a test response" for result in results)
+        mock_async_project_client.agents.create_agent.assert_awaited_once()
+
+    
+    # 応答キャッシュテスト
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_process_openapi_spec_returns_cached_response(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """表記揺れのある同じ質問にエージェントを実行せずキャッシュから応答することをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        cache = ResponseCache()
+        service = AssistantManagerService(
+            mock_async_project_client, session_store=SessionStore(), response_cache=cache
+        )
+        
+        first = await service.process_openapi_spec(MessageRequest(message="東京都のIT補助金を教えて"))
+        second = await service.process_openapi_spec(MessageRequest(message="東京都のＩＴ補助金を教えて？"))
+        
+        assert first["response"] == "This is a test response"
+        assert second == {"response": "This is a test response"}
+        mock_async_project_client.agents.create_run.assert_awaited_once()
+        assert cache.stats()["hits"] == 1
+    
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_process_openapi_spec_bypasses_cache(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """bypass_cache指定時と会話の途中のメッセージではキャッシュを使用しないことをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        cache = ResponseCache()
+        service = AssistantManagerService(
+            mock_async_project_client, session_store=SessionStore(), response_cache=cache
+        )
+        
+        first = await service.process_openapi_spec(MessageRequest(message="質問", start_session=True))
+        await service.process_openapi_spec(MessageRequest(message="質問", bypass_cache=True))
+        await service.process_openapi_spec(MessageRequest(message="質問", session_id=first["session_id"]))
+        
+        assert mock_async_project_client.agents.create_run.await_count == 3
+        assert cache.stats()["hits"] == 0
+
+    
+    # リクエスト合流テスト
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_identical_in_flight_messages_share_one_run(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """処理中の同じ質問が1回のエージェント実行を共有し、セッションを要求しない応答にはセッションを付与しないことをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        run = mock_async_project_client.agents.create_run.return_value
+        
+        async def slow_run(**kwargs):
+            await asyncio.sleep(0.05)
+            return run
+        mock_async_project_client.agents.create_run.side_effect = slow_run
+        service = AssistantManagerService(
+            mock_async_project_client, session_store=SessionStore(), request_coalescer=RequestCoalescer()
+        )
+        
+        results = await asyncio.gather(*[
+            service.process_openapi_spec(MessageRequest(message="東京都のIT補助金を教えて"))
+            for _ in range(5)
+        ])
+        
+        assert all(result["response"] == "This is a test response" for result in results)
+        assert not any("session_id" in result for result in results)
+        mock_async_project_client.agents.create_run.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_identical_in_flight_prompts_share_one_run(self, mock_async_project_client):
+        """処理中の同じプロンプトが1回のエージェント実行を共有することをテスト"""
+        run = mock_async_project_client.agents.create_run.return_value
+        
+        async def slow_run(**kwargs):
+            await asyncio.sleep(0.05)
+            return run
+        mock_async_project_client.agents.create_run.side_effect = slow_run
+        service = AssistantManagerService(mock_async_project_client, request_coalescer=RequestCoalescer())
+        
+        results = await asyncio.gather(*[service.process_message_async("Test prompt") for _ in range(5)])
+        
+        assert results == ["This is a test response"] * 5
+        mock_async_project_client.agents.create_run.assert_awaited_once()
+    
+    # アドミッション制御テスト
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_admission_is_taken_only_for_agent_runs(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """キャッシュから応答する場合とレーンが未設定の場合は実行枠を取得せず、エージェントを実行する場合だけ取得することをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        admission = AdmissionController(
+            max_concurrency=1,
+            lanes={LANE_INTERACTIVE: AdmissionLane(priority=0, max_concurrency=1, max_queue_size=1, queue_timeout_seconds=0.01)},
+        )
+        service = AssistantManagerService(
+            mock_async_project_client, response_cache=ResponseCache(), admission_controller=admission
+        )
+        await service.process_openapi_spec(MessageRequest(message="東京都のIT補助金を教えて"))
+        # 実行枠がすべて使用中でも、キャッシュから応答する質問と、レーンを設定しない呼び出しは待たずに処理する
+        ticket = await admission.acquire(LANE_INTERACTIVE)
+        
+        with admission.lane(LANE_INTERACTIVE):
+            cached = await service.process_openapi_spec(MessageRequest(message="東京都のIT補助金を教えて"))
+            with pytest.raises(AdmissionRejected):
+                await service.process_openapi_spec(MessageRequest(message="大阪府の補助金を教えて"))
+            with pytest.raises(AdmissionRejected):
+                await service.process_message_async("Test prompt")
+        
+        assert cached == {"response": "This is a test response"}
+        assert await service.process_message_async("Test prompt") == "This is a test response"
+        assert mock_async_project_client.agents.create_run.await_count == 2
+        admission.release(ticket)
+        assert admission.stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_coalesced_requests_share_one_admission(self, mock_async_project_client):
+        """処理中の実行に合流するリクエストが実行枠を取得せず、待たされたり拒否されたりしないことをテスト"""
+        run = mock_async_project_client.agents.create_run.return_value
+        
+        async def slow_run(**kwargs):
+            await asyncio.sleep(0.05)
+            return run
+        mock_async_project_client.agents.create_run.side_effect = slow_run
+        admission = AdmissionController(
+            max_concurrency=1,
+            lanes={LANE_INTERACTIVE: AdmissionLane(priority=0, max_concurrency=1, max_queue_size=1, queue_timeout_seconds=0.01)},
+        )
+        service = AssistantManagerService(
+            mock_async_project_client, request_coalescer=RequestCoalescer(), admission_controller=admission
+        )
+        
+        with admission.lane(LANE_INTERACTIVE):
+            results = await asyncio.gather(*[service.process_message_async("Test prompt") for _ in range(5)])
+        
+        assert results == ["This is a test response"] * 5
+        mock_async_project_client.agents.create_run.assert_awaited_once()
+        assert admission.stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    async def test_subsidy_agent_uses_function_tool(self, mock_load_spec, mock_async_project_client):
+        """関数ツールを指定した場合はOpenAPIスペックを使わず、エージェントにツールセットを登録することをテスト"""
+        mock_async_project_client.agents._toolset = {}
+        tool = create_subsidies_function_tool(SubsidiesApiClient())
+        service = AssistantManagerService(mock_async_project_client, subsidies_tool=tool)
+        
+        result = await service.process_openapi_spec(MessageRequest(message="Test message"))
+        
+        assert result == {"response": "This is a test response"}
+        mock_load_spec.assert_not_called()
+        tools = mock_async_project_client.agents.create_agent.await_args.kwargs["tools"]
+        assert [definition.function.name for definition in tools] == ["getSubsidiesList", "getSubsidyDetail"]
+        assert mock_async_project_client.agents._toolset["test-agent-id"] is service.subsidies_toolset
+    
+    @pytest.mark.asyncio
+    @patch("services.assistant_manager_service.swagger_spec_tool.create_subsidies_tool")
+    async def test_openapi_tool_is_shared_between_requests(self, mock_create_tool, mock_async_project_client):
+        """OpenAPIスペックの読み込みとツールの作成をリクエストごとに行わないことをテスト"""
+        mock_tool = Mock()
+        mock_tool.definitions = [{"type": "openapi"}]
+        mock_create_tool.return_value = mock_tool
+        service = AssistantManagerService(mock_async_project_client)
+        
+        for _ in range(3):
+            result = await service.process_openapi_spec(MessageRequest(message="Test message"))
+            assert result == {"response": "This is a test response"}
+        
+        mock_create_tool.assert_called_once()
+        assert service.spec_registry.stats()["loads"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_run_poller_waits_for_completion(self, mock_async_project_client):
+        """ポーリング方針を指定した場合は実行を作成し、完了まで状態を確認することをテスト"""
+        agents = mock_async_project_client.agents
+        agents.create_run.return_value = make_run(RunStatus.QUEUED)
+        agents.get_run.side_effect = [make_run(RunStatus.IN_PROGRESS), make_run(RunStatus.COMPLETED)]
+        poller = make_poller()
+        service = AssistantManagerService(mock_async_project_client, run_poller=poller)
+        
+        result = await service.process_message_async("Test prompt")
+        
+        assert result == "This is a test response"
+        agents.create_and_process_run.assert_not_called()
+        assert agents.get_run.await_count == 2
+        assert poller.stats()["runs"] == 1
+        assert poller.stats()["status_calls"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_run_poller_submits_function_tool_outputs(self, mock_async_project_client):
+        """関数ツールの呼び出しを要求された場合はツールセットで実行して結果を送信することをテスト"""
+        agents = mock_async_project_client.agents
+        agents._toolset = {}
+        tool_call = Mock()
+        tool_call.type = "function"
+        required_action = Mock(spec=SubmitToolOutputsAction)
+        required_action.submit_tool_outputs.tool_calls = [tool_call]
+        agents.create_run.return_value = make_run(RunStatus.QUEUED)
+        agents.get_run.side_effect = [
+            make_run(RunStatus.REQUIRES_ACTION, required_action), make_run(RunStatus.COMPLETED)
+        ]
+        tool = create_subsidies_function_tool(SubsidiesApiClient())
+        service = AssistantManagerService(mock_async_project_client, subsidies_tool=tool, run_poller=make_poller())
+        service.subsidies_toolset.execute_tool_calls = AsyncMock(return_value=[{"tool_call_id": "call-1", "output": "{}"}])
+        
+        result = await service.process_openapi_spec(MessageRequest(message="Test message"))
+        
+        assert result == {"response": "This is a test response"}
+        service.subsidies_toolset.execute_tool_calls.assert_awaited_once_with([tool_call])
+        agents.submit_tool_outputs_to_run.assert_awaited_once_with(
+            thread_id="test-thread-id", run_id="test-run-id", tool_outputs=[{"tool_call_id": "call-1", "output": "{}"}]
+        )
+    
+    @pytest.mark.asyncio
+    async def test_run_poller_cancels_run_after_timeout(self, mock_async_project_client):
+        """期限までに完了しない実行をキャンセルし、エラーを返すことをテスト"""
+        agents = mock_async_project_client.agents
+        agents.create_run.return_value = make_run(RunStatus.QUEUED)
+        agents.get_run.return_value = make_run(RunStatus.IN_PROGRESS)
+        poller = RunPoller(initial_interval_seconds=0.01, jitter_ratio=0, timeout_seconds=0.05)
+        service = AssistantManagerService(mock_async_project_client, run_poller=poller)
+        
+        result = await service.process_message_async("Test prompt")
+        
+        assert result.startswith("Error processing request: Run did not complete within 0.05 seconds")
+        agents.cancel_run.assert_awaited_once_with(thread_id="test-thread-id", run_id="test-run-id")
+        assert poller.stats()["timeouts"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_response_text_fetches_only_latest_run_message(self, mock_async_project_client):
+        """応答の取得で実行が作成した最新のメッセージ1件のみを取得し、テキストの部分をつなぐことをテスト"""
+        agents = mock_async_project_client.agents
+        run = make_run(RunStatus.COMPLETED)
+        agents.create_run.return_value = run
+        first = Mock(spec=MessageTextContent)
+        first.text.value = "1行目"
+        image = Mock(spec=MessageImageFileContent)
+        second = Mock(spec=MessageTextContent)
+        second.text.value = "2行目"
+        message = Mock()
+        message.role = MessageRole.AGENT
+        message.content = [first, image, second]
+        agents.list_messages.return_value.data = [message]
+        service = AssistantManagerService(mock_async_project_client)
+        
+        result = await service.process_message_async("Test prompt")
+        
+        assert result == "1行目\n2行目"
+        agents.list_messages.assert_awaited_once_with(
+            thread_id="test-thread-id", run_id="test-run-id", limit=1, order=ListSortOrder.DESCENDING
+        )
+    
+    @pytest.mark.asyncio
+    async def test_stages_are_timed(self, mock_async_project_client):
+        """エージェント呼び出しの各段階の所要時間を計測することをテスト"""
+        service = AssistantManagerService(mock_async_project_client)
+        
+        token = metrics.begin_request()
+        try:
+            await service.process_message_async("Test prompt")
+            server_timing = metrics.server_timing()
+        finally:
+            metrics.end_request(token)
+        
+        stages = [entry.split(";")[0] for entry in server_timing.split(", ")]
+        assert stages == ["get_agent", "create_thread", "create_message", "run", "list_messages"]
+    
+    @pytest.mark.asyncio
+    async def test_rate_limiter_reconciles_run_usage(self, mock_async_project_client):
+        """レート制限を指定した場合、実行前に予約し実行後に実際の使用量で精算することをテスト"""
+        run = make_run(RunStatus.COMPLETED)
+        run.usage = Mock(prompt_tokens=120, completion_tokens=30)
+        mock_async_project_client.agents.create_run.return_value = run
+        rate_limiter = TokenRateLimiter(tokens_per_minute=60000, requests_per_minute=60)
+        service = AssistantManagerService(mock_async_project_client, rate_limiter=rate_limiter)
+        
+        result = await service.process_message_async("Test prompt")
+        
+        assert result == "This is a test response"
+        stats = rate_limiter.stats()
+        assert stats["reservations"] == 1
+        assert stats["actual_tokens"] == 150
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_rejection_does_not_open_circuit(self, mock_async_project_client):
+        """クォータの待ち時間による拒否を実行の失敗として数えず、回路を開かないことをテスト"""
+        mock_async_project_client.agents.create_run.return_value = make_run(RunStatus.COMPLETED)
+        rate_limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1, max_wait_seconds=0.5)
+        guard = RunGuard(breaker=CircuitBreaker(failure_threshold=2), hedging=False)
+        service = AssistantManagerService(mock_async_project_client, rate_limiter=rate_limiter, run_guard=guard)
+        
+        assert await service.generate_text("Test prompt") == "This is a test response"
+        for _ in range(3):
+            with pytest.raises(RateLimitExceeded):
+                await service.generate_text("Test prompt")
+        
+        assert guard.breaker.state == CIRCUIT_CLOSED
+        assert guard.stats()["runs"] == 1
+        assert guard.stats()["failures"] == 0
+        assert rate_limiter.stats()["rejected"] == 3
+        mock_async_project_client.agents.create_thread.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_wait_is_not_counted_as_run_time(self, mock_async_project_client):
+        """クォータの待ち時間を実行時間に含めず、待ち時間でヘッジして2つ目の予約やスレッドを作らないことをテスト"""
+        mock_async_project_client.agents.create_run.return_value = make_run(RunStatus.COMPLETED)
+        # 1件目は即座に、2件目は0.1秒待ってから実行される
+        rate_limiter = TokenRateLimiter(requests_per_minute=600, burst_seconds=0.1)
+        guard = RunGuard(hedge_min_samples=1, hedge_min_delay_seconds=0.01)
+        service = AssistantManagerService(mock_async_project_client, rate_limiter=rate_limiter, run_guard=guard)
+        
+        await service.generate_text("First prompt")
+        await service.generate_text("Second prompt")
+        
+        assert rate_limiter.stats()["delayed"] == 1
+        assert rate_limiter.stats()["reservations"] == 2
+        assert guard.stats()["hedges"] == 0
+        assert guard.hedge_delay() < 0.05
+        assert mock_async_project_client.agents.create_thread.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_hedged_run_reserves_its_own_quota(self, mock_async_project_client):
+        """ヘッジの実行は2つ目の予約を行い、クォータの残量がない場合はヘッジしないことをテスト"""
+        calls = 0
+        
+        async def slow_first_run(**kwargs):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                await asyncio.sleep(0.2)
+            return make_run(RunStatus.COMPLETED)
+        mock_async_project_client.agents.create_run.side_effect = slow_first_run
+        guard = RunGuard(hedge_min_samples=1, hedge_min_delay_seconds=0.01)
+        guard._latencies.append(0.01)
+        # 2回分の予約を待たずに行える
+        rate_limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=2)
+        service = AssistantManagerService(mock_async_project_client, rate_limiter=rate_limiter, run_guard=guard)
+        
+        assert await service.generate_text("First prompt") == "This is a test response"
+        assert guard.stats()["hedges"] == 1
+        assert rate_limiter.stats()["reservations"] == 2
+        
+        # 1回分の予約しか待たずに行えない場合はヘッジしない
+        calls = 0
+        service.rate_limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1)
+        assert await service.generate_text("Second prompt") == "This is a test response"
+        
+        assert guard.stats()["hedges"] == 1
+        assert guard.stats()["hedges_skipped"] == 1
+        assert service.rate_limiter.stats()["reservations"] == 1
+        assert mock_async_project_client.agents.create_run.await_count == 3
+    
+    @pytest.mark.asyncio
+    @patch.object(AssistantManagerService, "load_openapi_spec")
+    @patch.object(AssistantManagerService, "create_openapi_tool")
+    async def test_warm_up_resolves_agents_and_opens_connections(self, mock_create_tool, mock_load_spec, mock_async_project_client):
+        """ウォームアップでエージェントを解決し、指定した数の接続を確立する呼び出しを行うことをテスト"""
+        mock_load_spec.return_value = {"spec": "value"}
+        mock_create_tool.return_value = Mock(definitions=[{"type": "openapi"}])
+        service = AssistantManagerService(mock_async_project_client)
+        
+        agent_ids = await service.warm_up(connections=3)
+        await service.process_message_async("Test prompt")
+        
+        assert agent_ids == {"subsidy": "test-agent-id", "basic": "test-agent-id"}
+        mock_load_spec.assert_called_once()
+        assert mock_async_project_client.agents.create_agent.await_count == 2
+        assert mock_async_project_client.agents.get_agent.await_count == 3
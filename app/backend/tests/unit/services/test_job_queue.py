@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from services.job_queue import (
+    JOB_FAILED, JOB_QUEUED, JOB_SUCCEEDED, JobQueue, JobQueueFull, JobStore
+)
+
+
+class TestJobQueue:
+
+    @pytest.mark.asyncio
+    async def test_submitted_job_runs_in_background(self):
+        """登録したジョブがワーカーで実行され、結果を取得できることをテスト"""
+        async def handler(payload):
+            await asyncio.sleep(0.01)
+            return {"echo": payload["value"]}
+        queue = JobQueue(handler)
+        queue.start()
+        try:
+            job = await queue.submit({"value": 1})
+            assert job.status == JOB_QUEUED
+
+            finished = await queue.wait(job.job_id, timeout=1)
+        finally:
+            await queue.stop()
+
+        assert finished.status == JOB_SUCCEEDED
+        assert finished.to_dict()["result"] == {"echo": 1}
+
+    @pytest.mark.asyncio
+    async def test_failed_job_records_error(self):
+        """ハンドラーの例外がジョブのエラーとして記録されることをテスト"""
+        async def handler(payload):
+            raise ValueError("generation failed")
+        queue = JobQueue(handler)
+        queue.start()
+        try:
+            job = await queue.submit({})
+            finished = await queue.wait(job.job_id, timeout=1)
+        finally:
+            await queue.stop()
+
+        assert finished.status == JOB_FAILED
+        assert finished.to_dict()["error"] == "generation failed"
+
+    @pytest.mark.asyncio
+    async def test_worker_pool_bounds_concurrency(self):
+        """同時に実行されるジョブ数がワーカー数を超えないことをテスト"""
+        running = 0
+        peak = 0
+
+        async def handler(payload):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return {}
+        queue = JobQueue(handler, workers=2)
+        queue.start()
+        try:
+            jobs = [await queue.submit({}) for _ in range(6)]
+            await asyncio.gather(*[queue.wait(job.job_id, timeout=1) for job in jobs])
+        finally:
+            await queue.stop()
+
+        assert peak == 2
+        assert all([(await queue.get(job.job_id)).status == JOB_SUCCEEDED for job in jobs])
+
+    @pytest.mark.asyncio
+    async def test_submit_rejects_when_queue_is_full(self):
+        """実行待ちのジョブ数が上限に達した場合に受付を拒否することをテスト"""
+        async def handler(payload):
+            return {}
+        queue = JobQueue(handler, max_queue_size=1)
+
+        await queue.submit({})
+        with pytest.raises(JobQueueFull):
+            await queue.submit({})
+
+    @pytest.mark.asyncio
+    async def test_wait_returns_unfinished_job_after_timeout(self):
+        """期限までに完了しない場合は未完了のジョブを返すことをテスト"""
+        async def handler(payload):
+            return {}
+        queue = JobQueue(handler)
+        job = await queue.submit({})
+
+        result = await queue.wait(job.job_id, timeout=0.05)
+
+        assert result.status == JOB_QUEUED
+        assert await queue.wait("unknown", timeout=0.05) is None
+
+
+class TestJobStore:
+
+    @pytest.mark.asyncio
+    async def test_finished_jobs_expire_after_ttl(self):
+        """完了したジョブが保持期限を過ぎると破棄されることをテスト"""
+        async def handler(payload):
+            return {}
+        store = JobStore(ttl_seconds=60)
+        queue = JobQueue(handler, store=store)
+        with patch("services.job_queue.time.time", return_value=1000.0):
+            job = await queue.submit({})
+            await queue._run(job.job_id)
+
+        with patch("services.job_queue.time.time", return_value=1059.0):
+            assert await store.get(job.job_id) is not None
+        with patch("services.job_queue.time.time", return_value=1061.0):
+            assert await store.get(job.job_id) is None
+
+    @pytest.mark.asyncio
+    async def test_persisted_jobs_are_visible_to_other_stores(self, tmp_path):
+        """永続化したジョブが別のストア（他のワーカー）から参照できることをテスト"""
+        path = str(tmp_path / "jobs.db")
+        async def handler(payload):
+            return {"template": "生成結果"}
+        queue = JobQueue(handler, store=JobStore(persist_path=path))
+        job = await queue.submit({"value": 1})
+        await queue._run(job.job_id)
+
+        loaded = await JobStore(persist_path=path).get(job.job_id)
+
+        assert loaded.status == JOB_SUCCEEDED
+        assert loaded.payload == {"value": 1}
+        assert loaded.result == {"template": "生成結果"}
+
+    @pytest.mark.asyncio
+    async def test_evict_expired_removes_persisted_jobs(self, tmp_path):
+        """定期処理の破棄で、保持期限を過ぎた完了済みのジョブを永続化先からも削除することをテスト"""
+        path = str(tmp_path / "jobs.db")
+        async def handler(payload):
+            return {}
+        store = JobStore(ttl_seconds=60, persist_path=path)
+        queue = JobQueue(handler, store=store)
+        with patch("services.job_queue.time.time", return_value=1000.0):
+            finished = await queue.submit({})
+            await queue._run(finished.job_id)
+            queued = await queue.submit({})
+
+        assert await store.evict_expired(now=1061.0) == 1
+        assert len(store) == 1
+        other = JobStore(ttl_seconds=60, persist_path=path)
+        with patch("services.job_queue.time.time", return_value=1000.0):
+            assert await other.get(finished.job_id) is None
+            assert await other.get(queued.job_id) is not None
+
+    @pytest.mark.asyncio
+    async def test_persisted_jobs_are_accessed_off_the_event_loop(self, tmp_path):
+        """永続化したジョブの読み書きをスレッドプールで行い、取得時には期限切れの削除を行わないことをテスト"""
+        store = JobStore(persist_path=str(tmp_path / "jobs.db"))
+        threads = []
+
+        def record_thread(method):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return method(*args)
+            return wrapper
+
+        queue = JobQueue(lambda payload: None, store=store)
+        with patch.object(store, "_load", side_effect=record_thread(store._load)), \
+                patch.object(store, "_persist", side_effect=record_thread(store._persist)), \
+                patch.object(store, "_delete_expired") as delete_expired:
+            job = await queue.submit({})
+            assert (await queue.get(job.job_id)).status == JOB_QUEUED
+
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
+        delete_expired.assert_not_called()
@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import Mock
+from services.metrics import Metrics
+
+
+class TestMetrics:
+
+    def test_track_records_histogram_and_errors(self):
+        """段階の所要時間をヒストグラムに記録し、例外をエラー数に加えることをテスト"""
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.observe("run", 0.5)
+        metrics.observe("run", 2)
+        with pytest.raises(ValueError):
+            with metrics.track("create_thread"):
+                raise ValueError("failed")
+
+        output = metrics.render()
+
+        assert 'app_stage_duration_seconds_bucket{stage="run",le="0.1"} 0' in output
+        assert 'app_stage_duration_seconds_bucket{stage="run",le="1.0"} 1' in output
+        assert 'app_stage_duration_seconds_bucket{stage="run",le="+Inf"} 2' in output
+        assert 'app_stage_duration_seconds_sum{stage="run"} 2.5' in output
+        assert 'app_stage_duration_seconds_count{stage="run"} 2' in output
+        assert 'app_stage_errors_total{stage="create_thread"} 1' in output
+        assert 'app_stage_in_flight{stage="create_thread"} 0' in output
+
+    def test_in_flight_gauge(self):
+        """計測中の段階を実行中の件数として出力することをテスト"""
+        metrics = Metrics()
+
+        with metrics.track("run"):
+            assert 'app_stage_in_flight{stage="run"} 1' in metrics.render()
+
+    def test_tokens_and_collectors(self):
+        """トークン使用量と登録した統計を出力することをテスト"""
+        metrics = Metrics()
+        metrics.record_tokens(Mock(prompt_tokens=100, completion_tokens=20))
+        metrics.record_tokens(None)
+        metrics.register_collector("response_cache", lambda: {"hits": 3, "misses": 1})
+
+        output = metrics.render()
+
+        assert 'app_agent_tokens_total{type="prompt"} 100' in output
+        assert 'app_agent_tokens_total{type="completion"} 20' in output
+        assert "app_response_cache_hits 3" in output
+        assert "app_response_cache_misses 1" in output
+
+    def test_server_timing_for_current_request(self):
+        """リクエストの処理中に計測した段階のみを Server-Timing の値にすることをテスト"""
+        metrics = Metrics()
+        metrics.observe("run", 1)
+
+        token = metrics.begin_request()
+        try:
+            metrics.observe("create_message", 0.002)
+            metrics.observe("run", 0.25)
+            metrics.observe("run", 0.5)
+            assert metrics.server_timing() == "create_message;dur=2.0, run;dur=750.0"
+        finally:
+            metrics.end_request(token)
+
+        assert metrics.server_timing() == ""
@@ -0,0 +1,37 @@
+import pytest
+from unittest.mock import Mock
+from services.project_client import PooledAioHttpTransport, create_project_client
+
+
+class TestProjectClient:
+
+    @pytest.mark.asyncio
+    async def test_transport_opens_session_with_connection_pool(self):
+        """トランスポートが指定した大きさの接続プールを持つセッションを1つだけ作成することをテスト"""
+        transport = PooledAioHttpTransport(pool_size=8, keepalive_timeout=15)
+
+        await transport.open()
+        session = transport.session
+        await transport.open()
+
+        assert transport.session is session
+        assert session.connector.limit == 8
+        assert session.connector.limit_per_host == 8
+        await transport.close()
+        assert transport.session is None
+
+    def test_create_project_client_shares_transport(self):
+        """クライアント内部のパイプラインが同じトランスポートを共有することをテスト"""
+        client = create_project_client(
+            "eastus.api.azureml.ms;00000000-0000-0000-0000-000000000000;rg;project",
+            Mock(),
+            pool_size=4
+        )
+
+        transports = [
+            pipeline_client._pipeline._transport
+            for pipeline_client in (client._client0, client._client1, client._client2, client._client3)
+        ]
+        assert isinstance(transports[0], PooledAioHttpTransport)
+        assert transports[0].pool_size == 4
+        assert all(transport is transports[0] for transport in transports)
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from services.rate_limiter import RateLimitExceeded, TokenRateLimiter
+
+
+def make_usage(prompt_tokens, completion_tokens):
+    return Mock(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+class TestTokenRateLimiter:
+
+    def test_estimate_tokens_counts_japanese_per_character(self):
+        """英数字は4文字で1トークン、日本語は1文字で1トークンとして見積もることをテスト"""
+        limiter = TokenRateLimiter(overhead_tokens=0, expected_completion_tokens=0)
+
+        assert limiter.estimate_tokens("abcdefgh") == 2
+        assert limiter.estimate_tokens("補助金") == 3
+        assert limiter.estimate_tokens("IT導入補助金") == 1 + 5
+
+    @pytest.mark.asyncio
+    async def test_requests_within_burst_are_not_delayed(self):
+        """バケットの容量の範囲内のリクエストは待たずに実行されることをテスト"""
+        limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=3)
+
+        with patch("services.rate_limiter.asyncio.sleep", new_callable=AsyncMock) as sleep:
+            for _ in range(3):
+                reservation = await limiter.acquire("prompt")
+                assert reservation.wait_seconds == 0
+
+        sleep.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_requests_beyond_quota_are_spaced_out(self):
+        """クォータを超えたリクエストが上流で拒否されず、回復の速さに合わせて間隔を空けて実行されることをテスト"""
+        limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1)
+
+        with patch("services.rate_limiter.asyncio.sleep", new_callable=AsyncMock) as sleep:
+            reservations = [await limiter.acquire("prompt") for _ in range(3)]
+
+        waits = [reservation.wait_seconds for reservation in reservations]
+        assert waits[0] == 0
+        assert waits[1] == pytest.approx(1, abs=0.05)
+        assert waits[2] == pytest.approx(2, abs=0.05)
+        assert sleep.await_count == 2
+        assert limiter.stats()["delayed"] == 2
+
+    @pytest.mark.asyncio
+    async def test_reconcile_refunds_overestimated_tokens(self):
+        """実際の使用量が見積もりより少ない場合に差分をバケットに返すことをテスト"""
+        limiter = TokenRateLimiter(tokens_per_minute=6000, burst_seconds=10, overhead_tokens=0, expected_completion_tokens=500)
+        reservation = await limiter.acquire("prompt")
+        assert limiter.stats()["tokens_available"] == pytest.approx(1000 - reservation.estimated_tokens, abs=1)
+
+        await limiter.reconcile(reservation, make_usage(50, 50))
+        await limiter.reconcile(reservation, make_usage(50, 50))
+
+        stats = limiter.stats()
+        assert stats["tokens_available"] == pytest.approx(900, abs=1)
+        assert stats["actual_tokens"] == 100
+
+    @pytest.mark.asyncio
+    async def test_reconcile_charges_underestimated_tokens(self):
+        """実際の使用量が見積もりを超えた場合、超過分だけ後続のリクエストを待たせることをテスト"""
+        limiter = TokenRateLimiter(tokens_per_minute=600, burst_seconds=60, overhead_tokens=0, expected_completion_tokens=0)
+        reservation = await limiter.acquire("prompt")
+
+        await limiter.reconcile(reservation, make_usage(700, 0))
+
+        with patch("services.rate_limiter.asyncio.sleep", new_callable=AsyncMock):
+            next_reservation = await limiter.acquire("prompt")
+        # 100トークン超過 + 次の見積もり2トークン分を10トークン/秒で回復する
+        assert next_reservation.wait_seconds == pytest.approx(10.2, abs=0.1)
+
+    @pytest.mark.asyncio
+    async def test_wait_beyond_limit_is_rejected_and_refunded(self):
+        """待ち時間が上限を超える場合は拒否し、予約を取り消すことをテスト"""
+        limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1, max_wait_seconds=0.5)
+        await limiter.acquire("prompt")
+
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire("prompt")
+
+        stats = limiter.stats()
+        assert stats["rejected"] == 1
+        assert stats["requests_available"] == pytest.approx(0, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_try_acquire_reserves_only_without_waiting(self):
+        """待たずに実行できる場合だけ予約し、残量が足りない場合は予約せずにNoneを返すことをテスト"""
+        limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1)
+
+        reservation = await limiter.try_acquire("prompt")
+        assert reservation.wait_seconds == 0
+        assert await limiter.try_acquire("prompt") is None
+
+        stats = limiter.stats()
+        assert stats["reservations"] == 1
+        assert stats["requests_available"] == pytest.approx(0, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_wait_returns_reservation(self):
+        """待機中にキャンセルされた場合は予約を返すことをテスト"""
+        limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1)
+        await limiter.acquire("prompt")
+        waiting = asyncio.create_task(limiter.acquire("prompt"))
+        await asyncio.sleep(0)
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        assert limiter.stats()["requests_available"] == pytest.approx(0, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_persisted_bucket_is_shared_between_limiters(self, tmp_path):
+        """同じファイルを指定したレート制限（ワーカー）の間でクォータを共有することをテスト"""
+        path = str(tmp_path / "rate_limit.db")
+        first = TokenRateLimiter(requests_per_minute=60, burst_seconds=1, persist_path=path)
+        second = TokenRateLimiter(requests_per_minute=60, burst_seconds=1, persist_path=path)
+
+        await first.acquire("prompt")
+        with patch("services.rate_limiter.asyncio.sleep", new_callable=AsyncMock):
+            reservation = await second.acquire("prompt")
+
+        assert reservation.wait_seconds == pytest.approx(1, abs=0.05)
+
+    @pytest.mark.asyncio
+    async def test_persisted_bucket_is_updated_off_the_event_loop(self, tmp_path):
+        """ファイルに置いたバケットの更新をスレッドプールで行い、統計情報の取得ではファイルを読まないことをテスト"""
+        limiter = TokenRateLimiter(requests_per_minute=60, burst_seconds=1, persist_path=str(tmp_path / "rate_limit.db"))
+        apply = limiter._apply
+        threads = []
+
+        def record_thread(deltas):
+            threads.append(threading.get_ident())
+            return apply(deltas)
+
+        with patch.object(limiter, "_apply", side_effect=record_thread):
+            reservation = await limiter.acquire("prompt")
+            await limiter.reconcile(reservation, make_usage(10, 10))
+            stats = limiter.stats()
+
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
+        assert stats["requests_available"] == pytest.approx(0, abs=0.05)
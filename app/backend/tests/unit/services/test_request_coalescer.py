@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from services.request_coalescer import RequestCoalescer
+
+
+class TestRequestCoalescer:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_one_run(self):
+        """同じキーの同時リクエストが1回の実行結果を共有することをテスト"""
+        coalescer = RequestCoalescer()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*[coalescer.run("key", work) for _ in range(5)])
+
+        assert results == ["result"] * 5
+        assert len(calls) == 1
+        assert coalescer.stats() == {"inflight": 0, "started": 1, "coalesced": 4}
+
+    @pytest.mark.asyncio
+    async def test_different_keys_run_separately(self):
+        """キーが異なるリクエストは別々に実行されることをテスト"""
+        coalescer = RequestCoalescer()
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            coalescer.run("key-1", lambda: work(1)),
+            coalescer.run("key-2", lambda: work(2)),
+        )
+
+        assert results == [1, 2]
+        assert coalescer.stats()["started"] == 2
+
+    @pytest.mark.asyncio
+    async def test_exception_is_shared_with_all_callers(self):
+        """実行中の例外が合流したすべての呼び出し元に伝わることをテスト"""
+        coalescer = RequestCoalescer()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        results = await asyncio.gather(
+            coalescer.run("key", work), coalescer.run("key", work), return_exceptions=True
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert coalescer.stats()["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_first_caller_cancellation_does_not_affect_others(self):
+        """最初の呼び出し元がキャンセルされても合流した呼び出し元は結果を受け取れることをテスト"""
+        coalescer = RequestCoalescer()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        first = asyncio.create_task(coalescer.run("key", work))
+        second = asyncio.create_task(coalescer.run("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert await second == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    @pytest.mark.asyncio
+    async def test_run_is_cancelled_when_all_callers_leave(self):
+        """待っている呼び出し元が全員キャンセルされた場合に実行もキャンセルされることをテスト"""
+        coalescer = RequestCoalescer()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(coalescer.run("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert coalescer.stats()["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_request_after_cancellation_starts_new_run(self):
+        """キャンセル中の実行が終わる前に届いた同じリクエストは合流せず、新しく実行することをテスト"""
+        coalescer = RequestCoalescer()
+        release = asyncio.Event()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                # 上流の実行のキャンセルを待つ間も取り消し中の状態が続く
+                await release.wait()
+                raise
+            return "result"
+
+        async def quick():
+            return "fresh"
+
+        caller = asyncio.create_task(coalescer.run("key", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+
+        assert await asyncio.wait_for(coalescer.run("key", quick), timeout=1) == "fresh"
+        release.set()
+        assert calls == 1
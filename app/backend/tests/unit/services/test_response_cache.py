@@ -0,0 +1,51 @@
+import pytest
+from unittest.mock import patch
+from services.response_cache import ResponseCache, normalize_prompt
+
+
+class TestResponseCache:
+
+    def test_normalize_prompt_folds_width_whitespace_and_punctuation(self):
+        """全角・半角、空白、句読点の違いが同じキーに正規化されることをテスト"""
+        assert normalize_prompt("東京都のＩＴ補助金を教えて？") == normalize_prompt("東京都のIT補助金を教えて")
+        assert normalize_prompt("  東京都の　IT補助金を\n教えて。") == "東京都の it補助金を 教えて"
+        assert ResponseCache.make_key("東京都のIT補助金を教えて！") == ResponseCache.make_key("東京都のit補助金を教えて")
+
+    def test_make_key_includes_agent_config(self):
+        """エージェント構成が異なる場合は別のキーになることをテスト"""
+        assert ResponseCache.make_key("質問", "config-a") != ResponseCache.make_key("質問", "config-b")
+
+    def test_get_and_set_records_hits_and_misses(self):
+        """保存した値を取得でき、ヒット・ミスが記録されることをテスト"""
+        cache = ResponseCache()
+
+        assert cache.get("key") is None
+        cache.set("key", "value")
+        assert cache.get("key") == "value"
+
+        assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "expirations": 0, "size": 1}
+
+    def test_evicts_least_recently_used_entry(self):
+        """上限を超えた場合に最も長く使われていないエントリが破棄されることをテスト"""
+        cache = ResponseCache(max_entries=2)
+        cache.set("key-1", "value-1")
+        cache.set("key-2", "value-2")
+        cache.get("key-1")
+        cache.set("key-3", "value-3")
+
+        assert cache.get("key-2") is None
+        assert cache.get("key-1") == "value-1"
+        assert cache.stats()["evictions"] == 1
+
+    def test_expires_entries_after_ttl(self):
+        """有効期間を過ぎたエントリが返されないことをテスト"""
+        cache = ResponseCache(ttl_seconds=60)
+        with patch("services.response_cache.time.monotonic", return_value=1000.0):
+            cache.set("key", "value")
+
+        with patch("services.response_cache.time.monotonic", return_value=1059.0):
+            assert cache.get("key") == "value"
+        with patch("services.response_cache.time.monotonic", return_value=1061.0):
+            assert cache.get("key") is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.stats()["size"] == 0
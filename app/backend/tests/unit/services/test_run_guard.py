@@ -0,0 +1,205 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from services.run_guard import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, CircuitOpenError, RunGuard
+
+
+def make_guard(**kwargs):
+    options = {"hedge_min_samples": 3, "hedge_min_delay_seconds": 0.01, "deadline_seconds": 5}
+    options.update(kwargs)
+    return RunGuard(**options)
+
+
+async def fast():
+    await asyncio.sleep(0)
+    return "fast"
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_consecutive_failures(self):
+        """連続した失敗が上限に達した場合に回路が開くことをテスト"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout_seconds=30)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CIRCUIT_CLOSED
+        breaker.record_failure()
+
+        assert breaker.state == CIRCUIT_OPEN
+        assert breaker.is_open()
+        assert not breaker.allow()
+        assert 0 < breaker.retry_after() <= 30
+
+    def test_half_open_allows_single_probe(self):
+        """試行を再開する時刻を過ぎると1件だけ実行を許可し、成功すれば回路を閉じることをテスト"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout_seconds=30)
+        with patch("services.run_guard.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+        with patch("services.run_guard.time.monotonic", return_value=131.0):
+            assert breaker.allow()
+            assert breaker.state == CIRCUIT_HALF_OPEN
+            assert not breaker.allow()
+
+        breaker.record_success()
+
+        assert breaker.state == CIRCUIT_CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        """試行が失敗した場合は再び回路を開くことをテスト"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout_seconds=30)
+        with patch("services.run_guard.time.monotonic", return_value=100.0):
+            for _ in range(3):
+                breaker.record_failure()
+        with patch("services.run_guard.time.monotonic", return_value=131.0):
+            assert breaker.allow()
+            breaker.record_failure()
+            assert breaker.state == CIRCUIT_OPEN
+            assert breaker.is_open()
+        assert breaker.stats()["opens"] == 2
+
+
+class TestRunGuard:
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_until_enough_samples(self):
+        """実行時間の記録が少ない間はヘッジしないことをテスト"""
+        guard = make_guard()
+        calls = 0
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "slow"
+
+        assert await guard.run(attempt) == "slow"
+        assert calls == 1
+        assert guard.hedge_delay() is None
+
+    @pytest.mark.asyncio
+    async def test_slow_run_is_hedged_and_loser_cancelled(self):
+        """実行時間のパーセンタイルを超えた実行をヘッジし、先に完了した結果を採用して遅い実行をキャンセルすることをテスト"""
+        guard = make_guard()
+        for _ in range(3):
+            await guard.run(fast)
+        cancelled = asyncio.Event()
+        calls = 0
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return f"attempt-{calls}"
+
+        result = await asyncio.wait_for(guard.run(attempt), timeout=1)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+        assert result == "attempt-2"
+        stats = guard.stats()
+        assert stats["hedges"] == 1
+        assert stats["hedge_wins"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_disabled_for_attempt(self):
+        """ヘッジしないよう指定した実行はヘッジしないことをテスト"""
+        guard = make_guard()
+        for _ in range(3):
+            await guard.run(fast)
+        calls = 0
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "done"
+
+        assert await guard.run(attempt, hedge=False) == "done"
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_is_skipped_when_before_hedge_refuses(self):
+        """ヘッジの直前の確認がFalseを返した場合はヘッジせず、最初の実行を待つことをテスト"""
+        guard = make_guard()
+        for _ in range(3):
+            await guard.run(fast)
+        checks = 0
+        calls = 0
+
+        async def before_hedge():
+            nonlocal checks
+            checks += 1
+            return False
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "done"
+
+        assert await guard.run(attempt, before_hedge=before_hedge) == "done"
+        assert calls == 1
+        assert checks == 1
+        stats = guard.stats()
+        assert stats["hedges"] == 0
+        assert stats["hedges_skipped"] == 1
+
+    @pytest.mark.asyncio
+    async def test_deadline_cancels_run(self):
+        """期限内に完了しない実行をキャンセルしてTimeoutErrorを送出することをテスト"""
+        guard = make_guard(deadline_seconds=0.02, hedging=False)
+        cancelled = asyncio.Event()
+
+        async def attempt():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(TimeoutError):
+            await guard.run(attempt)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert guard.stats()["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failures_open_circuit(self):
+        """失敗した実行が続くと回路が開き、以降は実行せずに即座に失敗することをテスト"""
+        guard = make_guard(breaker=CircuitBreaker(failure_threshold=2))
+        calls = 0
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            return "failed"
+
+        for _ in range(2):
+            assert await guard.run(attempt, is_failure=lambda result: result == "failed") == "failed"
+        assert guard.circuit_open()
+
+        with pytest.raises(CircuitOpenError):
+            await guard.run(attempt)
+        assert calls == 2
+        stats = guard.stats()
+        assert stats["failures"] == 2
+        assert stats["rejected"] == 1
+        assert stats["circuit_open"] == 1
+
+    @pytest.mark.asyncio
+    async def test_exception_is_reraised_and_recorded(self):
+        """実行の例外をそのまま送出し、失敗として記録することをテスト"""
+        guard = make_guard(breaker=CircuitBreaker(failure_threshold=5))
+
+        async def attempt():
+            raise RuntimeError("upstream error")
+
+        with pytest.raises(RuntimeError):
+            await guard.run(attempt)
+        assert guard.breaker.stats()["consecutive_failures"] == 1
@@ -0,0 +1,38 @@
+import itertools
+from services.run_poller import RunPoller
+
+
+class TestRunPoller:
+
+    def test_intervals_start_fast_then_back_off(self):
+        """最初は初期間隔で確認し、その後は上限まで間隔を広げることをテスト"""
+        poller = RunPoller(
+            initial_interval_seconds=0.1, max_interval_seconds=0.5, backoff_factor=2, fast_polls=2, jitter_ratio=0
+        )
+
+        intervals = list(itertools.islice(poller.intervals(), 6))
+
+        assert intervals == [0.1, 0.1, 0.2, 0.4, 0.5, 0.5]
+
+    def test_intervals_with_jitter(self):
+        """間隔がジッターの範囲内に収まることをテスト"""
+        poller = RunPoller(initial_interval_seconds=1, max_interval_seconds=1, jitter_ratio=0.2)
+
+        for interval in itertools.islice(poller.intervals(), 100):
+            assert 0.8 <= interval <= 1.2
+
+    def test_stats(self):
+        """実行ごとの状態確認回数とタイムアウトを集計することをテスト"""
+        poller = RunPoller()
+        assert poller.stats()["avg_status_calls"] == 0.0
+
+        poller.record(2)
+        poller.record(6, timed_out=True)
+
+        assert poller.stats() == {
+            "runs": 2,
+            "status_calls": 8,
+            "max_status_calls": 6,
+            "timeouts": 1,
+            "avg_status_calls": 4.0,
+        }
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from services.session_store import SessionStore
+
+
+class TestSessionStore:
+    
+    @pytest.mark.asyncio
+    async def test_save_and_get_thread_id(self):
+        """保存したセッションのスレッドIDを取得できることをテスト"""
+        store = SessionStore()
+        await store.save("session-1", "thread-1")
+        
+        assert await store.get_thread_id("session-1") == "thread-1"
+        assert await store.get_thread_id("unknown") is None
+    
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used_session(self):
+        """上限を超えた場合に最も長く使われていないセッションが破棄されることをテスト"""
+        store = SessionStore(max_sessions=2)
+        await store.save("session-1", "thread-1")
+        await store.save("session-2", "thread-2")
+        await store.get_thread_id("session-1")
+        await store.save("session-3", "thread-3")
+        
+        assert len(store) == 2
+        assert await store.get_thread_id("session-2") is None
+        assert await store.get_thread_id("session-1") == "thread-1"
+    
+    @pytest.mark.asyncio
+    async def test_evicts_idle_sessions(self):
+        """アイドル期限切れのセッションが破棄されることをテスト"""
+        store = SessionStore(idle_ttl_seconds=60)
+        with patch("services.session_store.time.time", return_value=1000.0):
+            await store.save("session-1", "thread-1")
+        
+        with patch("services.session_store.time.time", return_value=1061.0):
+            assert await store.get_thread_id("session-1") is None
+        assert len(store) == 0
+    
+    @pytest.mark.asyncio
+    async def test_evict_expired_removes_persisted_sessions(self, tmp_path):
+        """期限切れの破棄で永続化したセッションも削除し、そのスレッドを通知することをテスト"""
+        expired = []
+        store = SessionStore(idle_ttl_seconds=60, persist_path=str(tmp_path / "sessions.db"), on_expire=expired.append)
+        with patch("services.session_store.time.time", return_value=1000.0):
+            await store.save("session-1", "thread-1")
+            await store.save("session-2", "thread-2")
+        with patch("services.session_store.time.time", return_value=1030.0):
+            await store.get_thread_id("session-2")
+        
+        assert await store.evict_expired(now=1061.0) == 1
+        assert expired == ["thread-1"]
+        assert len(store) == 1
+    
+    @pytest.mark.asyncio
+    async def test_persisted_sessions_survive_restart(self, tmp_path):
+        """永続化したセッションが別のストアインスタンスから参照できることをテスト"""
+        db_path = str(tmp_path / "sessions.db")
+        await SessionStore(persist_path=db_path).save("session-1", "thread-1")
+        
+        assert await SessionStore(persist_path=db_path).get_thread_id("session-1") == "thread-1"
+    
+    @pytest.mark.asyncio
+    async def test_persisted_sessions_are_accessed_off_the_event_loop(self, tmp_path):
+        """永続化したセッションの読み書きをスレッドプールで行うことをテスト"""
+        store = SessionStore(persist_path=str(tmp_path / "sessions.db"))
+        threads = []
+        
+        def record_thread(method):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return method(*args)
+            return wrapper
+        
+        await store.save("session-1", "thread-1")
+        store._forget("session-1")
+        with patch.object(store, "_load", side_effect=record_thread(store._load)), \
+                patch.object(store, "_persist", side_effect=record_thread(store._persist)):
+            assert await store.get_thread_id("session-1") == "thread-1"
+        
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
+    
+    @pytest.mark.asyncio
+    async def test_lock_serializes_same_session(self):
+        """同一セッションのロックが共有されることをテスト"""
+        store = SessionStore()
+        
+        assert store.lock("session-1") is store.lock("session-1")
+        assert store.lock("session-1") is not store.lock("session-2")
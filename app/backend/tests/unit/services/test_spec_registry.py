@@ -0,0 +1,71 @@
+import json
+import os
+from unittest.mock import Mock
+import pytest
+from services.spec_registry import SpecRegistry
+
+SPEC = {
+    "openapi": "3.1.0",
+    "paths": {"/items": {"get": {"responses": {"200": {"content": {"application/json": {
+        "schema": {"$ref": "#/components/schemas/Item"}
+    }}}}}}},
+    "components": {"schemas": {"Item": {"type": "object", "properties": {"id": {"type": "string"}}}}},
+}
+
+def _write_spec(path, spec, mtime_ns=None):
+    path.write_text(json.dumps(spec), encoding="utf-8")
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestSpecRegistry:
+
+    def test_load_spec_once_and_resolve_refs(self, tmp_path):
+        """スペックを一度だけ読み込み、$ref を解決した通常の辞書として返すことをテスト"""
+        path = tmp_path / "spec.json"
+        _write_spec(path, SPEC)
+        registry = SpecRegistry()
+
+        spec = registry.load_spec(str(path))
+
+        assert registry.load_spec(str(path)) is spec
+        schema = spec["paths"]["/items"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert type(schema) is dict
+        assert schema["properties"]["id"] == {"type": "string"}
+        assert registry.stats()["loads"] == 1
+
+    def test_load_spec_without_resolving_refs(self, tmp_path):
+        """resolve_refs=False の場合は参照先を遅延して解決することをテスト"""
+        path = tmp_path / "spec.json"
+        _write_spec(path, SPEC)
+        registry = SpecRegistry(resolve_refs=False)
+
+        spec = registry.load_spec(str(path))
+
+        schema = spec["paths"]["/items"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert type(schema) is not dict
+        assert schema["type"] == "object"
+
+    def test_reload_when_file_changes(self, tmp_path):
+        """ファイルが更新された場合はスペックとツールを作り直すことをテスト"""
+        path = tmp_path / "spec.json"
+        _write_spec(path, SPEC, mtime_ns=1_000_000_000)
+        registry = SpecRegistry()
+        build = Mock(side_effect=lambda: registry.load_spec(str(path))["openapi"])
+
+        assert registry.get_tool(str(path), "items", build) == "3.1.0"
+        assert registry.get_tool(str(path), "items", build) == "3.1.0"
+        assert build.call_count == 1
+
+        _write_spec(path, {**SPEC, "openapi": "3.0.0"}, mtime_ns=2_000_000_000)
+
+        assert registry.get_tool(str(path), "items", build) == "3.0.0"
+        assert build.call_count == 2
+        assert registry.stats() == {"loads": 2, "builds": 2, "specs": 1, "tools": 1}
+
+    def test_missing_file_raises(self, tmp_path):
+        """ファイルが存在しない場合はエラーとなることをテスト"""
+        registry = SpecRegistry()
+
+        with pytest.raises(FileNotFoundError):
+            registry.load_spec(str(tmp_path / "missing.json"))
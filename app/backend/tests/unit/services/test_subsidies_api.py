@@ -0,0 +1,146 @@
+import json
+from contextlib import asynccontextmanager
+import pytest
+from aiohttp import web
+from services.subsidies_api import SubsidiesApiClient, SubsidiesApiError, normalize_params
+
+RECORD = {
+    "id": "S1",
+    "name": "S-00000001",
+    "title": "ものづくり補助金",
+    "target_area_search": "全国",
+    "subsidy_max_limit": 10000000,
+    "acceptance_end_datetime": "2099-05-31T08:00:00.000Z",
+}
+
+
+@asynccontextmanager
+async def stub_server():
+    """補助金APIのスタブサーバー（ETag付きで応答し、If-None-Match が一致すれば304を返す）"""
+    state = {"requests": [], "fail": False}
+
+    async def list_subsidies(request):
+        state["requests"].append((dict(request.query), request.headers.get("If-None-Match")))
+        if state["fail"]:
+            return web.Response(status=500, text="error")
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({"metadata": {"resultset": {"count": 1}}, "result": [RECORD]}, headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/subsidies", list_subsidies)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}", state
+    finally:
+        await runner.cleanup()
+
+
+class TestSubsidiesApiClient:
+
+    def test_normalize_params(self):
+        """値のないパラメーターの除外・既定値の補完・NFKC正規化をテスト"""
+        assert normalize_params({"keyword": " ＩＴ　導入 ", "industry": None, "use_purpose": ""}) == {
+            "keyword": "IT 導入",
+            "sort": "created_date",
+            "order": "DESC",
+            "acceptance": "1",
+        }
+
+    @pytest.mark.asyncio
+    async def test_identical_queries_are_served_from_cache(self):
+        """正規化して同じになる検索は上流のAPIを1回だけ呼び出すことをテスト"""
+        async with stub_server() as (base_url, state):
+            client = SubsidiesApiClient(base_url=base_url)
+            try:
+                first = await client.list_subsidies(keyword="ＩＴ導入")
+                second = await client.list_subsidies(keyword="IT導入 ", sort="created_date", industry=None)
+            finally:
+                await client.close()
+
+        assert first == second
+        assert first["result"][0]["id"] == "S1"
+        assert len(state["requests"]) == 1
+        assert state["requests"][0][0]["keyword"] == "IT導入"
+
+    @pytest.mark.asyncio
+    async def test_expired_response_is_revalidated_with_etag(self):
+        """期限切れの応答をETagで再検証し、304の場合は保持している応答を返すことをテスト"""
+        async with stub_server() as (base_url, state):
+            client = SubsidiesApiClient(base_url=base_url, ttl_seconds=0)
+            try:
+                first = await client.list_subsidies(keyword="補助金")
+                second = await client.list_subsidies(keyword="補助金")
+            finally:
+                await client.close()
+
+        assert first == second
+        assert [etag for _, etag in state["requests"]] == [None, '"v1"']
+        assert client.stats()["revalidated"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cached_response_is_served_when_upstream_fails(self):
+        """上流のAPIが失敗した場合は保持している応答を返し、ない場合はエラーとなることをテスト"""
+        async with stub_server() as (base_url, state):
+            client = SubsidiesApiClient(base_url=base_url, ttl_seconds=0)
+            try:
+                first = await client.list_subsidies(keyword="補助金")
+                state["fail"] = True
+                second = await client.list_subsidies(keyword="補助金")
+                with pytest.raises(SubsidiesApiError):
+                    await client.list_subsidies(keyword="別の検索")
+            finally:
+                await client.close()
+
+        assert second == first
+        assert client.stats()["stale_served"] == 1
+
+    @pytest.mark.asyncio
+    async def test_fixture_directory_serves_offline(self, tmp_path):
+        """スナップショットのディレクトリから一覧と詳細を応答することをテスト"""
+        (tmp_path / "subsidies.json").write_text(
+            json.dumps({"result": [RECORD, {**RECORD, "id": "S2", "title": "IT導入補助金"}]}, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        client = SubsidiesApiClient(fixture_dir=str(tmp_path))
+
+        listed = await client.list_subsidies(keyword="IT導入")
+        detail = await client.get_subsidy("S1")
+
+        assert [record["id"] for record in listed["result"]] == ["S2"]
+        assert detail["result"] == [RECORD]
+        assert client.stats()["upstream_calls"] == 0
+
+    @pytest.mark.asyncio
+    async def test_fixture_rejects_unsupported_sort_as_api_error(self, tmp_path):
+        """スナップショットで対応しない並べ替えをAPIのエラーとして返し、順序の大文字小文字は区別しないことをテスト"""
+        (tmp_path / "subsidies.json").write_text(json.dumps({"result": [RECORD]}, ensure_ascii=False), encoding="utf-8")
+        client = SubsidiesApiClient(fixture_dir=str(tmp_path))
+
+        listed = await client.list_subsidies(acceptance="0", order="asc")
+        with pytest.raises(SubsidiesApiError):
+            await client.list_subsidies(sort="title")
+        with pytest.raises(SubsidiesApiError):
+            await client.list_subsidies(order="up")
+
+        assert [record["id"] for record in listed["result"]] == ["S1"]
+
+    @pytest.mark.asyncio
+    async def test_invalid_subsidy_id_is_rejected_before_request(self):
+        """パスやクエリを含む補助金IDを、APIやキャッシュを使用せずに拒否することをテスト"""
+        async with stub_server() as (base_url, state):
+            client = SubsidiesApiClient(base_url=base_url)
+            try:
+                for subsidy_id in ["../subsidies?keyword=x", "S1/../../admin", "S1?acceptance=0", "", "S" * 19]:
+                    with pytest.raises(SubsidiesApiError):
+                        await client.get_subsidy(subsidy_id)
+            finally:
+                await client.close()
+
+        assert state["requests"] == []
+        assert client.stats()["upstream_calls"] == 0
+
@@ -0,0 +1,140 @@
+import datetime
+import json
+import pytest
+from services.subsidy_catalog import SubsidyCatalog, parse_employee_range
+
+RECORDS = [
+    {
+        "id": "S1",
+        "name": "S-00000001",
+        "title": "ものづくり補助金",
+        "target_area_search": "全国",
+        "subsidy_max_limit": 10000000,
+        "acceptance_end_datetime": "2024-05-31T08:00:00.000Z",
+        "target_number_of_employees": "従業員の制約なし",
+    },
+    {
+        "id": "S2",
+        "name": "S-00000002",
+        "title": "東京都IT導入支援補助金",
+        "target_area_search": "東京都 / 神奈川県",
+        "subsidy_max_limit": 3000000,
+        "acceptance_end_datetime": "2024-04-30T08:00:00.000Z",
+        "target_number_of_employees": "50名以下",
+    },
+    {
+        "id": "S3",
+        "name": "S-00000003",
+        "title": "大阪府設備導入補助金",
+        "target_area_search": "大阪府",
+        "subsidy_max_limit": 5000000,
+        "acceptance_end_datetime": "2024-06-30T08:00:00.000Z",
+        "target_number_of_employees": "300名以下",
+    },
+    {
+        "id": "S4",
+        "name": "S-00000004",
+        "title": "関東地方の事業承継補助金",
+        "target_area_search": "関東・甲信越地方",
+        "subsidy_max_limit": None,
+        "acceptance_end_datetime": None,
+        "target_number_of_employees": "901名以上",
+    },
+]
+
+def _ids(result):
+    return [record["id"] for record in result["result"]]
+
+
+class TestSubsidyCatalog:
+
+    @pytest.fixture
+    def catalog(self):
+        catalog = SubsidyCatalog()
+        catalog.replace(RECORDS)
+        return catalog
+
+    def test_search_without_conditions_sorts_by_deadline(self, catalog):
+        """条件なしの検索が受付終了日時の昇順（値がないものは最後）で返すことをテスト"""
+        result = catalog.search()
+
+        assert result["metadata"]["resultset"]["count"] == 4
+        assert _ids(result) == ["S2", "S1", "S3", "S4"]
+
+    def test_keyword_search_uses_ngram_index(self, catalog):
+        """キーワードのすべての語を含む補助金に絞り込むことをテスト（全角・半角や大文字小文字を区別しない）"""
+        assert _ids(catalog.search(keyword="導入")) == ["S2", "S3"]
+        assert _ids(catalog.search(keyword="ｉｔ導入 東京")) == ["S2"]
+        assert _ids(catalog.search(keyword="補助金 存在しない")) == []
+
+    def test_area_search_includes_nationwide_and_region(self, catalog):
+        """地域の検索が全国対象と、その都道府県を含む地方の補助金を含むことをテスト"""
+        assert _ids(catalog.search(area="東京都")) == ["S2", "S1", "S4"]
+        assert _ids(catalog.search(area="大阪府")) == ["S1", "S3"]
+
+    def test_unknown_areas_match_nationwide_without_growing_index(self, catalog):
+        """未知の地域の検索は全国対象の補助金のみを返し、検索結果を保持し続けないことをテスト"""
+        known = len(catalog._index.area_matches)
+
+        for i in range(100):
+            assert _ids(catalog.search(area=f"存在しない地域{i}")) == ["S1"]
+
+        assert len(catalog._index.area_matches) == known
+
+    def test_employees_search_matches_categories(self, catalog):
+        """従業員数を対象とする区分の補助金に絞り込むことをテスト"""
+        assert _ids(catalog.search(employees=30)) == ["S2", "S1", "S3"]
+        assert _ids(catalog.search(employees=1000)) == ["S1", "S4"]
+
+    def test_employee_boundaries_are_precomputed(self, catalog):
+        """区分の境界の前後で正しく絞り込み、検索時にインデックスを書き換えないことをテスト"""
+        matches = list(catalog._index.employee_matches)
+        expected = {
+            -1: set(), 0: {"S1", "S2", "S3"}, 50: {"S1", "S2", "S3"}, 51: {"S1", "S3"},
+            300: {"S1", "S3"}, 301: {"S1"}, 900: {"S1"}, 901: {"S1", "S4"},
+        }
+
+        for employees, ids in expected.items():
+            assert set(_ids(catalog.search(employees=employees))) == ids
+
+        assert catalog._index.employee_matches == matches
+
+    def test_range_search_on_sorted_indexes(self, catalog):
+        """受付終了日時と補助上限額の範囲で絞り込むことをテスト"""
+        result = catalog.search(
+            deadline_from=datetime.datetime(2024, 5, 1),
+            deadline_to=datetime.datetime(2024, 6, 30, 23, 59)
+        )
+        assert _ids(result) == ["S1", "S3"]
+        assert _ids(catalog.search(min_limit=4000000, sort="subsidy_max_limit", order="DESC")) == ["S1", "S3"]
+
+    def test_combined_structured_query(self, catalog):
+        """複数の条件を組み合わせた検索と、件数・ページングをテスト"""
+        result = catalog.search(area="東京都", employees=50, deadline_to=datetime.datetime(2024, 5, 31, 23, 59), limit=1)
+
+        assert result["metadata"]["resultset"]["count"] == 2
+        assert _ids(result) == ["S2"]
+        assert _ids(catalog.search(area="東京都", employees=50, offset=1, limit=1)) == ["S1"]
+
+    def test_invalid_sort_raises(self, catalog):
+        """不正な並べ替え項目でエラーとなることをテスト"""
+        with pytest.raises(ValueError):
+            catalog.search(sort="title")
+
+    def test_load_snapshot_directory(self, tmp_path):
+        """スナップショットのディレクトリから補助金一覧APIの応答とリストを読み込むことをテスト"""
+        (tmp_path / "a.json").write_text(
+            json.dumps({"metadata": {"resultset": {"count": 2}}, "result": RECORDS[:2]}, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        (tmp_path / "b.json").write_text(json.dumps(RECORDS[1:] + [{"title": "IDなし"}], ensure_ascii=False), encoding="utf-8")
+        catalog = SubsidyCatalog()
+
+        assert catalog.load(str(tmp_path)) == 4
+        assert len(catalog) == 4
+
+    def test_parse_employee_range(self):
+        """従業員数の区分を範囲に変換することをテスト"""
+        assert parse_employee_range("50名以下") == (0, 50)
+        assert parse_employee_range("901名以上")[0] == 901
+        assert parse_employee_range("従業員の制約なし") == (0, float("inf"))
@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from azure.core.exceptions import ResourceNotFoundError
+from services.session_store import SessionStore
+from services.thread_reaper import ThreadReaper
+
+
+@pytest.fixture
+def mock_async_project_client():
+    """非同期AIProjectClientのモックを作成するフィクスチャ"""
+    client = Mock()
+    client.agents = AsyncMock()
+    return client
+
+
+class TestThreadReaper:
+    
+    @pytest.mark.asyncio
+    async def test_reap_deletes_released_threads(self, mock_async_project_client):
+        """解放されたスレッドのみが削除されることをテスト"""
+        reaper = ThreadReaper(mock_async_project_client, max_deletes_per_second=0)
+        reaper.track("thread-1")
+        reaper.track("thread-2")
+        reaper.release("thread-1")
+        
+        reaped = await reaper.reap()
+        
+        assert reaped == 1
+        mock_async_project_client.agents.delete_thread.assert_awaited_once_with("thread-1")
+        assert reaper.stats() == {"live": 1, "pending": 0, "reaped": 1, "failed": 0}
+    
+    @pytest.mark.asyncio
+    async def test_reap_respects_batch_size(self, mock_async_project_client):
+        """1回の回収で削除するスレッド数がバッチサイズに制限されることをテスト"""
+        reaper = ThreadReaper(mock_async_project_client, batch_size=2, max_deletes_per_second=0)
+        for i in range(5):
+            reaper.release(f"thread-{i}")
+        
+        assert await reaper.reap() == 2
+        assert reaper.stats()["pending"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_reap_idle_tracked_threads(self, mock_async_project_client):
+        """解放されないまま期限を超えたスレッドが削除されることをテスト"""
+        reaper = ThreadReaper(mock_async_project_client, max_idle_seconds=60, max_deletes_per_second=0)
+        reaper.track("thread-1")
+        
+        assert await reaper.reap() == 0
+        assert await reaper.reap(now=reaper._tracked["thread-1"] + 61) == 1
+    
+    @pytest.mark.asyncio
+    async def test_failed_deletions_are_retried_then_counted(self, mock_async_project_client):
+        """削除に失敗したスレッドが再試行され、上限到達で失敗として数えられることをテスト"""
+        mock_async_project_client.agents.delete_thread.side_effect = Exception("Service unavailable")
+        reaper = ThreadReaper(mock_async_project_client, max_retries=2, max_deletes_per_second=0)
+        reaper.release("thread-1")
+        
+        await reaper.reap()
+        assert reaper.stats() == {"live": 1, "pending": 1, "reaped": 0, "failed": 0}
+        await reaper.reap()
+        assert reaper.stats() == {"live": 0, "pending": 0, "reaped": 0, "failed": 1}
+    
+    @pytest.mark.asyncio
+    async def test_already_deleted_thread_counts_as_reaped(self, mock_async_project_client):
+        """既に存在しないスレッドは削除済みとして扱われることをテスト"""
+        mock_async_project_client.agents.delete_thread.side_effect = ResourceNotFoundError("Not found")
+        reaper = ThreadReaper(mock_async_project_client, max_deletes_per_second=0)
+        reaper.release("thread-1")
+        
+        assert await reaper.reap() == 1
+    
+    @pytest.mark.asyncio
+    async def test_expired_sessions_release_threads(self, mock_async_project_client):
+        """セッションの破棄時にスレッドが削除対象になることをテスト"""
+        reaper = ThreadReaper(mock_async_project_client)
+        store = SessionStore(max_sessions=1, on_expire=reaper.release)
+        await store.save("session-1", "thread-1")
+        await store.save("session-2", "thread-2")
+        
+        assert list(reaper._pending) == ["thread-1"]
+    
+    @pytest.mark.asyncio
+    async def test_periodic_task_sweeps_expired_sessions(self, mock_async_project_client, tmp_path):
+        """定期処理で期限切れのセッションを破棄し、そのスレッドを削除することをテスト"""
+        reaper = ThreadReaper(mock_async_project_client, interval_seconds=0.01, max_deletes_per_second=0)
+        store = SessionStore(idle_ttl_seconds=0, persist_path=str(tmp_path / "sessions.db"), on_expire=reaper.release)
+        reaper.add_sweeper(store.evict_expired)
+        await store.save("session-1", "thread-1")
+        
+        reaper.start()
+        try:
+            for _ in range(100):
+                if reaper.stats()["reaped"]:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await reaper.stop()
+        
+        mock_async_project_client.agents.delete_thread.assert_awaited_once_with("thread-1")
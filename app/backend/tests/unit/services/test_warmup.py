@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from services.warmup import Warmup
+
+
+class TestWarmup:
+
+    @pytest.mark.asyncio
+    async def test_steps_run_in_order_before_ready(self):
+        """同期・非同期の手順を順に実行し、すべて完了した後に準備完了になることをテスト"""
+        warmup = Warmup()
+        order = []
+
+        async def load_agents():
+            assert not warmup.ready
+            order.append("agents")
+
+        warmup.add_step("spec", lambda: order.append("spec"))
+        warmup.add_step("agents", load_agents)
+        assert warmup.status() == {"status": "warming_up", "steps": {"spec": "pending", "agents": "pending"}}
+
+        await warmup.run()
+
+        assert order == ["spec", "agents"]
+        assert warmup.ready
+        assert warmup.status() == {"status": "ready", "steps": {"spec": "done", "agents": "done"}}
+
+    @pytest.mark.asyncio
+    async def test_failed_step_is_retried(self):
+        """失敗した手順を成功するまで再試行することをテスト"""
+        warmup = Warmup(retry_initial_seconds=0.001, retry_max_seconds=0.002)
+        attempts = 0
+
+        async def flaky():
+            nonlocal attempts
+            attempts += 1
+            if attempts < 3:
+                raise ConnectionError("token endpoint unavailable")
+
+        warmup.add_step("agents", flaky)
+        await asyncio.wait_for(warmup.run(), timeout=1)
+
+        assert warmup.ready
+        stats = warmup.stats()
+        assert stats["attempts"] == 3
+        assert stats["failures"] == 2
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_running_warmup(self):
+        """停止した場合は完了を待たずにウォームアップを取り消し、準備完了にしないことをテスト"""
+        warmup = Warmup()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        warmup.add_step("agents", slow)
+        warmup.start()
+        await asyncio.wait_for(started.wait(), timeout=1)
+        await warmup.stop()
+
+        assert not warmup.ready
+        assert warmup.status()["steps"] == {"agents": "running"}
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import pytest
+from starlette.requests import ClientDisconnect
+from services.admission_controller import LANE_BULK, AdmissionController, AdmissionLane
+
+# Azureに接続せずにアプリケーションを読み込む（controller は startup から読み込まれる）
+os.environ.setdefault("AGENTS_BACKEND", "fake")
+import startup  # noqa: E402,F401
+from controller import AdmittedStreamingResponse  # noqa: E402
+
+
+def make_admission():
+    return AdmissionController(
+        max_concurrency=1,
+        lanes={LANE_BULK: AdmissionLane(priority=1, max_concurrency=1, max_queue_size=1, queue_timeout_seconds=1.0)},
+    )
+
+
+def make_scope(spec_version):
+    return {"type": "http", "asgi": {"spec_version": spec_version}}
+
+
+class TestAdmittedStreamingResponse:
+
+    @pytest.mark.asyncio
+    async def test_releases_ticket_after_streaming(self):
+        """本文を返し終えた後に実行枠を解放することをテスト"""
+        admission = make_admission()
+        ticket = await admission.acquire(LANE_BULK)
+        sent = []
+
+        async def body():
+            yield "line\n"
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            await asyncio.sleep(10)
+
+        await AdmittedStreamingResponse(body(), admission, ticket)(make_scope("2.4"), receive, send)
+
+        assert ticket.released
+        assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+    @pytest.mark.asyncio
+    async def test_releases_ticket_when_client_disconnects_before_body(self):
+        """本文の反復を始める前にクライアントが切断した場合も実行枠を解放することをテスト"""
+        admission = make_admission()
+        ticket = await admission.acquire(LANE_BULK)
+        started = False
+
+        async def body():
+            nonlocal started
+            started = True
+            yield "line\n"
+
+        async def send(message):
+            raise OSError("client disconnected")
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        with pytest.raises(ClientDisconnect):
+            await AdmittedStreamingResponse(body(), admission, ticket)(make_scope("2.4"), receive, send)
+
+        assert not started
+        assert ticket.released
+        assert admission.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_releases_ticket_when_cancelled(self):
+        """応答の途中でキャンセルされた場合も実行枠を解放することをテスト"""
+        admission = make_admission()
+        ticket = await admission.acquire(LANE_BULK)
+        sending = asyncio.Event()
+
+        async def body():
+            yield "line\n"
+
+        async def send(message):
+            sending.set()
+            await asyncio.sleep(10)
+
+        async def receive():
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(AdmittedStreamingResponse(body(), admission, ticket)(make_scope("2.0"), receive, send))
+        await asyncio.wait_for(sending.wait(), timeout=1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert ticket.released
+
+    @pytest.mark.asyncio
+    async def test_body_runs_agents_in_lane_and_is_closed_on_disconnect(self):
+        """本文の生成中にエージェントを実行するときだけレーンの実行枠を取得し、切断時に本文の生成を終了させることをテスト"""
+        admission = make_admission()
+        admitted = []
+        closed = False
+
+        async def body():
+            nonlocal closed
+            try:
+                while True:
+                    async with admission.admit_current() as ticket:
+                        admitted.append(ticket.lane)
+                    yield "line\n"
+            finally:
+                closed = True
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message["body"]:
+                raise OSError("client disconnected")
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        with pytest.raises(ClientDisconnect):
+            await AdmittedStreamingResponse(body(), admission, lane=LANE_BULK)(make_scope("2.4"), receive, send)
+
+        assert admitted == [LANE_BULK]
+        assert closed
+        assert admission.stats()["in_flight"] == 0
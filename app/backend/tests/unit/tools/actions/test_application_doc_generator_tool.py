@@ -1,18 +1,22 @@
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import datetime
 import json
 
-# Mock the azure.ai.projects module before importing the application_doc_generator_tool
-mock_assistant = MagicMock()
-with patch.dict('sys.modules', {'azure.ai.projects': mock_assistant}):
-    from tools.actions.application_doc_generator_tool import (
-        format_currency_ja, 
-        format_date_ja, 
-        generate_application_text,
-        ApplicationFormGenerator,
-        request_ai_content
-    )
+from models.models import ApplicationFormRequest
+from services.admission_controller import AdmissionRejected
+from services.assistant_manager_service import AgentRunError
+from services.request_coalescer import RequestCoalescer
+from services.response_cache import ResponseCache
+from tools.actions.application_doc_generator_tool import (
+    format_currency_ja, 
+    format_date_ja, 
+    generate_application_text,
+    ApplicationFormGenerator,
+    request_ai_content,
+    request_ai_sections
+)
 
 class TestFormatCurrencyJa(unittest.TestCase):
     """金額フォーマッティング機能のテスト"""
@@ -88,11 +92,11 @@ class TestGenerateApplicationText(unittest.TestCase):
         self.assertNotIn("従業員数制限", result)
         self.assertIn("■申請理由：", result)
 
-class TestAIEnhancedApplicationGenerator(unittest.TestCase):
+class TestAIEnhancedApplicationGenerator(unittest.IsolatedAsyncioTestCase):
     """AI拡張申請書生成機能のテスト"""
     
-    @patch('tools.actions.application_doc_generator_tool.request_ai_content')
-    def test_generate_ai_enhanced_application(self, mock_request_ai_content):
+    @patch('tools.actions.application_doc_generator_tool.request_ai_content', new_callable=AsyncMock)
+    async def test_generate_ai_enhanced_application(self, mock_request_ai_content):
         """AIによる内容拡張機能のテスト"""
         # AIサービスのモック応答を設定
         mock_ai_response = {
@@ -122,7 +126,7 @@ class TestAIEnhancedApplicationGenerator(unittest.TestCase):
         generator = ApplicationFormGenerator()
         
         # AI拡張申請書を生成
-        result = generator.generate_ai_enhanced(subsidy_info, "IT企業向けクラウドサービス開発")
+        result = await generator.generate_ai_enhanced(subsidy_info, "IT企業向けクラウドサービス開発")
         
         # モックが正しく呼び出されたことを確認
         mock_request_ai_content.assert_called_once()
@@ -141,8 +145,8 @@ class TestAIEnhancedApplicationGenerator(unittest.TestCase):
         self.assertIn("開発人件費: 500万円", result)
         self.assertIn("売上30%増加", result)
     
-    @patch('tools.actions.application_doc_generator_tool.request_ai_content')
-    def test_ai_service_error_handling(self, mock_request_ai_content):
+    @patch('tools.actions.application_doc_generator_tool.request_ai_content', new_callable=AsyncMock)
+    async def test_ai_service_error_handling(self, mock_request_ai_content):
         """AIサービスエラー時の処理テスト"""
         # AIサービスがエラーを返すケース
         mock_request_ai_content.side_effect = Exception("AI service unavailable")
@@ -155,7 +159,7 @@ class TestAIEnhancedApplicationGenerator(unittest.TestCase):
         generator = ApplicationFormGenerator()
         
         # AI拡張に失敗しても、基本テンプレートは生成されるべき
-        result = generator.generate_ai_enhanced(subsidy_info, "IT企業向けサービス")
+        result = await generator.generate_ai_enhanced(subsidy_info, "IT企業向けサービス")
         
         # 基本情報は含まれている
         self.assertIn("【申請書類：IT導入補助金】", result)
@@ -164,16 +168,19 @@ class TestAIEnhancedApplicationGenerator(unittest.TestCase):
         # エラーメッセージが含まれている
         self.assertIn("※AI拡張機能は現在利用できません", result)
 
-class TestRequestAIContent(unittest.TestCase):
+class TestRequestAIContent(unittest.IsolatedAsyncioTestCase):
     """AIコンテンツ生成機能のテスト"""
     
-    @patch('tools.actions.application_doc_generator_tool.AIProjectClient')
-    @patch('tools.actions.application_doc_generator_tool.AssistantManagerService')
-    def test_request_ai_content_success(self, mock_service_class, mock_client_class):
+    def setUp(self):
+        """共有のAIエージェントサービスのモックを準備"""
+        self.mock_service = MagicMock()
+        self.mock_service.model = "gpt-4o"
+        self.mock_service.generate_text = AsyncMock()
+    
+    async def test_request_ai_content_success(self):
         """AIサービスによる内容生成の成功パターンテスト"""
         # モックのレスポンス設定
-        mock_instance = mock_service_class.return_value
-        mock_instance.process_openapi_spec.return_value = '''```json
+        self.mock_service.generate_text.return_value = '''```json
 {
     "application_reason": "テスト理由",
     "business_plan": "テスト計画",
@@ -193,18 +200,11 @@ class TestRequestAIContent(unittest.TestCase):
         }
         business_description = "テストビジネス"
 
-        # 環境変数の設定
-        with patch.dict('os.environ', {
-            'AZURE_AI_PROJECT_ID': 'test-id',
-            'AZURE_AI_API_KEY': 'test-key',
-            'AZURE_AI_ENDPOINT': 'test-endpoint'
-        }):
-            # 関数実行
-            result = request_ai_content(subsidy_info, business_description)
+        # 関数実行
+        result = await request_ai_content(subsidy_info, business_description, self.mock_service)
 
         # 検証
-        mock_service_class.assert_called_once_with(mock_client_class.return_value)
-        mock_instance.process_openapi_spec.assert_called_once()
+        self.mock_service.generate_text.assert_awaited_once()
         self.assertEqual(result["application_reason"], "テスト理由")
         self.assertEqual(result["business_plan"], "テスト計画")
         self.assertEqual(result["implementation_structure"], "テスト体制")
@@ -212,13 +212,10 @@ class TestRequestAIContent(unittest.TestCase):
         self.assertEqual(result["budget_plan"], "テスト予算")
         self.assertEqual(result["expected_effects"], "テスト効果")
 
-    @patch('tools.actions.application_doc_generator_tool.AIProjectClient')
-    @patch('tools.actions.application_doc_generator_tool.AssistantManagerService')
-    def test_request_ai_content_non_json_response(self, mock_service_class, mock_client_class):
+    async def test_request_ai_content_non_json_response(self):
         """JSON以外のレスポンスを処理できることのテスト"""
         # モックのレスポンス設定（JSONでない形式）
-        mock_instance = mock_service_class.return_value
-        mock_instance.process_openapi_spec.return_value = """
+        self.mock_service.generate_text.return_value = """
 application_reason: テスト理由
 business_plan: テスト計画
 implementation_structure: テスト体制
@@ -234,14 +231,8 @@ expected_effects: テスト効果
         }
         business_description = "テストビジネス"
 
-        # 環境変数の設定
-        with patch.dict('os.environ', {
-            'AZURE_AI_PROJECT_ID': 'test-id',
-            'AZURE_AI_API_KEY': 'test-key',
-            'AZURE_AI_ENDPOINT': 'test-endpoint'
-        }):
-            # 関数実行
-            result = request_ai_content(subsidy_info, business_description)
+        # 関数実行
+        result = await request_ai_content(subsidy_info, business_description, self.mock_service)
 
         # 検証
         self.assertIn("application_reason", result)
@@ -251,26 +242,271 @@ expected_effects: テスト効果
         self.assertIn("budget_plan", result)
         self.assertIn("expected_effects", result)
 
-    @patch('tools.actions.application_doc_generator_tool.AIProjectClient')
-    @patch('tools.actions.application_doc_generator_tool.AssistantManagerService')
-    def test_request_ai_content_service_error(self, mock_service_class, mock_client_class):
+    async def test_request_ai_content_service_error(self):
         """AIサービスがエラーを返す場合のテスト"""
         # モックのエラー設定
-        mock_instance = mock_service_class.return_value
-        mock_instance.process_openapi_spec.side_effect = Exception("テストエラー")
+        self.mock_service.generate_text.side_effect = Exception("テストエラー")
 
         # テストデータ
         subsidy_info = {"title": "テスト補助金"}
         business_description = "テストビジネス"
 
-        # 環境変数の設定
-        with patch.dict('os.environ', {
-            'AZURE_AI_PROJECT_ID': 'test-id',
-            'AZURE_AI_API_KEY': 'test-key',
-            'AZURE_AI_ENDPOINT': 'test-endpoint'
-        }):
-            # エラーが発生することを確認
-            with self.assertRaises(Exception) as context:
-                request_ai_content(subsidy_info, business_description)
+        # エラーが発生することを確認
+        with self.assertRaises(Exception) as context:
+            await request_ai_content(subsidy_info, business_description, self.mock_service)
+
+        self.assertIn("AIコンテンツ生成エラー", str(context.exception))
+
+    async def test_failed_run_falls_back_to_base_template(self):
+        """実行に失敗した場合はAI拡張の申請書ではなく基本テンプレートを返すことをテスト"""
+        self.mock_service.generate_text.side_effect = AgentRunError("failed")
+        generator = ApplicationFormGenerator(service=self.mock_service)
+        
+        result = await generator.generate_ai_enhanced({"title": "テスト補助金"}, "テストビジネス")
+        
+        self.assertIn("【申請書類：テスト補助金】", result)
+        self.assertIn("※AI拡張機能は現在利用できません", result)
+        self.assertNotIn("生成できませんでした", result)
+    
+    async def test_admission_rejection_is_not_replaced_by_base_template(self):
+        """混雑で実行枠を取得できなかった場合は基本テンプレートで代替せず、拒否を呼び出し元に伝えることをテスト"""
+        self.mock_service.generate_text.side_effect = AdmissionRejected("bulk", "queue_full", 1)
+        generator = ApplicationFormGenerator(service=self.mock_service)
+        
+        with self.assertRaises(AdmissionRejected):
+            await generator.generate_ai_enhanced({"title": "テスト補助金"}, "テストビジネス")
+    
+    async def test_request_ai_content_without_service(self):
+        """AIサービスが設定されていない場合のテスト"""
+        with self.assertRaises(Exception) as context:
+            await request_ai_content({"title": "テスト補助金"}, "テストビジネス", None)
+
+        self.assertIn("AIエージェントサービスが設定されていません", str(context.exception))
+
+    async def test_request_ai_content_uses_cache(self):
+        """同じ内容のリクエストがキャッシュから返され、bypass_cache指定時は再生成されることをテスト"""
+        self.mock_service.generate_text.return_value = '{"application_reason": "テスト理由"}'
+        cache = ResponseCache()
+        subsidy_info = {"title": "テスト補助金"}
+
+        first = await request_ai_content(subsidy_info, "テストビジネス", self.mock_service, response_cache=cache)
+        second = await request_ai_content(subsidy_info, "テストビジネス", self.mock_service, response_cache=cache)
+        await request_ai_content(
+            subsidy_info, "テストビジネス", self.mock_service, response_cache=cache, bypass_cache=True
+        )
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.mock_service.generate_text.await_count, 2)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+class TestParallelSectionGeneration(unittest.IsolatedAsyncioTestCase):
+    """セクション単位の並行生成のテスト"""
+    
+    def setUp(self):
+        """共有のAIエージェントサービスのモックを準備"""
+        self.mock_service = MagicMock()
+        self.mock_service.model = "gpt-4o"
+        self.subsidy_info = {"title": "IT導入補助金", "subsidy_max_limit": 10000000}
+    
+    async def test_sections_are_generated_with_bounded_concurrency(self):
+        """全セクションが生成され、同時実行数が上限を超えないことをテスト"""
+        running = 0
+        peak = 0
+        
+        async def generate(prompt):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "生成された本文"
+        self.mock_service.generate_text = AsyncMock(side_effect=generate)
+        
+        result = await request_ai_sections(
+            self.subsidy_info, "テストビジネス", self.mock_service, max_concurrency=2
+        )
+        
+        self.assertEqual(len(result), 6)
+        self.assertEqual(self.mock_service.generate_text.await_count, 6)
+        self.assertEqual(peak, 2)
+    
+    async def test_timed_out_section_keeps_template_placeholder(self):
+        """期限内に生成できなかったセクションがテンプレートの記入欄のまま残ることをテスト"""
+        async def generate(prompt):
+            if "「スケジュール」" in prompt:
+                await asyncio.sleep(1)
+            return "生成された本文"
+        self.mock_service.generate_text = AsyncMock(side_effect=generate)
+        generator = ApplicationFormGenerator(
+            service=self.mock_service, parallel_sections=True, section_timeout_seconds=0.05
+        )
+        
+        result = await generator.generate_ai_enhanced(self.subsidy_info, "テストビジネス")
+        
+        self.assertIn("■申請理由：\n生成された本文", result)
+        self.assertIn("■スケジュール：\n[ここに事業の実施スケジュールを記入してください。", result)
+        self.assertIn("※このテンプレートは生成AIによって作成されました。", result)
+    
+    async def test_section_text_starting_with_error_is_kept(self):
+        """生成に成功した本文が「Error」で始まる場合も生成結果として扱うことをテスト"""
+        self.mock_service.generate_text = AsyncMock(return_value="Error率を下げる検品工程を導入する")
+        
+        result = await request_ai_sections(self.subsidy_info, "テストビジネス", self.mock_service)
+        
+        self.assertEqual(len(result), 6)
+        self.assertEqual(result["application_reason"], "Error率を下げる検品工程を導入する")
+    
+    async def test_failed_section_is_excluded(self):
+        """実行が失敗したセクションのみ結果から除くことをテスト"""
+        async def generate(prompt):
+            if "「スケジュール」" in prompt:
+                raise AgentRunError("rate limited")
+            return "生成された本文"
+        self.mock_service.generate_text = AsyncMock(side_effect=generate)
+        
+        result = await request_ai_sections(self.subsidy_info, "テストビジネス", self.mock_service)
+        
+        self.assertEqual(len(result), 5)
+        self.assertNotIn("schedule", result)
+    
+    async def test_all_sections_failed_falls_back_to_base_template(self):
+        """すべてのセクションの生成に失敗した場合は基本テンプレートを返すことをテスト"""
+        self.mock_service.generate_text = AsyncMock(side_effect=AgentRunError("failed"))
+        generator = ApplicationFormGenerator(service=self.mock_service, parallel_sections=True)
+        
+        result = await generator.generate_ai_enhanced(self.subsidy_info, "テストビジネス")
+        
+        self.assertIn("※AI拡張機能は現在利用できません", result)
+    
+    async def test_admission_rejection_cancels_other_sections(self):
+        """いずれかのセクションが混雑で拒否された場合は拒否を伝え、残りのセクションの生成を取り消すことをテスト"""
+        cancelled = []
+        
+        async def generate(prompt):
+            if "「スケジュール」" in prompt:
+                raise AdmissionRejected("bulk", "queue_full", 1)
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
+            return "生成された本文"
+        self.mock_service.generate_text = AsyncMock(side_effect=generate)
+        
+        with self.assertRaises(AdmissionRejected):
+            await request_ai_sections(self.subsidy_info, "テストビジネス", self.mock_service, max_concurrency=6)
+        await asyncio.sleep(0.05)
+        
+        self.assertEqual(len(cancelled), 5)
 
-        self.assertIn("AIコンテンツ生成エラー", str(context.exception))
\ No newline at end of file
+class TestGenerateForm(unittest.IsolatedAsyncioTestCase):
+    """申請書テンプレート生成リクエスト処理のテスト"""
+    
+    async def test_generate_form_without_business_description(self):
+        """ビジネス概要がない場合は基本テンプレートのみを返すことをテスト"""
+        generator = ApplicationFormGenerator()
+        
+        result = await generator.generate_form(ApplicationFormRequest(subsidy_info={"title": "テスト補助金"}))
+        
+        self.assertFalse(result["ai_enhanced"])
+        self.assertIn("【申請書類：テスト補助金】", result["template"])
+    
+    async def test_generate_form_coalesces_identical_requests(self):
+        """処理中の同じ内容のリクエストが1回の生成結果を共有することをテスト"""
+        mock_service = MagicMock()
+        mock_service.model = "gpt-4o"
+        
+        async def generate(prompt):
+            await asyncio.sleep(0.02)
+            return '{"application_reason": "テスト理由"}'
+        mock_service.generate_text = AsyncMock(side_effect=generate)
+        generator = ApplicationFormGenerator(service=mock_service, request_coalescer=RequestCoalescer())
+        request = ApplicationFormRequest(subsidy_info={"title": "テスト補助金"}, business_description="テストビジネス")
+        
+        results = await asyncio.gather(*[generator.generate_form(request) for _ in range(3)])
+        
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertTrue(results[0]["ai_enhanced"])
+        self.assertIn("テスト理由", results[0]["template"])
+        mock_service.generate_text.assert_awaited_once()
+    
+    async def test_generate_form_bypass_cache_does_not_join_cached_generation(self):
+        """キャッシュを使用しない指定のリクエストが、キャッシュを使用する処理中の生成に合流しないことをテスト"""
+        mock_service = MagicMock()
+        mock_service.model = "gpt-4o"
+        
+        async def generate(prompt):
+            await asyncio.sleep(0.02)
+            return '{"application_reason": "テスト理由"}'
+        mock_service.generate_text = AsyncMock(side_effect=generate)
+        cache = ResponseCache()
+        generator = ApplicationFormGenerator(
+            service=mock_service, response_cache=cache, request_coalescer=RequestCoalescer()
+        )
+        subsidy_info = {"title": "テスト補助金"}
+        
+        await asyncio.gather(
+            generator.generate_form(ApplicationFormRequest(subsidy_info=subsidy_info, business_description="テストビジネス")),
+            generator.generate_form(ApplicationFormRequest(
+                subsidy_info=subsidy_info, business_description="テストビジネス", bypass_cache=True
+            ))
+        )
+        
+        self.assertEqual(mock_service.generate_text.await_count, 2)
+    
+    async def test_generate_batch_streams_results_in_completion_order(self):
+        """一括生成がAI拡張不要の項目を先に返し、AI拡張の項目を完了順に返すことをテスト"""
+        mock_service = MagicMock()
+        mock_service.model = "gpt-4o"
+        
+        async def generate(prompt):
+            await asyncio.sleep(0.05 if "遅いビジネス" in prompt else 0.01)
+            return '{"application_reason": "テスト理由"}'
+        mock_service.generate_text = AsyncMock(side_effect=generate)
+        generator = ApplicationFormGenerator(service=mock_service, max_batch_concurrency=2)
+        requests = [
+            ApplicationFormRequest(subsidy_info={"title": "補助金A"}, business_description="遅いビジネス"),
+            ApplicationFormRequest(subsidy_info={"title": "補助金B"}),
+            ApplicationFormRequest(subsidy_info={}, business_description="テストビジネス"),
+            ApplicationFormRequest(subsidy_info={"title": "補助金D"}, business_description="速いビジネス"),
+        ]
+        
+        results = [result async for result in generator.generate_batch(requests)]
+        
+        self.assertEqual([result["index"] for result in results], [1, 2, 3, 0])
+        self.assertFalse(results[0]["ai_enhanced"])
+        self.assertEqual(results[1], {"index": 2, "error": "補助金情報が必要です"})
+        self.assertTrue(results[2]["ai_enhanced"])
+        self.assertIn("【申請書類：補助金A】", results[3]["template"])
+    
+    async def test_generate_batch_reports_item_errors(self):
+        """項目ごとのエラーが他の項目の生成を止めないことをテスト"""
+        generator = ApplicationFormGenerator(max_batch_concurrency=1)
+        requests = [
+            ApplicationFormRequest(subsidy_info={"title": "補助金A"}, business_description="テストビジネス"),
+            ApplicationFormRequest(subsidy_info={"title": "補助金B"}, business_description="テストビジネス2"),
+        ]
+        
+        with patch.object(generator, "generate_ai_enhanced", AsyncMock(side_effect=[Exception("生成エラー"), "テンプレート"])):
+            results = [result async for result in generator.generate_batch(requests)]
+        
+        self.assertEqual(results[0], {"index": 0, "error": "生成エラー"})
+        self.assertEqual(results[1], {"index": 1, "template": "テンプレート", "ai_enhanced": True})
+    
+    async def test_generate_batch_renders_inline_items_in_bulk(self):
+        """AI拡張が不要な項目をまとめて描画し、描画できない項目だけをエラーにすることをテスト"""
+        generator = ApplicationFormGenerator()
+        requests = [
+            ApplicationFormRequest(subsidy_info={"title": "補助金A", "subsidy_max_limit": 5000000}),
+            ApplicationFormRequest(subsidy_info={"title": "補助金B", "subsidy_max_limit": "不明"}),
+        ]
+        
+        results = [result async for result in generator.generate_batch(requests)]
+        
+        self.assertEqual(results[0], {
+            "index": 0,
+            "template": generate_application_text(requests[0].subsidy_info),
+            "ai_enhanced": False,
+        })
+        self.assertEqual(results[1]["index"], 1)
+        self.assertIn("error", results[1])
@@ -0,0 +1,59 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, Mock
+from services.subsidies_api import SubsidiesApiClient, SubsidiesApiError
+from tools.actions.subsidies_proxy_tool import create_subsidies_function_tool
+
+
+def make_tool_call(name, arguments):
+    tool_call = Mock()
+    tool_call.function.name = name
+    tool_call.function.arguments = json.dumps(arguments, ensure_ascii=False)
+    return tool_call
+
+
+class TestSubsidiesProxyTool(unittest.IsolatedAsyncioTestCase):
+    
+    def setUp(self):
+        self.client = Mock(spec=SubsidiesApiClient)
+        self.client.list_subsidies = AsyncMock(return_value={"result": [{"id": "S1", "title": "テスト補助金"}]})
+        self.client.get_subsidy = AsyncMock(side_effect=SubsidiesApiError("Subsidies API returned 404"))
+        self.tool = create_subsidies_function_tool(self.client)
+    
+    def test_definitions(self):
+        """一覧と詳細の関数が定義されることをテスト"""
+        definitions = {definition.function.name: definition.function for definition in self.tool.definitions}
+        
+        self.assertEqual(set(definitions), {"getSubsidiesList", "getSubsidyDetail"})
+        self.assertEqual(definitions["getSubsidiesList"].parameters["required"], [])
+        self.assertEqual(definitions["getSubsidyDetail"].parameters["required"], ["subsidy_id"])
+    
+    async def test_list_call_returns_json(self):
+        """一覧の呼び出しがクライアントの応答をJSON文字列で返すことをテスト"""
+        output = await self.tool.execute(make_tool_call("getSubsidiesList", {"keyword": "テスト", "target_area_search": "東京都"}))
+        
+        self.assertEqual(json.loads(output)["result"][0]["title"], "テスト補助金")
+        self.client.list_subsidies.assert_awaited_once_with(
+            keyword="テスト",
+            sort="created_date",
+            order="DESC",
+            acceptance="1",
+            use_purpose=None,
+            industry=None,
+            target_number_of_employees=None,
+            target_area_search="東京都",
+        )
+    
+    async def test_api_error_is_returned_to_agent(self):
+        """APIのエラーを例外ではなくエラーを含むJSONで返すことをテスト"""
+        output = await self.tool.execute(make_tool_call("getSubsidyDetail", {"subsidy_id": "unknown"}))
+        
+        self.assertEqual(json.loads(output), {"error": "Subsidies API returned 404"})
+    
+    async def test_invalid_argument_is_returned_to_agent(self):
+        """引数の値の例外も、ツールの出力が送信されるようエラーを含むJSONで返すことをテスト"""
+        self.client.list_subsidies.side_effect = ValueError("order must be ASC or DESC")
+        
+        output = await self.tool.execute(make_tool_call("getSubsidiesList", {"order": "up"}))
+        
+        self.assertEqual(json.loads(output), {"error": "order must be ASC or DESC"})
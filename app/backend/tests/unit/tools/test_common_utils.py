@@ -0,0 +1,142 @@
+import pytest
+from unittest.mock import patch
+from tools.common_utils import (
+    APPLICATION_SECTIONS,
+    APPLICATION_TEMPLATE,
+    CompiledTemplate,
+    format_currencies_ja,
+    format_currency_ja,
+    format_date_ja,
+    format_dates_ja,
+    format_subsidies_ja,
+    generate_application_text,
+    render_application_text,
+    render_application_texts,
+)
+
+SUBSIDY_INFO = {
+    "title": "テスト補助金",
+    "acceptance_start_datetime": "2024-04-01T00:00:00Z",
+    "acceptance_end_datetime": "2024-05-31T23:59:59Z",
+    "target_area_search": "全国",
+    "subsidy_max_limit": 10000000,
+    "target_number_of_employees": "300人以下",
+}
+
+def _sections_text(contents):
+    return "".join(f"\n{heading}\n{contents[key]}\n" for key, heading, _ in APPLICATION_SECTIONS)
+
+
+class TestCompiledTemplate:
+
+    def test_render_fills_slots_in_order(self):
+        """スロットに値を埋めて描画できることをテスト"""
+        template = CompiledTemplate("{{a}}-{{b}}-{{a}}!", defaults={"b": "既定"})
+
+        assert template.slots == ["a", "b", "a"]
+        assert template.render({"a": 1}) == "1-既定-1!"
+        assert template.render({"a": None, "b": ""}) == "None--None!"
+
+    def test_render_raises_for_missing_slot(self):
+        """値も既定値もないスロットがある場合にKeyErrorとなることをテスト"""
+        with pytest.raises(KeyError):
+            CompiledTemplate("{{a}}").render({})
+
+    def test_application_template_has_section_slots(self):
+        """申請書テンプレートが各セクションのスロットを持つことをテスト"""
+        assert APPLICATION_TEMPLATE.slots[-len(APPLICATION_SECTIONS):] == [key for key, _, _ in APPLICATION_SECTIONS]
+
+
+class TestRenderApplicationText:
+
+    def test_generate_application_text_output(self):
+        """基本テンプレートの出力が従来の形式と一致することをテスト"""
+        expected = (
+            "【申請書類：テスト補助金】\n\n"
+            "■基本情報\n"
+            "申請期間：2024年04月01日～2024年05月31日\n"
+            "対象地域：全国\n"
+            "補助上限額：1,000万円\n"
+            "従業員数制限：300人以下\n"
+            + _sections_text({key: placeholder for key, _, placeholder in APPLICATION_SECTIONS})
+        )
+
+        assert generate_application_text(SUBSIDY_INFO) == expected
+
+    def test_generate_application_text_without_information(self):
+        """情報がない場合の出力が従来の形式と一致することをテスト"""
+        expected = (
+            "【申請書類：不明な補助金】\n\n"
+            "■基本情報\n"
+            "申請期間：情報なし\n"
+            "対象地域：情報なし\n"
+            "補助上限額：情報なし\n"
+            + _sections_text({key: placeholder for key, _, placeholder in APPLICATION_SECTIONS})
+        )
+
+        assert generate_application_text({}) == expected
+
+    def test_render_with_sections_matches_replacing_placeholders(self):
+        """セクションを埋めた描画結果が記入欄を置き換えた結果と一致することをテスト"""
+        sections = {"application_reason": "申請理由の内容", "budget_plan": "予算計画の内容"}
+        expected = generate_application_text(SUBSIDY_INFO)
+        for key, heading, placeholder in APPLICATION_SECTIONS:
+            if key in sections:
+                expected = expected.replace(f"{heading}\n{placeholder}", f"{heading}\n{sections[key]}")
+
+        assert render_application_text(SUBSIDY_INFO, sections) == expected
+
+
+class TestBulkFormatting:
+
+    def test_format_dates_matches_scalar_function(self):
+        """まとめてフォーマットした日付が1件ずつの結果と一致することをテスト"""
+        dates = ["2024-04-01T10:00:00Z", None, "", "invalid-date", "2024-04-01T10:00:00Z", "2024-13-01T00:00:00Z"]
+
+        assert format_dates_ja(dates) == [
+            "2024年04月01日", "情報なし", "情報なし", "無効な日付", "2024年04月01日", "無効な日付"
+        ]
+        assert format_dates_ja(dates) == [format_date_ja(date) for date in dates]
+
+    def test_format_currencies_matches_scalar_function(self):
+        """まとめてフォーマットした金額が1件ずつの結果と一致することをテスト"""
+        amounts = [150000000, 5000000, 1000, 1000, 1000.0, True]
+
+        assert format_currencies_ja(amounts) == [format_currency_ja(amount) for amount in amounts]
+        assert format_currencies_ja([None]) == ["情報なし"]
+
+    def test_repeated_values_are_formatted_once(self):
+        """同じ値は1回だけフォーマットすることをテスト"""
+        dates = ["2024-04-01T10:00:00Z"] * 100 + ["2024-05-31T23:59:59Z"] * 100
+
+        with patch("tools.common_utils.format_date_ja", wraps=format_date_ja) as mock_format:
+            format_dates_ja(dates)
+
+        assert mock_format.call_count == 2
+
+    def test_format_subsidies_accepts_records_and_columns(self):
+        """補助金情報のリストと列形式の辞書のどちらも同じ結果になることをテスト"""
+        records = [SUBSIDY_INFO, {"acceptance_start_datetime": "invalid-date", "subsidy_max_limit": 500}, {}]
+        columns = {
+            "acceptance_start_datetime": [record.get("acceptance_start_datetime") for record in records],
+            "acceptance_end_datetime": [record.get("acceptance_end_datetime") for record in records],
+            "subsidy_max_limit": [record.get("subsidy_max_limit") for record in records],
+        }
+
+        formatted = format_subsidies_ja(records)
+
+        assert formatted == format_subsidies_ja(columns)
+        assert formatted["application_period"] == ["2024年04月01日～2024年05月31日", "情報なし", "情報なし"]
+        assert formatted["max_limit"] == ["1,000万円", "500円", "情報なし"]
+        assert formatted["acceptance_start"][1] == "無効な日付"
+
+    def test_format_subsidies_rejects_uneven_columns(self):
+        """列形式の辞書で値の数が異なる場合にエラーとなることをテスト"""
+        with pytest.raises(ValueError):
+            format_subsidies_ja({"acceptance_start_datetime": [None], "subsidy_max_limit": []})
+
+    def test_render_application_texts_matches_single_rendering(self):
+        """まとめて描画した申請書が1件ずつ生成した結果と一致することをテスト"""
+        subsidy_infos = [SUBSIDY_INFO, {}, {**SUBSIDY_INFO, "title": "別の補助金", "target_number_of_employees": None}]
+
+        assert render_application_texts(subsidy_infos) == [generate_application_text(info) for info in subsidy_infos]
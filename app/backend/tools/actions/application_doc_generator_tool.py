@@ -2,112 +2,314 @@
 補助金申請書類生成ツール
 """
 
-import os
 import re
 import json
+import asyncio
 import logging
-from typing import Dict, Any
-from tools.common_utils import format_currency_ja, format_date_ja, generate_application_text
-from services.assistant_manager_service import AssistantManagerService
-from azure.ai.projects import AIProjectClient
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from tools.common_utils import (
+    APPLICATION_SECTIONS,
+    format_currency_ja,
+    format_date_ja,
+    generate_application_text,
+    render_application_text,
+    render_application_texts,
+)
+from models.models import ApplicationFormRequest
+from services.admission_controller import AdmissionRejected
+from services.agent_registry import AgentRegistry
+from services.assistant_manager_service import (
+    BASIC_AGENT_INSTRUCTIONS,
+    BASIC_AGENT_NAME,
+    AssistantManagerService,
+)
+from services.metrics import metrics
+from services.request_coalescer import RequestCoalescer
+from services.response_cache import ResponseCache
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
-def request_ai_content(subsidy_info: Dict[str, Any], business_description: str) -> Dict[str, str]:
+# AIで生成する内容の説明（申請書のセクションのスロット名ごと）
+_SECTION_DESCRIPTIONS: Dict[str, str] = {
+    "application_reason": "申請理由（事業の現状と課題、補助金活用の目的）",
+    "business_plan": "事業計画の概要（実現可能性、革新性、市場性、社会的意義）",
+    "implementation_structure": "実施体制（担当者の役割や外部との連携）",
+    "schedule": "実施スケジュール（主要なマイルストーン）",
+    "budget_plan": "予算計画（主要な費目と金額）",
+    "expected_effects": "期待される効果（定量的・定性的な効果）",
+}
+
+# AIで生成する申請書のセクション（キー、テンプレートの見出し、テンプレートの記入欄、生成内容の説明）
+AI_SECTIONS: List[Tuple[str, str, str, str]] = [
+    (key, heading, placeholder, _SECTION_DESCRIPTIONS[key])
+    for key, heading, placeholder in APPLICATION_SECTIONS
+]
+
+def build_subsidy_context(subsidy_info: Dict[str, Any], business_description: str) -> str:
+    """
+    AIエージェントへのプロンプトに含める補助金情報とビジネス概要を組み立てる
+    
+    Args:
+        subsidy_info: 補助金情報の辞書
+        business_description: ビジネスの簡単な説明
+        
+    Returns:
+        プロンプト用の補助金情報とビジネス概要のテキスト
+    """
+    return f"""## 補助金情報
+- 名称: {subsidy_info.get('title', '不明')}
+- 概要: {subsidy_info.get('summary', '情報なし')}
+- 対象分野: {subsidy_info.get('target_field', '情報なし')}
+- 対象者: {subsidy_info.get('target_type', '情報なし')}
+- 補助上限額: {format_currency_ja(subsidy_info.get('subsidy_max_limit', 0)) if subsidy_info.get('subsidy_max_limit') is not None else '情報なし'}
+
+## ビジネス概要
+{business_description}"""
+
+async def request_ai_content(
+    subsidy_info: Dict[str, Any],
+    business_description: str,
+    service: Optional[AssistantManagerService],
+    response_cache: Optional[ResponseCache] = None,
+    bypass_cache: bool = False
+) -> Dict[str, str]:
     """
     Azure AI Agent Serviceを使用して申請書の内容を生成する
     
     Args:
         subsidy_info: 補助金情報の辞書
         business_description: ビジネスの簡単な説明
+        service: アプリケーションで共有するAIエージェントサービス（クライアント・エージェントを再利用する）
+        response_cache: 生成内容のキャッシュ。指定した場合は同じ内容のリクエストにエージェントを実行せずに応答する
+        bypass_cache: Trueの場合はキャッシュを参照せずに必ず生成する
         
     Returns:
         生成された申請書コンテンツを含む辞書
     
     Raises:
+        AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合
         Exception: AIサービスとの通信エラー、または応答解析エラー時
     """
     try:
-        # AIProjectClientの初期化
-        project_id = os.getenv("AZURE_AI_PROJECT_ID")
-        api_key = os.getenv("AZURE_AI_API_KEY")
-        endpoint = os.getenv("AZURE_AI_ENDPOINT")
-
-        if not all([project_id, api_key, endpoint]):
-            raise Exception("必要な環境変数が設定されていません。AZURE_AI_PROJECT_ID, AZURE_AI_API_KEY, AZURE_AI_ENDPOINTを設定してください。")
-
-        project_client = AIProjectClient(endpoint=endpoint, api_key=api_key)
-        
-        # AIエージェントサービスのインスタンスを取得
-        service = AssistantManagerService(project_client)
+        if service is None:
+            raise Exception("AIエージェントサービスが設定されていません。")
         
         # AIエージェントに送信するプロンプトを構築
+        section_list = "\n".join(
+            f"{index}. {key}: {description}"
+            for index, (key, _, _, description) in enumerate(AI_SECTIONS, start=1)
+        )
         prompt = f"""
 補助金申請書の主要セクションの内容を生成してください。以下の補助金情報とビジネス概要に基づいて、申請に適した内容を作成してください。
 
-## 補助金情報
-- 名称: {subsidy_info.get('title', '不明')}
-- 概要: {subsidy_info.get('summary', '情報なし')}
-- 対象分野: {subsidy_info.get('target_field', '情報なし')}
-- 対象者: {subsidy_info.get('target_type', '情報なし')}
-- 補助上限額: {format_currency_ja(subsidy_info.get('subsidy_max_limit', 0)) if subsidy_info.get('subsidy_max_limit') is not None else '情報なし'}
-
-## ビジネス概要
-{business_description}
+{build_subsidy_context(subsidy_info, business_description)}
 
 以下の各セクションの内容を、明確かつ説得力のある形で日本語で生成してください：
 
-1. application_reason: 申請理由（事業の現状と課題、補助金活用の目的）
-2. business_plan: 事業計画の概要（実現可能性、革新性、市場性、社会的意義）
-3. implementation_structure: 実施体制（担当者の役割や外部との連携）
-4. schedule: 実施スケジュール（主要なマイルストーン）
-5. budget_plan: 予算計画（主要な費目と金額）
-6. expected_effects: 期待される効果（定量的・定性的な効果）
+{section_list}
 
 それぞれのセクションは具体的かつ簡潔に、150字程度で記述してください。JSONフォーマットで返答してください。
         """
         
-        # AIエージェントにリクエストを送信
-        response = service.process_openapi_spec(prompt)
+        # 同じ内容のリクエストはキャッシュから返す
+        cache_key = _ai_cache_key(service, prompt, response_cache, bypass_cache)
+        if cache_key is not None:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Returning cached AI content")
+                return dict(cached)
         
-        # 応答からJSON部分を抽出して解析
-        json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-        if json_match:
-            content_json = json_match.group(1)
-            return json.loads(content_json)
+        # AIエージェントにリクエストを送信
+        with metrics.track("ai_content_request"):
+            response = await service.generate_text(prompt)
         
-        # JSON形式でない場合、テキスト全体を解析
-        try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            # JSONとして解析できない場合は、手動でパースを試みる
-            result = {}
-            sections = ["application_reason", "business_plan", "implementation_structure", 
-                       "schedule", "budget_plan", "expected_effects"]
-            
-            for section in sections:
-                pattern = rf"{section}[:：]\s*(.*?)(?=\n\n|\Z)"
-                match = re.search(pattern, response, re.DOTALL)
-                if match:
-                    result[section] = match.group(1).strip()
-                else:
-                    result[section] = f"{section}の情報は生成できませんでした。"
-            
-            return result
+        with metrics.track("ai_content_parse"):
+            result, parsed_json = parse_ai_content(response)
+        # JSONとして解析できなかった応答はキャッシュしない（実行の失敗は例外として基本テンプレートに切り替える）
+        if cache_key is not None and parsed_json:
+            response_cache.set(cache_key, dict(result))
+        return result
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"AI content generation error: {str(e)}")
         raise Exception(f"AIコンテンツ生成エラー: {str(e)}")
 
+async def request_ai_sections(
+    subsidy_info: Dict[str, Any],
+    business_description: str,
+    service: Optional[AssistantManagerService],
+    response_cache: Optional[ResponseCache] = None,
+    bypass_cache: bool = False,
+    max_concurrency: int = 3,
+    section_timeout_seconds: Optional[float] = 60
+) -> Dict[str, str]:
+    """
+    申請書の各セクションを個別のプロンプトで並行して生成する
+    
+    同時に実行するセクション数は max_concurrency までに制限する。
+    期限内に生成できなかったセクションや生成に失敗したセクションは結果に含めない。
+    
+    Args:
+        subsidy_info: 補助金情報の辞書
+        business_description: ビジネスの簡単な説明
+        service: アプリケーションで共有するAIエージェントサービス
+        response_cache: 生成内容のキャッシュ（セクション単位でキャッシュする）
+        bypass_cache: Trueの場合はキャッシュを参照せずに必ず生成する
+        max_concurrency: 同時に生成するセクション数の上限
+        section_timeout_seconds: セクションごとの生成期限（秒）。Noneの場合は期限なし
+        
+    Returns:
+        生成できたセクションのキーと内容の辞書
+    
+    Raises:
+        AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合（他のセクションの生成は取り消す）
+        Exception: AIサービスが設定されていない場合
+    """
+    if service is None:
+        raise Exception("AIコンテンツ生成エラー: AIエージェントサービスが設定されていません。")
+    
+    context = build_subsidy_context(subsidy_info, business_description)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def generate_section(key: str, heading: str, description: str) -> Optional[str]:
+        prompt = f"""
+補助金申請書の「{heading.strip('■：')}」セクションの内容を生成してください。以下の補助金情報とビジネス概要に基づいて、申請に適した内容を作成してください。
+
+{context}
+
+{description}を、明確かつ説得力のある形で日本語で、具体的かつ簡潔に150字程度で記述してください。見出しや前置きを付けず、本文のみを返答してください。
+        """
+        cache_key = _ai_cache_key(service, prompt, response_cache, bypass_cache)
+        if cache_key is not None:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        async with semaphore:
+            try:
+                with metrics.track("ai_section_request"):
+                    response = await asyncio.wait_for(
+                        service.generate_text(prompt), timeout=section_timeout_seconds
+                    )
+            except asyncio.TimeoutError:
+                logger.warning(f"AI section generation timed out: {key}")
+                return None
+            except AdmissionRejected:
+                raise
+            except Exception as e:
+                # 実行の失敗（AgentRunError）や回路が開いている場合を含め、このセクションのみ生成失敗として扱う
+                logger.error(f"AI section generation error ({key}): {str(e)}")
+                return None
+        
+        text = response.strip()
+        if not text:
+            logger.error(f"AI section generation returned empty text: {key}")
+            return None
+        if cache_key is not None:
+            response_cache.set(cache_key, text)
+        return text
+    
+    tasks = [
+        asyncio.ensure_future(generate_section(key, heading, description))
+        for key, heading, _, description in AI_SECTIONS
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # 混雑で拒否された場合やキャンセルされた場合に、残りのセクションの生成を取り消す
+        for task in tasks:
+            task.cancel()
+    return {
+        key: text
+        for (key, _, _, _), text in zip(AI_SECTIONS, results)
+        if text is not None
+    }
+
+def _ai_cache_key(
+    service: AssistantManagerService,
+    prompt: str,
+    response_cache: Optional[ResponseCache],
+    bypass_cache: bool
+) -> Optional[str]:
+    """テキスト生成エージェントへのプロンプトのキャッシュキーを返す（キャッシュしない場合はNone）"""
+    if response_cache is None or bypass_cache:
+        return None
+    config = AgentRegistry.config_key(service.model, BASIC_AGENT_NAME, BASIC_AGENT_INSTRUCTIONS)
+    return response_cache.make_key(prompt, config)
+
+def parse_ai_content(response: str) -> Tuple[Dict[str, str], bool]:
+    """
+    AIエージェントの応答から申請書の各セクションの内容を取り出す
+    
+    Args:
+        response: AIエージェントの応答テキスト
+        
+    Returns:
+        セクション名と内容の辞書、およびJSONとして解析できたかどうかのタプル
+    """
+    # 応答からJSON部分を抽出して解析
+    json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
+    if json_match:
+        content_json = json_match.group(1)
+        return json.loads(content_json), True
+    
+    # JSON形式でない場合、テキスト全体を解析
+    try:
+        return json.loads(response), True
+    except json.JSONDecodeError:
+        # JSONとして解析できない場合は、手動でパースを試みる
+        result = {}
+        sections = ["application_reason", "business_plan", "implementation_structure", 
+                   "schedule", "budget_plan", "expected_effects"]
+        
+        for section in sections:
+            pattern = rf"{section}[:：]\s*(.*?)(?=\n\n|\Z)"
+            match = re.search(pattern, response, re.DOTALL)
+            if match:
+                result[section] = match.group(1).strip()
+            else:
+                result[section] = f"{section}の情報は生成できませんでした。"
+        
+        return result, False
+
 class ApplicationFormGenerator:
     """
     補助金申請書類テキスト生成ツール
     """
     
-    def __init__(self):
-        """初期化"""
+    def __init__(
+        self,
+        service: Optional[AssistantManagerService] = None,
+        response_cache: Optional[ResponseCache] = None,
+        parallel_sections: bool = False,
+        max_section_concurrency: int = 3,
+        section_timeout_seconds: Optional[float] = 60,
+        request_coalescer: Optional[RequestCoalescer] = None,
+        max_batch_concurrency: int = 4
+    ):
+        """
+        初期化
+        
+        Args:
+            service: AI拡張に使用する共有のAIエージェントサービス（省略時はAI拡張を利用できない）
+            response_cache: AI生成内容のキャッシュ（省略時はキャッシュしない）
+            parallel_sections: Trueの場合はセクションごとに並行して生成する
+            max_section_concurrency: 並行生成時に同時に生成するセクション数の上限
+            section_timeout_seconds: 並行生成時のセクションごとの生成期限（秒）
+            request_coalescer: リクエストの合流。指定した場合は処理中の同じ内容の生成に合流する
+            max_batch_concurrency: 一括生成時に同時に生成するAI拡張テンプレート数の上限
+        """
         self.generate_application_text = generate_application_text
+        self.service = service
+        self.response_cache = response_cache
+        self.parallel_sections = parallel_sections
+        self.max_section_concurrency = max_section_concurrency
+        self.section_timeout_seconds = section_timeout_seconds
+        self.request_coalescer = request_coalescer
+        self.max_batch_concurrency = max_batch_concurrency
     
     def generate(self, subsidy_info: Dict[str, Any]) -> str:
         """
@@ -121,53 +323,175 @@ class ApplicationFormGenerator:
         """
         return self.generate_application_text(subsidy_info)
     
-    def generate_ai_enhanced(self, subsidy_info: Dict[str, Any], business_description: str) -> str:
+    async def generate_form(self, request: ApplicationFormRequest) -> Dict[str, Any]:
+        """
+        申請書テンプレート生成リクエストを処理する
+        
+        ビジネス概要がある場合はAI拡張テンプレートを生成し、ない場合は基本テンプレートのみを生成する。
+        同じ内容のAI拡張の生成が処理中の場合はその結果を共有する（キャッシュを使用しない指定のリクエストは、
+        キャッシュを使用する生成には合流しない）。
+        
+        Args:
+            request: 補助金情報とビジネス概要を含むリクエスト
+            
+        Returns:
+            生成された申請書テンプレート（"template"）とAI拡張の有無（"ai_enhanced"）を含む辞書
+        """
+        if not request.business_description:
+            return {"template": self.generate(request.subsidy_info), "ai_enhanced": False}
+        
+        def generate():
+            return self.generate_ai_enhanced(
+                request.subsidy_info,
+                request.business_description,
+                request.bypass_cache,
+                request.parallel_sections
+            )
+        
+        if self.request_coalescer is None:
+            application_text = await generate()
+        else:
+            coalesce_key = (
+                "application",
+                json.dumps(request.subsidy_info, ensure_ascii=False, sort_keys=True, default=str),
+                request.business_description,
+                request.parallel_sections,
+                request.bypass_cache
+            )
+            application_text = await self.request_coalescer.run(coalesce_key, generate)
+        return {"template": application_text, "ai_enhanced": True}
+    
+    async def generate_batch(self, requests: List[ApplicationFormRequest]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        複数の申請書テンプレートをまとめて生成し、完了した順に結果を返す
+        
+        AI拡張が不要な項目はその場で生成し、AI拡張の項目は同時実行数を max_batch_concurrency までに
+        制限して生成する。項目ごとのエラーは結果の "error" として返し、他の項目の生成は続ける。
+        
+        Args:
+            requests: 生成する申請書ごとのリクエスト
+            
+        Yields:
+            項目の位置（"index"）と、生成結果（"template"、"ai_enhanced"）またはエラー（"error"）を含む辞書
+        """
+        semaphore = asyncio.Semaphore(self.max_batch_concurrency)
+        
+        async def generate_item(index: int, request: ApplicationFormRequest) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return {"index": index, **await self.generate_form(request)}
+                except Exception as e:
+                    logger.error(f"Batch item {index} failed: {str(e)}")
+                    return {"index": index, "error": str(e)}
+        
+        # AI拡張の項目を先に開始し、その間にAI拡張が不要な項目を返す
+        tasks = [
+            asyncio.ensure_future(generate_item(index, request))
+            for index, request in enumerate(requests)
+            if request.subsidy_info and request.business_description
+        ]
+        # AI拡張が不要な項目は日付と金額をまとめてフォーマットして描画する
+        inline_indexes = [
+            index for index, request in enumerate(requests)
+            if request.subsidy_info and not request.business_description
+        ]
+        inline_templates: Dict[int, str] = {}
+        try:
+            inline_templates = dict(zip(
+                inline_indexes,
+                render_application_texts([requests[index].subsidy_info for index in inline_indexes])
+            ))
+        except Exception as e:
+            logger.warning(f"Bulk template rendering failed, rendering items one by one: {str(e)}")
+        try:
+            for index, request in enumerate(requests):
+                if not request.subsidy_info:
+                    yield {"index": index, "error": "補助金情報が必要です"}
+                elif index in inline_templates:
+                    yield {"index": index, "template": inline_templates[index], "ai_enhanced": False}
+                elif not request.business_description:
+                    try:
+                        yield {"index": index, **await self.generate_form(request)}
+                    except Exception as e:
+                        logger.error(f"Batch item {index} failed: {str(e)}")
+                        yield {"index": index, "error": str(e)}
+            
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # クライアントが切断した場合などに未完了の生成を取り消す
+            for task in tasks:
+                task.cancel()
+    
+    async def generate_ai_enhanced(
+        self,
+        subsidy_info: Dict[str, Any],
+        business_description: str,
+        bypass_cache: bool = False,
+        parallel_sections: Optional[bool] = None
+    ) -> str:
         """
         AIを活用して補助金申請書のテキストを生成する
         
+        並行生成の場合、期限内に生成できなかったセクションはテンプレートの記入欄のまま残す。
+        
         Args:
             subsidy_info: 補助金の情報を含む辞書
             business_description: ビジネスの簡単な説明
+            bypass_cache: Trueの場合はAI生成内容のキャッシュを使用しない
+            parallel_sections: セクションごとに並行して生成するか（省略時は初期化時の設定）
             
         Returns:
             AI拡張された申請書テキスト
+        
+        Raises:
+            AdmissionRejected: エージェントを実行する実行枠を取得できなかった場合（混雑時は基本テンプレートで代替しない）
         """
-        # 基本的な申請書テンプレートを生成
-        base_template = self.generate_application_text(subsidy_info)
+        if parallel_sections is None:
+            parallel_sections = self.parallel_sections
         
         try:
             # AIサービスから内容を取得
-            ai_content = request_ai_content(subsidy_info, business_description)
+            if parallel_sections:
+                ai_content = await request_ai_sections(
+                    subsidy_info,
+                    business_description,
+                    self.service,
+                    response_cache=self.response_cache,
+                    bypass_cache=bypass_cache,
+                    max_concurrency=self.max_section_concurrency,
+                    section_timeout_seconds=self.section_timeout_seconds
+                )
+                if not ai_content:
+                    raise Exception("すべてのセクションの生成に失敗しました。")
+                missing_text = None
+            else:
+                ai_content = await request_ai_content(
+                    subsidy_info,
+                    business_description,
+                    self.service,
+                    response_cache=self.response_cache,
+                    bypass_cache=bypass_cache
+                )
+                missing_text = "情報を生成できませんでした。"
             
-            # テンプレートを拡張
-            enhanced_template = base_template.replace(
-                "■申請理由：\n[ここに補助金申請の具体的な理由を記入してください。例：\n・事業の現状と課題\n・補助金を活用した事業計画の概要\n・期待される効果や成果\n・予算計画の概要]",
-                f"■申請理由：\n{ai_content.get('application_reason', '情報を生成できませんでした。')}"
-            ).replace(
-                "■事業計画概要：\n[ここに具体的な事業計画を記入してください。計画の実現可能性、革新性、市場性、社会的意義などを明確に説明すると効果的です。]",
-                f"■事業計画概要：\n{ai_content.get('business_plan', '情報を生成できませんでした。')}"
-            ).replace(
-                "■実施体制：\n[ここに事業実施体制について記入してください。担当者の役割や外部との連携体制などを含めると良いでしょう。]",
-                f"■実施体制：\n{ai_content.get('implementation_structure', '情報を生成できませんでした。')}"
-            ).replace(
-                "■スケジュール：\n[ここに事業の実施スケジュールを記入してください。マイルストーンとなる重要な日程も含めると良いでしょう。]",
-                f"■スケジュール：\n{ai_content.get('schedule', '情報を生成できませんでした。')}"
-            ).replace(
-                "■予算計画：\n[ここに予算計画の詳細を記入してください。各費目ごとの金額と、その積算根拠を明確に示すことが重要です。]",
-                f"■予算計画：\n{ai_content.get('budget_plan', '情報を生成できませんでした。')}"
-            ).replace(
-                "■期待される効果：\n[ここに補助金による事業実施で期待される具体的な効果を記入してください。定量的な指標と定性的な効果の両方を含めると良いでしょう。]",
-                f"■期待される効果：\n{ai_content.get('expected_effects', '情報を生成できませんでした。')}"
-            )
+            # 生成した内容をセクションに埋めてテンプレートを1回で描画
+            sections = {
+                key: ai_content.get(key, missing_text if missing_text is not None else placeholder)
+                for key, _, placeholder, _ in AI_SECTIONS
+            }
+            enhanced_template = render_application_text(subsidy_info, sections)
             
             # ヘッダーに生成AIを使用した旨を追加
             enhanced_template += "\n\n※このテンプレートは生成AIによって作成されました。内容を確認し、必要に応じて修正してください。"
             
             return enhanced_template
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Failed to generate AI-enhanced application: {str(e)}")
             
             # エラーメッセージを追加
-            error_template = base_template + "\n\n※AI拡張機能は現在利用できません。基本テンプレートをご利用ください。"
+            error_template = self.generate_application_text(subsidy_info) + "\n\n※AI拡張機能は現在利用できません。基本テンプレートをご利用ください。"
             return error_template
\ No newline at end of file
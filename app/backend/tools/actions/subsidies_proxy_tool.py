@@ -0,0 +1,87 @@
+"""
+補助金APIのローカル関数ツール
+
+補助金APIのOpenAPIツールの代わりに、エージェントのツール呼び出しをこのプロセス内の関数で処理する。
+上流のAPIはキャッシュを持つ SubsidiesApiClient を介して呼び出すため、会話内・ユーザー間で同じ検索を繰り返しても
+上流のAPIは1回だけ呼び出される。
+"""
+
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from azure.ai.projects.models import AsyncFunctionTool
+
+from services.subsidies_api import SubsidiesApiClient, SubsidiesApiError
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+def create_subsidies_function_tool(client: SubsidiesApiClient) -> AsyncFunctionTool:
+    """
+    補助金APIの操作（getSubsidiesList、getSubsidyDetail）を持つ関数ツールを作成する
+
+    関数のdocstringはSDKがツール定義（説明と引数の説明）の作成に使用するため、SDKの形式（:param）で記述する。
+
+    Args:
+        client: 補助金APIクライアント
+
+    Returns:
+        非同期の関数ツール
+    """
+    async def getSubsidiesList(
+        keyword: str = "補助金",
+        sort: str = "created_date",
+        order: str = "DESC",
+        acceptance: str = "1",
+        use_purpose: Optional[str] = None,
+        industry: Optional[str] = None,
+        target_number_of_employees: Optional[str] = None,
+        target_area_search: Optional[str] = None
+    ) -> str:
+        """
+        Search subsidies with conditions.
+
+        :param keyword: Search keyword (2 to 255 characters).
+        :param sort: Field name to order by: created_date, acceptance_start_datetime or acceptance_end_datetime.
+        :param order: Sort order: ASC or DESC.
+        :param acceptance: Whether to only return subsidies within the acceptance period: 0 (no) or 1 (yes).
+        :param use_purpose: 利用目的。複数の場合は「 / 」で区切る。
+        :param industry: 業種。複数の場合は「 / 」で区切る。
+        :param target_number_of_employees: 従業員数（従業員の制約なし、5名以下、20名以下、50名以下、100名以下、300名以下、900名以下、901名以上）。
+        :param target_area_search: 補助対象地域（全国、地方名または都道府県名）。
+        """
+        return await _call(client.list_subsidies(
+            keyword=keyword,
+            sort=sort,
+            order=order,
+            acceptance=acceptance,
+            use_purpose=use_purpose,
+            industry=industry,
+            target_number_of_employees=target_number_of_employees,
+            target_area_search=target_area_search,
+        ))
+
+    async def getSubsidyDetail(subsidy_id: str) -> str:
+        """
+        Get the details of a subsidy.
+
+        :param subsidy_id: Subsidy ID returned by getSubsidiesList (the "id" field).
+        """
+        return await _call(client.get_subsidy(subsidy_id))
+
+    return AsyncFunctionTool(functions={getSubsidiesList, getSubsidyDetail})
+
+async def _call(request: Any) -> str:
+    """
+    補助金APIを呼び出し、ツールの出力（JSON文字列）に変換する
+
+    失敗した場合はエージェントが対処できるよう、例外ではなくエラーを含むJSONを返す
+    （例外を送出するとツールの出力が送信されず、実行が REQUIRES_ACTION のまま期限まで待つことになる）。
+    """
+    try:
+        result: Dict[str, Any] = await request
+    except (SubsidiesApiError, ValueError) as e:
+        logger.error(f"Subsidies tool call failed: {str(e)}")
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    return json.dumps(result, ensure_ascii=False)
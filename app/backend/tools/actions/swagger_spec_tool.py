@@ -1,9 +1,11 @@
 from azure.ai.projects.models import OpenApiTool, OpenApiAnonymousAuthDetails
 
+SUBSIDIES_TOOL_NAME = "subsidies_api"
+
 def create_subsidies_tool(openapi_spec) -> OpenApiTool:
     auth = OpenApiAnonymousAuthDetails()
     return OpenApiTool(
-        name="subsidies_api",
+        name=SUBSIDIES_TOOL_NAME,
         description="API for accessing subsidy information",
         spec=openapi_spec,
         auth=auth
@@ -1,7 +1,105 @@
 """共通ユーティリティ関数モジュール"""
 
 import datetime
-from typing import Optional, Dict, Any
+import re
+from typing import Optional, Dict, Any, Callable, Iterable, List, Mapping, Sequence, Tuple, Union
+
+# 申請書の記入セクション（スロット名、見出し、記入欄のテキスト）
+APPLICATION_SECTIONS: List[Tuple[str, str, str]] = [
+    (
+        "application_reason",
+        "■申請理由：",
+        "[ここに補助金申請の具体的な理由を記入してください。例：\n・事業の現状と課題\n・補助金を活用した事業計画の概要\n・期待される効果や成果\n・予算計画の概要]",
+    ),
+    (
+        "business_plan",
+        "■事業計画概要：",
+        "[ここに具体的な事業計画を記入してください。計画の実現可能性、革新性、市場性、社会的意義などを明確に説明すると効果的です。]",
+    ),
+    (
+        "implementation_structure",
+        "■実施体制：",
+        "[ここに事業実施体制について記入してください。担当者の役割や外部との連携体制などを含めると良いでしょう。]",
+    ),
+    (
+        "schedule",
+        "■スケジュール：",
+        "[ここに事業の実施スケジュールを記入してください。マイルストーンとなる重要な日程も含めると良いでしょう。]",
+    ),
+    (
+        "budget_plan",
+        "■予算計画：",
+        "[ここに予算計画の詳細を記入してください。各費目ごとの金額と、その積算根拠を明確に示すことが重要です。]",
+    ),
+    (
+        "expected_effects",
+        "■期待される効果：",
+        "[ここに補助金による事業実施で期待される具体的な効果を記入してください。定量的な指標と定性的な効果の両方を含めると良いでしょう。]",
+    ),
+]
+
+# テンプレートのスロット（{{name}}）
+_SLOT_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+class CompiledTemplate:
+    """
+    名前付きスロットを持つ事前コンパイル済みのテンプレート
+    
+    テンプレートは初期化時に固定文字列とスロットの列に分解しておき、描画時は値を埋めながら
+    1回の走査で1つのバッファに連結する。
+    """
+    
+    def __init__(self, source: str, defaults: Optional[Dict[str, str]] = None):
+        """
+        初期化
+        
+        Args:
+            source: {{name}} 形式のスロットを含むテンプレート文字列
+            defaults: 値が指定されなかったスロットに使用する既定値
+        """
+        parts = _SLOT_PATTERN.split(source)
+        self._literals: List[str] = parts[0::2]
+        self._slots: List[str] = parts[1::2]
+        self.defaults: Dict[str, str] = dict(defaults or {})
+    
+    @property
+    def slots(self) -> List[str]:
+        """テンプレートに含まれるスロット名の一覧"""
+        return list(self._slots)
+    
+    def render(self, values: Dict[str, Any]) -> str:
+        """
+        スロットに値を埋めてテンプレートを描画する
+        
+        Args:
+            values: スロット名と値の辞書（値は文字列に変換して埋め込む。キーがないスロットは既定値を使用する）
+            
+        Returns:
+            描画されたテキスト
+            
+        Raises:
+            KeyError: 値も既定値もないスロットがある場合
+        """
+        buffer = [self._literals[0]]
+        defaults = self.defaults
+        for slot, literal in zip(self._slots, self._literals[1:]):
+            value = values[slot] if slot in values else defaults[slot]
+            buffer.append(str(value))
+            buffer.append(literal)
+        return "".join(buffer)
+
+# 申請書テンプレート（記入セクションは既定値として記入欄のテキストを持つ）
+APPLICATION_TEMPLATE = CompiledTemplate(
+    "【申請書類：{{title}}】\n"
+    "\n"
+    "■基本情報\n"
+    "申請期間：{{application_period}}\n"
+    "対象地域：{{target_area}}\n"
+    "補助上限額：{{max_limit}}\n"
+    "{{employee_limit_line}}"
+    + "".join(f"\n{heading}\n{{{{{key}}}}}\n" for key, heading, _ in APPLICATION_SECTIONS),
+    defaults={key: placeholder for key, _, placeholder in APPLICATION_SECTIONS}
+)
 
 def format_currency_ja(amount: int) -> str:
     """
@@ -43,77 +141,177 @@ def format_date_ja(date_str: Optional[str]) -> str:
     except (ValueError, TypeError):
         return "無効な日付"
 
-def generate_application_text(subsidy_info: Dict[str, Any]) -> str:
+def format_currencies_ja(amounts: Iterable[Optional[int]]) -> List[str]:
     """
-    補助金情報から申請書用のテキストを生成する
+    複数の金額をまとめて日本語表記にフォーマットする
+    
+    同じ金額は1回だけフォーマットする。None は「情報なし」とし、それ以外は format_currency_ja と同じ結果になる。
     
     Args:
-        subsidy_info: 補助金の情報を含む辞書
+        amounts: 数値（円）の列
         
     Returns:
-        申請書用のテキスト
+        フォーマットされた金額文字列のリスト
     """
-    # タイトル
-    title = subsidy_info.get("title", "不明な補助金")
-    
-    # 申請期間の処理
-    start_date = format_date_ja(subsidy_info.get("acceptance_start_datetime"))
-    end_date = format_date_ja(subsidy_info.get("acceptance_end_datetime"))
+    return _map_memoized(_format_currency_or_missing, amounts)
+
+def format_dates_ja(date_strs: Iterable[Optional[str]]) -> List[str]:
+    """
+    複数のISO形式の日付文字列をまとめて「YYYY年MM月DD日」形式にフォーマットする
     
-    if start_date != "情報なし" and end_date != "情報なし" and start_date != "無効な日付" and end_date != "無効な日付":
-        application_period = f"{start_date}～{end_date}"
-    else:
-        application_period = "情報なし"
+    同じ日付文字列は1回だけ解析する。結果は format_date_ja と同じになる。
     
-    # 対象地域
-    target_area = subsidy_info.get("target_area_search", "情報なし")
+    Args:
+        date_strs: ISO形式の日付文字列の列
+        
+    Returns:
+        日本語形式の日付文字列のリスト
+    """
+    return _map_memoized(format_date_ja, date_strs)
+
+def format_subsidies_ja(
+    records: Union[Sequence[Dict[str, Any]], Mapping[str, Sequence[Any]]]
+) -> Dict[str, List[str]]:
+    """
+    複数の補助金情報の日付と金額をまとめてフォーマットする
     
-    # 補助上限額
-    max_limit = subsidy_info.get("subsidy_max_limit")
-    if max_limit is not None:
-        max_limit_str = format_currency_ja(max_limit)
+    Args:
+        records: 補助金情報の辞書のリスト、または項目名ごとに値を並べた列形式の辞書
+            （acceptance_start_datetime、acceptance_end_datetime、subsidy_max_limit を使用する）
+        
+    Returns:
+        acceptance_start（受付開始日）、acceptance_end（受付終了日）、application_period（申請期間）、
+        max_limit（補助上限額）ごとに、補助金情報の順にフォーマット結果を並べた辞書
+        
+    Raises:
+        ValueError: 列形式の辞書で項目ごとの値の数が異なる場合
+    """
+    if isinstance(records, Mapping):
+        lengths = {len(column) for column in records.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns must have the same length: {sorted(lengths)}")
+        size = lengths.pop() if lengths else 0
+        empty = [None] * size
+        starts = records.get("acceptance_start_datetime", empty)
+        ends = records.get("acceptance_end_datetime", empty)
+        limits = records.get("subsidy_max_limit", empty)
     else:
-        max_limit_str = "情報なし"
+        starts = [record.get("acceptance_start_datetime") for record in records]
+        ends = [record.get("acceptance_end_datetime") for record in records]
+        limits = [record.get("subsidy_max_limit") for record in records]
     
-    # 従業員数制限
-    employee_limit = subsidy_info.get("target_number_of_employees", "情報なし")
-    
-    # テキスト生成
-    application_text = f"""【申請書類：{title}】
+    start_dates = format_dates_ja(starts)
+    end_dates = format_dates_ja(ends)
+    return {
+        "acceptance_start": start_dates,
+        "acceptance_end": end_dates,
+        "application_period": [
+            _application_period(start_date, end_date) for start_date, end_date in zip(start_dates, end_dates)
+        ],
+        "max_limit": format_currencies_ja(limits),
+    }
 
-■基本情報
-申請期間：{application_period}
-対象地域：{target_area}
-補助上限額：{max_limit_str}
-"""
+def generate_application_text(subsidy_info: Dict[str, Any]) -> str:
+    """
+    補助金情報から申請書用のテキストを生成する
+    
+    Args:
+        subsidy_info: 補助金の情報を含む辞書
+        
+    Returns:
+        申請書用のテキスト
+    """
+    return render_application_text(subsidy_info)
 
-    # 従業員数制限があれば追加
-    if employee_limit != "情報なし":
-        application_text += f"従業員数制限：{employee_limit}\n"
+def render_application_text(subsidy_info: Dict[str, Any], sections: Optional[Dict[str, str]] = None) -> str:
+    """
+    補助金情報と記入セクションの内容から申請書用のテキストを描画する
     
-    # 申請理由のテンプレート
-    application_text += """
-■申請理由：
-[ここに補助金申請の具体的な理由を記入してください。例：
-・事業の現状と課題
-・補助金を活用した事業計画の概要
-・期待される効果や成果
-・予算計画の概要]
+    Args:
+        subsidy_info: 補助金の情報を含む辞書
+        sections: セクション名（APPLICATION_SECTIONS のスロット名）と内容の辞書。
+            指定されなかったセクションは記入欄のテキストになる
+        
+    Returns:
+        申請書用のテキスト
+    """
+    start_date = format_date_ja(subsidy_info.get("acceptance_start_datetime"))
+    end_date = format_date_ja(subsidy_info.get("acceptance_end_datetime"))
+    return _render_application(
+        subsidy_info,
+        _application_period(start_date, end_date),
+        _format_currency_or_missing(subsidy_info.get("subsidy_max_limit")),
+        sections
+    )
 
-■事業計画概要：
-[ここに具体的な事業計画を記入してください。計画の実現可能性、革新性、市場性、社会的意義などを明確に説明すると効果的です。]
+def render_application_texts(subsidy_infos: Sequence[Dict[str, Any]]) -> List[str]:
+    """
+    複数の補助金情報から申請書用のテキストをまとめて描画する
+    
+    日付と金額は format_subsidies_ja でまとめてフォーマットする。結果は generate_application_text と同じになる。
+    
+    Args:
+        subsidy_infos: 補助金の情報を含む辞書のリスト
+        
+    Returns:
+        補助金情報の順に並べた申請書用のテキストのリスト
+    """
+    formatted = format_subsidies_ja(subsidy_infos)
+    return [
+        _render_application(subsidy_info, application_period, max_limit)
+        for subsidy_info, application_period, max_limit in zip(
+            subsidy_infos, formatted["application_period"], formatted["max_limit"]
+        )
+    ]
 
-■実施体制：
-[ここに事業実施体制について記入してください。担当者の役割や外部との連携体制などを含めると良いでしょう。]
+def _application_period(start_date: str, end_date: str) -> str:
+    """フォーマット済みの受付開始日と終了日から申請期間の表記を作成する"""
+    if start_date != "情報なし" and end_date != "情報なし" and start_date != "無効な日付" and end_date != "無効な日付":
+        return f"{start_date}～{end_date}"
+    return "情報なし"
 
-■スケジュール：
-[ここに事業の実施スケジュールを記入してください。マイルストーンとなる重要な日程も含めると良いでしょう。]
+def _format_currency_or_missing(amount: Optional[int]) -> str:
+    """金額をフォーマットする（None の場合は「情報なし」）"""
+    if amount is None:
+        return "情報なし"
+    return format_currency_ja(amount)
 
-■予算計画：
-[ここに予算計画の詳細を記入してください。各費目ごとの金額と、その積算根拠を明確に示すことが重要です。]
+def _map_memoized(func: Callable[[Any], str], values: Iterable[Any]) -> List[str]:
+    """
+    値の列に関数を適用する（同じ値は1回だけ計算する）
+    
+    1 と 1.0 のように等価でも書式が異なる値を区別するため、型と値の組をキーにする。
+    ハッシュ化できない値は毎回計算する。
+    """
+    cache: Dict[Tuple[type, Any], str] = {}
+    results: List[str] = []
+    for value in values:
+        key = (type(value), value)
+        try:
+            result = cache.get(key)
+        except TypeError:
+            results.append(func(value))
+            continue
+        if result is None:
+            result = cache[key] = func(value)
+        results.append(result)
+    return results
 
-■期待される効果：
-[ここに補助金による事業実施で期待される具体的な効果を記入してください。定量的な指標と定性的な効果の両方を含めると良いでしょう。]
-"""
+def _render_application(
+    subsidy_info: Dict[str, Any],
+    application_period: str,
+    max_limit: str,
+    sections: Optional[Dict[str, str]] = None
+) -> str:
+    """フォーマット済みの申請期間と補助上限額を使って申請書テンプレートを描画する"""
+    # 従業員数制限があれば追加
+    employee_limit = subsidy_info.get("target_number_of_employees", "情報なし")
+    employee_limit_line = f"従業員数制限：{employee_limit}\n" if employee_limit != "情報なし" else ""
     
-    return application_text
\ No newline at end of file
+    values: Dict[str, Any] = dict(sections or {})
+    values["title"] = subsidy_info.get("title", "不明な補助金")
+    values["application_period"] = application_period
+    values["target_area"] = subsidy_info.get("target_area_search", "情報なし")
+    values["max_limit"] = max_limit
+    values["employee_limit_line"] = employee_limit_line
+    return APPLICATION_TEMPLATE.render(values)